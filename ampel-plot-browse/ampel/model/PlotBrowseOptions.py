@@ -4,7 +4,7 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                19.11.2021
-# Last Modified Date:  12.04.2022
+# Last Modified Date:  17.10.2026
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
 from ampel.base.AmpelFlexModel import AmpelFlexModel
@@ -16,3 +16,5 @@ class PlotBrowseOptions(AmpelFlexModel):
 	stack: int = 20
 	scale: float = 1.0
 	png: None | int = None
+	#: write plots as separate files referenced by a light html page (see SVGCollection.write_html)
+	external: bool = False
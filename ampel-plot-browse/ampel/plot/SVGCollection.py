@@ -4,16 +4,21 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                13.06.2019
-# Last Modified Date:  02.01.2023
+# Last Modified Date:  17.10.2026
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-import pkg_resources # type: ignore[import]
-from typing import Any
-from multiprocessing import Pool
+import io, os, re, pkg_resources # type: ignore[import]
+from urllib.parse import quote
+from typing import Any, Literal, TextIO
+from contextlib import nullcontext
+from multiprocessing import get_context
+from collections import defaultdict
+from collections.abc import Iterable
+from ampel.types import StockId, Tag
 from ampel.plot.SVGPlot import SVGPlot
 from ampel.content.SVGRecord import SVGRecord
-from ampel.plot.util.compression import decompress_svg_dict
-from ampel.plot.util.transform import svg_to_png_html
+from ampel.plot.util.transform import svg_to_png_html, svg_to_png_file
+from ampel.plot.util.tags import TagSchema, compile_tag_filter
 
 
 def _load_html() -> str:
@@ -27,49 +32,139 @@ def _load_html() -> str:
 
 
 base_html = _load_html()
+_unsafe_chars = re.compile(r'[^\w.-]')
+
+# Png conversions run in spawned processes: forking a process in which libvips
+# is initialized (thread pools, locks) can deadlock the child processes
+_png_pool = get_context('spawn').Pool
+
+# Plots written per chunk by write_html(asset_dir=...) (per cpu for png conversions)
+asset_chunk_size = 16
 
 class SVGCollection:
+	"""
+	Plots are indexed by tag, stock and file name as they are added,
+	tag queries (see get_svgs and select) are answered using these indexes.
+	"""
 
 	def __init__(self, title: None | str = None) -> None:
 		""" :param title: collection title """
 		self._svgs: list[SVGPlot] = []
 		self._col_title = title
+		self._tag_index: defaultdict[Tag, list[int]] = defaultdict(list) # tag -> plot positions
+		self._stock_index: defaultdict[StockId, list[SVGPlot]] = defaultdict(list)
+		self._name_index: dict[str, SVGPlot] = {}
 
 
-	def add_svg_plot(self, svgp: SVGPlot) -> None:
+	def add_svg_plot(self, svgp: SVGPlot, stock: None | StockId = None) -> None:
+		""" :param stock: stock the plot belongs to (enables get_svgs(stock=...)) """
 
 		if not isinstance(svgp, SVGPlot):
 			raise ValueError("Instance of ampel.plot.SVGPlot expected")
 
-		self._svgs.append(svgp)
+		self._index(svgp, stock)
 
 
-	def add_svg_dict(self, svgd: SVGRecord, title_left_padding: int = 0) -> None:
-		self._svgs.append(
+	def add_svg_dict(self, svgd: SVGRecord, title_left_padding: int = 0, stock: None | StockId = None) -> None:
+		self._index(
 			SVGPlot(
 				content = svgd,
 				title_left_padding = title_left_padding
-			)
+			),
+			stock
 		)
 
 
+	def _index(self, svgp: SVGPlot, stock: None | StockId) -> None:
+
+		pos = len(self._svgs)
+		self._svgs.append(svgp)
+
+		for tag in svgp._tag_set:
+			self._tag_index[tag].append(pos)
+
+		if stock is not None:
+			self._stock_index[stock].append(svgp)
+
+		self._name_index[svgp.get_file_name()] = svgp
+
+
 	def add_raw_db_dict(self, svgd: SVGRecord) -> None:
-		""" :param svgd: raw svg dict loaded from DB """
-		self.add_svg_dict(
-			decompress_svg_dict(svgd)
-		)
+		""" :param svgd: raw svg dict loaded from DB (decompressed on first access) """
+		self.add_svg_dict(svgd)
 
 
-	def get_svgs(self, tag: None | str = None, tags: None | list[str] = None) -> list[SVGPlot]:
+	def get_svgs(self,
+		tag: None | str = None,
+		tags: None | list[str] = None,
+		plot_tag: None | dict[Literal['with', 'without'], TagSchema] = None,
+		stock: None | StockId = None
+	) -> list[SVGPlot]:
+		"""
+		:param tag: plots with the provided tag
+		:param tags: plots with all the provided tags
+		:param plot_tag: plots matching the provided criteria (same syntax as SVGQuery parameter plot_tag)
+		:param stock: plots added with the provided stock id
+		"""
+
+		if stock is not None:
+			return list(self._stock_index.get(stock, []))
 
 		if tag:
-			return [svg for svg in self._svgs if svg.has_tag(tag)]
+			return [self._svgs[i] for i in self._tag_index.get(tag, [])]
+
 		if tags:
-			return [svg for svg in self._svgs if svg.has_tags(tags)]
+			return self.select(all_of=tags)
+
+		if plot_tag:
+			tag_filter = compile_tag_filter(plot_tag.get('with'), plot_tag.get('without'))
+			return [svg for svg in self._svgs if svg.match_tags(tag_filter)] # type: ignore[arg-type]
 
 		return self._svgs
 
 
+	def get_svg(self, name: str) -> None | SVGPlot:
+		""" :returns: the plot with the provided file name (the last one added if not unique) """
+		return self._name_index.get(name)
+
+
+	def get_stocks(self) -> list[StockId]:
+		return list(self._stock_index)
+
+
+	def select(self,
+		all_of: None | Iterable[Tag] = None,
+		any_of: None | Iterable[Tag] = None,
+		none_of: None | Iterable[Tag] = None
+	) -> list[SVGPlot]:
+		"""
+		Set-algebra query answered using the tag index (plots are returned in insertion order)
+		:param all_of: plots with all of the provided tags
+		:param any_of: plots with at least one of the provided tags
+		:param none_of: plots with none of the provided tags
+		"""
+
+		pos: None | set[int] = None
+
+		if all_of is not None:
+			# Start from the shortest posting list
+			postings = sorted((self._tag_index.get(t, []) for t in all_of), key=len)
+			pos = set(postings[0]).intersection(*postings[1:]) if postings else None
+
+		if any_of is not None:
+			s = set().union(*(self._tag_index.get(t, []) for t in any_of))
+			pos = s if pos is None else pos & s
+
+		if none_of is not None:
+			s = set().union(*(self._tag_index.get(t, []) for t in none_of))
+			pos = (set(range(len(self._svgs))) if pos is None else pos) - s
+
+		if pos is None:
+			return list(self._svgs)
+
+		return [self._svgs[i] for i in sorted(pos)]
+
+
 	def _repr_html_(self,
 		scale: float = 1.0,
 		show_col_title: bool = True,
@@ -85,9 +180,38 @@ class SVGCollection:
 		"""
 		:param scale: if None, native scaling is used
 		"""
+		out = io.StringIO()
+		self.write_html(
+			out, scale, show_col_title, title_prefix, hide_if_empty, flexbox_wrap,
+			full_html, png_convert, run_id, job_schema, db_name
+		)
+		return out.getvalue()
+
+
+	def write_html(self,
+		out: TextIO,
+		scale: float = 1.0,
+		show_col_title: bool = True,
+		title_prefix: None | str = None,
+		hide_if_empty: bool = True,
+		flexbox_wrap: bool = True,
+		full_html: bool = True,
+		png_convert: None | int = None,
+		run_id: None | int | list[int] = None,
+		job_schema: None | dict[str, Any] = None,
+		db_name: None | str = None,
+		asset_dir: None | str = None
+	) -> None:
+		"""
+		Writes the html page plot by plot into the provided text stream (file, StringIO, ...)
+		:param asset_dir: if provided, each plot is written as separate file (svg or png) into this
+		directory and the page references the files using lazily loaded img tags (light page).
+		The directory must be located next to the html file (relative urls are used).
+		:param **kwargs: see _repr_html_ arguments for details
+		"""
 
 		if hide_if_empty and not self._svgs:
-			return ""
+			return
 
 		html = base_html if full_html else ""
 		# html += '<hr style="width:100%; border: 2px solid;"/>'
@@ -126,13 +250,17 @@ class SVGCollection:
 				flex-wrap: wrap; \
 				justify-content: center">'
 
-		if png_convert and len(self._svgs) > 1:
+		out.write(html)
+
+		if asset_dir:
+			self._write_assets(asset_dir, scale, title_prefix, png_convert, out)
+		elif png_convert and len(self._svgs) > 1:
 
-			with Pool() as pool:
+			with _png_pool() as pool:
 				futures = [
 					pool.apply_async(
 						svg_to_png_html,
-						(svg._record['svg'], png_convert, scale)
+						(svg.get_svg(), png_convert, scale)
 					)
 					for svg in self._svgs
 				]
@@ -141,20 +269,74 @@ class SVGCollection:
 						svg._pngd = {}
 					svg._pngd[(scale, png_convert)] = f.get() # type: ignore
 
-		for svg in self._svgs:
-			html += svg._repr_html_(
-				scale = scale,
-				title_prefix = title_prefix,
-				png_convert = png_convert
-			)
+		if not asset_dir:
+			for svg in self._svgs:
+				svg.write_html(
+					out,
+					scale = scale,
+					title_prefix = title_prefix,
+					png_convert = png_convert
+				)
 
 		if flexbox_wrap:
-			html += "</div>"
+			out.write("</div>")
 
 		if full_html:
-			html += "</body><html>"
+			out.write("</body><html>")
+
+
+	def _write_assets(self,
+		asset_dir: str,
+		scale: float,
+		title_prefix: None | str,
+		png_convert: None | int,
+		out: TextIO
+	) -> None:
+		"""
+		Plots are processed in chunks (png conversions are executed in parallel):
+		each svg is decompressed once and at most one chunk of svgs is held by the process pool.
+		"""
+
+		os.makedirs(asset_dir, exist_ok=True)
+		ext = '.png' if png_convert else '.svg'
+		prefix = os.path.basename(os.path.normpath(asset_dir)) + '/'
+		chunk = asset_chunk_size * (os.cpu_count() or 1) if png_convert else asset_chunk_size
+
+		with (_png_pool() if png_convert else nullcontext()) as pool:
+
+			for start in range(0, len(self._svgs), chunk):
 
-		return html
+				svgs = self._svgs[start:start + chunk]
+				# Unique, url safe file names (plots of different stocks often share names)
+				names = [
+					f"{i}_{_unsafe_chars.sub('_', svg.get_file_name().removesuffix('.svg'))}{ext}"
+					for i, svg in enumerate(svgs, start)
+				]
+
+				sizes: list[None | tuple[int, int]]
+				if pool:
+					# svg_to_png_file returns the dimensions of the rendered png
+					sizes = [
+						r.get() for r in [
+							pool.apply_async(
+								svg_to_png_file,
+								(svg.get_svg(), os.path.join(asset_dir, name), png_convert, scale)
+							)
+							for svg, name in zip(svgs, names)
+						]
+					]
+				else:
+					sizes = [svg.write_file(os.path.join(asset_dir, name), scale) for svg, name in zip(svgs, names)]
+
+				for svg, name, size in zip(svgs, names, sizes):
+					svg.write_html(
+						out,
+						scale = scale,
+						title_prefix = title_prefix,
+						png_convert = png_convert,
+						src = quote(prefix + name),
+						src_size = size
+					)
 
 
 	def show_html(self, **kwargs):
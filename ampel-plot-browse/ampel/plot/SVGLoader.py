@@ -4,12 +4,16 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                13.06.2019
-# Last Modified Date:  23.12.2022
+# Last Modified Date:  17.10.2026
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
 from bson import ObjectId # type: ignore[import]
-from typing import TYPE_CHECKING
-from collections.abc import Sequence
+from bson.codec_options import CodecOptions # type: ignore[import]
+from bson.raw_bson import RawBSONDocument # type: ignore[import]
+from pymongo.collection import Collection # type: ignore[import]
+from pymongo.database import Database # type: ignore[import]
+from typing import TYPE_CHECKING, Any
+from collections.abc import Sequence, Iterable, Generator
 from collections import defaultdict
 from string import digits
 
@@ -20,11 +24,13 @@ from ampel.log.AmpelLogger import AmpelLogger
 from ampel.plot.SVGQuery import SVGQuery
 from ampel.plot.T2SVGQuery import T2SVGQuery
 from ampel.plot.SVGCollection import SVGCollection
-from ampel.plot.util.load import _check_side_load
+from ampel.plot.SVGPlot import SVGPlot
+from ampel.plot.util.load import side_load
+from ampel.plot.util.concurrency import iter_ordered
+from ampel.plot.util.compression import use_db_dicts
+from ampel.plot.util.tags import tag_set
+from ampel.plot.util.raw import decode_pruned, decode_document
 from ampel.util.recursion import walk_and_process_dict
-from ampel.model.operator.AnyOf import AnyOf
-from ampel.model.operator.AllOf import AllOf
-from ampel.model.operator.OneOf import OneOf
 
 if TYPE_CHECKING:
 	from ampel.plot.SVGBrowser import SVGBrowser
@@ -69,19 +75,58 @@ class SVGLoader:
 		last_body: bool = False,
 		enforce_base_path: bool = False,
 		limit: int = 0,
-		latest_doc: bool = False
+		latest_doc: bool = False,
+		projection: bool = True,
+		side_load_batch: int = 1000,
+		side_load_threads: int = 4,
+		query_threads: int = 4,
+		prefetch: int = 1000,
+		page_size: int = 0,
+		resume_token: None | str = None,
+		raw: bool = True
 	) -> None:
+		"""
+		:param last_body: only consider the last element of bodies (when bodies are lists)
+		:param projection: retrieve only the query path of matched documents (see SVGQuery.get_projection),
+		body elements are filtered server-side if last_body is set.
+		Plots located outside the query path are then ignored.
+		:param side_load_batch: max number of plots (saved in the plot collection) retrieved per query.
+		Side-loads are deferred and coalesced across documents (see iter_plots).
+		:param side_load_threads: number of side-load queries executed concurrently
+		:param query_threads: number of queries (t0, t1, ...) executed concurrently
+		:param prefetch: max number of documents buffered per query
+		:param page_size: max number of documents processed by iter_plots (keyset pagination:
+		documents are sorted by _id and pages are resumed using tokens, see next_token and get_page_token).
+		Parameters limit and sort_by_stock are ignored if set.
+		:param resume_token: token marking the end of the previous page (see next_token)
+		:param raw: retrieve raw BSON documents and decode only the plots they contain
+		(see ampel.plot.util.raw), compressed svgs are then memoryviews of the raw documents
+		"""
 		self._db = db
 		self.logger: AmpelLogger = logger or AmpelLogger.get_logger()
 		self.limit = limit
 		self.last_body = last_body
 		self.latest_doc = latest_doc
 		self.enforce_base_path = enforce_base_path
+		self.projection = projection
+		self.side_load_batch = side_load_batch
+		self.side_load_threads = side_load_threads
+		self.query_threads = query_threads
+		self.prefetch = prefetch
+		self.page_size = page_size
+		self.resume_token = resume_token
+		self.raw = raw
+		#: Token of the next page, set by iter_plots when the current page is complete
+		#: (None if no documents are left)
+		self.next_token: None | str = None
+		self._matched: list[tuple[StockId, SVGRecord]] = [] # populated by _load_plots
+		self._col_names: dict[str, set[str]] = {}
 		self._queries: list[SVGQuery] = []
 		self._plots: dict[StockId, SVGCollection] = defaultdict(SVGCollection)
 		self._debug = self.logger and self.logger.verbose > 1
 		self._plot_col = self._db.get_collection('plot', mode='r')
-		
+		use_db_dicts(self._plot_col.database.get_collection('plotdict'))
+
 		if queries:
 			for q in queries:
 				self.add_query(q)
@@ -98,93 +143,287 @@ class SVGLoader:
 
 
 	def run(self) -> "SVGLoader":
+		""" Loads all matched plots into memory (see iter_plots for a streaming alternative) """
+
+		for stock, svg in self.iter_plots():
+			self._plots[stock].add_svg_plot(svg, stock)
+
+		return self
+
+
+	def iter_plots(self, sort_by_stock: bool = False) -> Generator[tuple[StockId, SVGPlot], None, None]:
+		"""
+		Yields plots as the DB cursors advance (memory usage is bounded).
+		Queries are executed concurrently (see query_threads), documents are processed in query order.
+		Plots referencing the plot collection are buffered and side-loaded using batches
+		of side_load_batch * side_load_threads plots, the yield order matches the cursor order.
+		:param sort_by_stock: sort documents by stock id so that plots of a given stock are yielded consecutively
+		(ignored in page mode: at most page_size documents sorted by _id are processed, see next_token)
+		:returns: (stock, plot) tuples, stock is None for plots retrieved from the plot collection
+		"""
 
 		i = 0
+		prev_k = None
+		buffer: list[tuple[StockId, SVGRecord]] = []
+		side_loads: list[SVGRecord] = []
+		self.next_token = None
+
+		if self.page_size:
+			start, after = _parse_token(self.resume_token)
+			its = [
+				self._iter_docs(q, after=after if k == start else None) if k >= start else iter(())
+				for k, q in enumerate(self._queries)
+			]
+		else:
+			its = [self._iter_docs(q, sort_by_stock) for q in self._queries]
+
+		token = None
+		for k, el in iter_ordered(its, threads=self.query_threads, prefetch=self.prefetch):
+
+			if self.page_size and i >= self.page_size:
+				# Look-ahead document (queries retrieve page_size + 1 documents): more pages available
+				self.next_token = token
+				break
 
-		for q in self._queries:
+			if k != prev_k:
+				if prev_k is not None and self.limit and self.limit > i and not self.page_size:
+					break
+				prev_k = k
+				q = self._queries[k]
 
-			mdb = self._db.get_collection(q.col, mode='r').database
-			if q.col not in mdb.list_collection_names():
+			i += 1
+			if self._debug:
+				self.logger.debug(f"Parsing {el['_id']}")
+
+			if q.col == "plot":
+				self._matched.append((None, el)) # type: ignore[arg-type]
+			elif not el.get('body'):
 				if self._debug:
-					self.logger.debug(
-						f"Skipping non-existent collection '{q.col}' (db '{mdb._Database__name}')"
-					)
+					self.logger.debug(" Skipping doc: empty body")
+			else:
+				self._walk_body(q, el)
+
+			for stock_plot in self._matched:
+				if isinstance(stock_plot[1]['svg'], ObjectId):
+					side_loads.append(stock_plot[1])
+				buffer.append(stock_plot)
+			self._matched.clear()
+
+			if not side_loads:
+				for stock, p in buffer:
+					yield stock, SVGPlot(p)
+				buffer.clear()
+			elif len(side_loads) >= self.side_load_batch * self.side_load_threads:
+				yield from self._flush(buffer, side_loads)
+
+			if self.page_size:
+				token = f"{k}:{el['_id']}"
+
+		yield from self._flush(buffer, side_loads)
+
+
+	def get_page_token(self, page: int) -> None | str:
+		"""
+		:param page: page number (starting at 1), see parameter page_size
+		:returns: the token of the provided page (for parameter resume_token), None if the page is empty.
+		Only the _id of the documents of the previous pages are retrieved,
+		tokens printed at the end of a page (see next_token) avoid even that.
+		"""
+
+		if page < 2:
+			return self.resume_token
+
+		start, after = _parse_token(self.resume_token)
+		remaining = self.page_size * (page - 1)
+		last = None
+
+		for k, q in enumerate(self._queries):
+
+			if k < start:
+				continue
+
+			col = self._db.get_collection(q.col, mode='r')
+			if q.col not in self._get_col_names(col.database):
 				continue
 
+			# One more document is retrieved to make sure the requested page is not empty
+			for el in col.find(_after(q._query, after if k == start else None), {'_id': 1}) \
+				.sort('_id', 1).limit(remaining + 1):
+				if not remaining:
+					return last
+				last = f"{k}:{el['_id']}"
+				remaining -= 1
+
+		return None
+
+
+	def _iter_docs(self,
+		q: SVGQuery, sort_by_stock: bool = False, after: None | ObjectId = None
+	) -> Generator[dict[str, Any], None, None]:
+		"""
+		Runs the provided query (executed by the threads of iter_plots)
+		:param after: page mode: documents with _id greater than the provided value, sorted by _id
+		"""
+
+		mdb = self._db.get_collection(q.col, mode='r').database
+		if q.col not in self._get_col_names(mdb):
 			if self._debug:
 				self.logger.debug(
-					f"Running query (db '{mdb._Database__name}' - collection '{q.col}'): {q._query}"
+					f"Skipping non-existent collection '{q.col}' (db '{mdb._Database__name}')"
 				)
+			return
 
-			if self.latest_doc:
-				res = self._db.get_collection(q.col, mode='r').find(q._query).sort("_id", -1).limit(1)
-				if self._debug:
-					count = self._db.get_collection(q.col, mode='r').count_documents(q._query)
-					if count:
-						self.logger.debug(f"{count} documents matched [loading only the latest]")
-					else:
-						self.logger.debug("No document matched")
-			elif self.limit:
-				res = self._db.get_collection(q.col).find(q._query).limit(self.limit)
-				if self._debug:
-					res = list(res)
-					self.logger.debug(f"{len(res)} document(s) matched [with limit {self.limit}]")
+		if self._debug:
+			self.logger.debug(
+				f"Running query (db '{mdb._Database__name}' - collection '{q.col}'): {q._query}"
+			)
+
+		if self.page_size:
+			res = self._find(q, self.page_size + 1, after=after, paging=True)
+		elif self.latest_doc:
+			res = self._find(q, latest_doc=True)
+			if self._debug:
+				count = self._db.get_collection(q.col, mode='r').count_documents(q._query)
+				if count:
+					self.logger.debug(f"{count} documents matched [loading only the latest]")
+				else:
+					self.logger.debug("No document matched")
+		elif self.limit:
+			res = self._find(q, self.limit, sort_by_stock=sort_by_stock)
+			if self._debug:
+				self.logger.debug(f"Retrieving at most {self.limit} document(s)")
+		else:
+			res = self._find(q, sort_by_stock=sort_by_stock)
+
+		for el in res:
+			if isinstance(el, RawBSONDocument):
+				yield decode_document(el.raw) if q.col == "plot" else decode_pruned(el.raw)
 			else:
-				res = self._db.get_collection(q.col).find(q._query)
+				yield el
 
-			for el in res:
 
-				i += 1
-				if self._debug:
-					self.logger.debug(f"Parsing {el['_id']}")
-
-				if q.col == "plot":
-					self._plots[None].add_raw_db_dict(el) # type: ignore
-					continue
-
-				if not el.get('body'):
-					if self._debug:
-						self.logger.debug(" Skipping doc: empty body")
-					continue
-
-				stock = el.get('stock', 0)
-
-				if isinstance(el['body'], list):
-					if self.last_body:
-						walk_and_process_dict(
-							arg = el['body'][-1],
-							callback = self._gather_plots_callback,
-							match = ['plot'],
-							q = q,
-							stock = stock
-						)
-					else:
-						for ell in el['body']:
-							walk_and_process_dict(
-								arg = ell,
-								callback = self._gather_plots_callback,
-								match = ['plot'],
-								q = q,
-								stock = stock
-							)
-				elif isinstance(el['body'], dict):
+	def _get_col_names(self, mdb: Database) -> set[str]:
+		""" Collection names are retrieved once per database """
+		if mdb.name not in self._col_names:
+			self._col_names[mdb.name] = set(mdb.list_collection_names())
+		return self._col_names[mdb.name]
+
+
+	def _walk_body(self, q: SVGQuery, el: dict[str, Any]) -> None:
+		""" Gathers plots contained in the body of the provided document (see _load_plots) """
+
+		stock = el.get('stock', 0)
+
+		if isinstance(el['body'], list):
+			if self.last_body:
+				walk_and_process_dict(
+					arg = el['body'][-1],
+					callback = self._gather_plots_callback,
+					match = ['plot'],
+					q = q,
+					stock = stock
+				)
+			else:
+				for ell in el['body']:
 					walk_and_process_dict(
-						arg = el['body'],
+						arg = ell,
 						callback = self._gather_plots_callback,
 						match = ['plot'],
 						q = q,
 						stock = stock
 					)
-				else:
-					if self._debug:
-						self.logger.debug(f" Skipping doc: unrecognized body type ({type(el['body'])}")
+		elif isinstance(el['body'], dict):
+			walk_and_process_dict(
+				arg = el['body'],
+				callback = self._gather_plots_callback,
+				match = ['plot'],
+				q = q,
+				stock = stock
+			)
+		else:
+			if self._debug:
+				self.logger.debug(f" Skipping doc: unrecognized body type ({type(el['body'])}")
 
-			#	self._load_plots(q, stock, get_by_path(el['body'], rel_path) if nested else el['body'][rel_path])
 
-			if self.limit and self.limit > i:
-				break
+	def _flush(self,
+		buffer: list[tuple[StockId, SVGRecord]],
+		side_loads: list[SVGRecord]
+	) -> Generator[tuple[StockId, SVGPlot], None, None]:
+		""" Resolves buffered side-loads and yields (then clears) buffered plots """
 
-		return self
+		missing: set[int] = set()
+		if side_loads:
+
+			if self._debug:
+				self.logger.debug(f"Side-loading {len(side_loads)} plot(s)")
+
+			if (x := side_load(
+				side_loads, self._plot_col, # type: ignore[arg-type]
+				batch_size = self.side_load_batch,
+				threads = self.side_load_threads
+			)):
+				self.logger.warn(f"{len(x)} plot(s) not found in the plot collection")
+				missing = {id(el) for el in x}
+
+		for stock, p in buffer:
+			if id(p) not in missing:
+				yield stock, SVGPlot(p)
+
+		buffer.clear()
+		side_loads.clear()
+
+
+	def _find(self,
+		q: SVGQuery, limit: int = 0, latest_doc: bool = False, sort_by_stock: bool = False,
+		after: None | ObjectId = None, paging: bool = False
+	) -> Iterable[dict[str, Any]]:
+		"""
+		Retrieves documents matched by the provided query.
+		Unless projection was disabled, only the query path is transferred.
+		If last_body is set, an aggregation pipeline slices list bodies server-side.
+		:param paging: sort documents by _id (and match those following 'after')
+		"""
+
+		col = self._db.get_collection(q.col, mode='r')
+		if self.raw:
+			col = _raw_col(col)
+		projection = q.get_projection() if self.projection else None
+		match = _after(q._query, after)
+
+		if projection and self.last_body:
+			pipeline: list[dict[str, Any]] = [{'$match': match}]
+			if latest_doc:
+				pipeline += [{'$sort': {'_id': -1}}, {'$limit': 1}]
+			else:
+				if paging:
+					pipeline.append({'$sort': {'_id': 1}})
+				elif sort_by_stock:
+					pipeline.append({'$sort': {'stock': 1}})
+				if limit:
+					pipeline.append({'$limit': limit})
+			pipeline += [
+				{
+					'$project': {
+						'stock': 1,
+						'body': {
+							'$cond': [{'$isArray': '$body'}, {'$slice': ['$body', -1]}, '$body']
+						}
+					}
+				},
+				{'$project': projection}
+			]
+			return col.aggregate(pipeline)
+
+		res = col.find(match, projection)
+		if latest_doc:
+			return res.sort("_id", -1).limit(1)
+		if paging:
+			res = res.sort("_id", 1)
+		elif sort_by_stock:
+			res = res.sort("stock", 1)
+		if limit:
+			return res.limit(limit)
+		return res
 
 
 	def _gather_plots_callback(self, path, k, d, **kwargs) -> None:
@@ -217,31 +456,40 @@ class SVGLoader:
 		if not plots:
 			return
 
-		side_loads: list[SVGRecord] = []
 		for i, p in enumerate(plots):
 
 			if self._debug:
 				self.logger.debug(f"Loading plot with index {i}")
 
-			if query.plot_tag:
-				if 'with' in query.plot_tag:
-					wqt = query.plot_tag['with']
-					if (
-						(isinstance(wqt, AllOf) and not all(x in p['tag'] for x in wqt.all_of)) or
-						(isinstance(wqt, AnyOf) and not [y in p['tag'] for y in wqt.any_of]) or
-						(isinstance(wqt, OneOf) and not wqt.any_of == [p['tag']]) or
-						(isinstance(wqt, (int, str)) and wqt not in p['tag'])
-					):
-						if self.logger and self.logger.verbose > 1:
-							self.logger.debug("Excluding plot (tag matching failed)")
-						continue
-
-			if isinstance(p['svg'], ObjectId):
-				side_loads.append(p)
-			else:
-				self._plots[stock].add_raw_db_dict(p)
+			if query.plot_tag_filter and not query.plot_tag_filter(tag_set(p.get('tag'))):
+				if self._debug:
+					self.logger.debug("Excluding plot (tag matching failed)")
+				continue
 
-		if side_loads:
-			_check_side_load(side_loads, self._plot_col)
-			for el in side_loads:
-				self._plots[stock].add_raw_db_dict(el)
+			self._matched.append((stock, p))
+
+
+def _parse_token(token: None | str) -> tuple[int, None | ObjectId]:
+	""" :returns: index of the query and _id of the last document processed """
+	if not token:
+		return 0, None
+	try:
+		k, oid = token.split(":")
+		return int(k), ObjectId(oid)
+	except Exception:
+		raise ValueError(f"Invalid resume token: {token}") from None
+
+
+def _after(query: dict[str, Any], oid: None | ObjectId) -> dict[str, Any]:
+	if oid is None:
+		return query
+	if '_id' in query:
+		return {'$and': [query, {'_id': {'$gt': oid}}]}
+	return query | {'_id': {'$gt': oid}}
+
+
+def _raw_col(col: Collection) -> Collection:
+	try:
+		return col.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+	except NotImplementedError: # mongomock
+		return col
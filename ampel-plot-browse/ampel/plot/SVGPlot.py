@@ -4,18 +4,44 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                13.06.2019
-# Last Modified Date:  26.09.2022
+# Last Modified Date:  17.10.2026
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-import os, html
+import os, io, html, sys
+from typing import Any, ClassVar, TextIO
+from collections import OrderedDict
 from collections.abc import Sequence
 from ampel.types import Tag
 from ampel.content.SVGRecord import SVGRecord
-from ampel.plot.util.compression import decompress_svg_dict
-from ampel.plot.util.transform import svg_to_png_html, rescale_str
+from ampel.plot.codec import decompress_svg
+from ampel.plot.util.tags import TagFilter, tag_set
+from ampel.plot.util.transform import svg_to_png_html, svg_to_png_file, svg_size, png_size, rescale_str
+
+# Plots holding a decompressed svg (LRU)
+_decompressed: OrderedDict["SVGPlot", None] = OrderedDict()
+
+# Tag tuples and sets shared by plots with identical tags
+_tag_tuples: dict[tuple[Tag, ...], tuple[Tag, ...]] = {}
+_tag_sets: dict[frozenset[Tag], frozenset[Tag]] = {}
+_tag_sets_max = 10_000
 
 
 class SVGPlot:
+	"""
+	Compressed svgs are decompressed on first access (see get_svg).
+	Lightweight representation of a plot record: instances use __slots__ and keep only the fields
+	of the record they use (other fields, ex: data, hash or run, are not referenced).
+	Names are interned, tags are shared between plots with identical tags.
+	"""
+
+	__slots__ = (
+		'_name', '_title', '_tags', '_payload', '_codec', '_dict_id', '_oid',
+		'_svg', '_tag_set', '_title_left_padding', '_doc_tags', '_pngd'
+	)
+
+	#: Max number of decompressed svgs kept in memory (shared by all instances, None: no limit).
+	#: Least recently used svgs are dropped (and decompressed again if needed).
+	max_decompressed: ClassVar[None | int] = 256
 
 	def __init__(self,
 		content: SVGRecord,
@@ -23,45 +49,53 @@ class SVGPlot:
 		doc_tags: None | Tag | list[Tag] = None
 	):
 
-		if isinstance(content['svg'], bytes):
-			self._record = decompress_svg_dict(content)
-		else:
-			self._record = content
-
-		self._tags = content['tag']
+		self._name: str = sys.intern(content['name']) if isinstance(content.get('name'), str) else content['name']
+		self._title: str = content['title']
+		self._tags, self._tag_set = _intern_tags(content['tag'])
+		self._payload: str | bytes | memoryview = content['svg'] # type: ignore[assignment]
+		self._codec: None | str = content.get('codec') # type: ignore[assignment]
+		self._dict_id: None | int = content.get('dict_id') # type: ignore[assignment]
+		self._oid: None | str = content.get('oid') # type: ignore[assignment]
+		self._svg: None | str = None
 		self._title_left_padding = title_left_padding
 		self._doc_tags = sorted(doc_tags) if doc_tags else doc_tags
 		self._pngd: None | dict[tuple[float, int], str] = None
 
 
 	def has_tag(self, tag: Tag) -> bool:
-		if not self._tags:
-			return False
-		if isinstance(self._tags, (str, int)):
-			return tag == self._tags
-		return tag in self._tags
+		return tag in self._tag_set
 
 
 	def get_file_name(self) -> str:
-		return self._record['name']
+		return self._name
+
+
+	def get_title(self) -> str:
+		return self._title
+
+
+	def set_title(self, title: str) -> None:
+		self._title = title
 
 
 	def get_oid(self) -> None | str:
-		return self._record.get('oid')
+		return self._oid
 
 
 	def has_tags(self, tags: Sequence[Tag]) -> bool:
-		if not self._tags:
-			return False
-		if isinstance(self._tags, (str, int)):
-			return self._tags in tags
-		return all(el in self._tags for el in tags)
+		""" :returns: True if the plot has all the provided tags """
+		return bool(self._tag_set) and self._tag_set.issuperset(tags)
+
+
+	def match_tags(self, tag_filter: TagFilter) -> bool:
+		""" :param tag_filter: see ampel.plot.util.tags.compile_tag_filter """
+		return tag_filter(self._tag_set)
 
 
 	def to_html_file(self, path: str, **kwargs) -> None:
-		with open(os.path.join(path, self._record['name']) + '.html', 'w') as f:
+		with open(os.path.join(path, self._name) + '.html', 'w') as f:
 			f.write("<html><head></head><body>")
-			f.write(self._repr_html_(**kwargs))
+			self.write_html(f, **kwargs)
 			f.write("</body></html>")
 		
 
@@ -70,8 +104,8 @@ class SVGPlot:
 			self._title_left_padding,
 			"" if title_prefix is None else title_prefix,
 			(
-				html.escape(self._record['title']) if html_escape
-				else self._record['title']
+				html.escape(self._title) if html_escape
+				else self._title
 			).replace("\n", "<br/>")
 		)
 
@@ -91,7 +125,7 @@ class SVGPlot:
 			tags = str(self._doc_tags) if isinstance(self._doc_tags, (int, str)) \
 				else " ".join(self._doc_tags) # type: ignore[arg-type]
 		else:
-			tags = str(self._tags)
+			tags = str(list(self._tags) if isinstance(self._tags, tuple) else self._tags)
 
 		if html_escape:
 			return first + html.escape(tags) + '</h3>'
@@ -113,10 +147,28 @@ class SVGPlot:
 		return out
 
 
+	def get_svg(self) -> str:
+		""" :returns: the uncompressed svg """
+
+		if isinstance(self._payload, str):
+			return self._payload
+
+		if self._svg is None:
+			self._svg = decompress_svg(self._payload, self._codec, self._dict_id)
+			if self.max_decompressed is not None:
+				_decompressed[self] = None
+				while len(_decompressed) > self.max_decompressed:
+					_decompressed.popitem(last=False)[0]._svg = None
+		elif self in _decompressed:
+			_decompressed.move_to_end(self)
+
+		return self._svg
+
+
 	def get(self, scale: float = 1.0) -> str:
 		if scale == 1.0:
-			return self._record['svg'] # type: ignore[return-value]
-		return rescale_str(self._record['svg'], scale) # type: ignore
+			return self.get_svg()
+		return rescale_str(self.get_svg(), scale)
 
 
 	def _build_png(self, png_convert: int, scale: float = 1.0) -> str:
@@ -124,7 +176,7 @@ class SVGPlot:
 			self._pngd = {}
 		if (scale, png_convert) not in self._pngd:
 			self._pngd[(scale, png_convert)] = svg_to_png_html(
-				self._record['svg'], # type: ignore[arg-type]
+				self.get_svg(),
 				scale = scale,
 				dpi = png_convert
 			)
@@ -144,51 +196,103 @@ class SVGPlot:
 		:param scale: if None, native scaling is used
 		:param png_convert: DPI value of the produced image
 		"""
+		out = io.StringIO()
+		self.write_html(
+			out, scale, title_prefix, title_on_top, tags_on_top,
+			include_doc_tags, padding_bottom, png_convert
+		)
+		return out.getvalue()
+
+
+	def write_html(self,
+		out: TextIO,
+		scale: float = 1.0,
+		title_prefix: None | str = None,
+		title_on_top: bool = False,
+		tags_on_top: bool = True,
+		include_doc_tags: bool = False,
+		padding_bottom: int = 0,
+		png_convert: None | int = None,
+		src: None | str = None,
+		src_size: None | tuple[int, int] = None
+	) -> None:
+		"""
+		Writes the html representation of this plot into the provided text stream (file, StringIO, ...)
+		:param src: url of the image file of this plot (see write_file), referenced by
+		a lazily loaded img tag (the plot is not embedded into the html)
+		:param src_size: dimensions (pixels) of the image file as returned by write_file
+		(computed from the svg otherwise, which requires decompressing it)
+		:param **kwargs: see _repr_html_ arguments for details
+		"""
 
-		html = '<div style="padding-bottom: %ipx;text-align: center" class="%s">' % (
-			padding_bottom,
-			" ".join(
-				str(el) if isinstance(el, int) else el
-				for el in ([self._tags] if isinstance(self._tags, (int, str)) else self._tags)
-			) + " PLOT hovernow"
+		out.write(
+			'<div style="padding-bottom: %ipx;text-align: center" class="%s">' % (
+				padding_bottom,
+				" ".join(
+					str(el) if isinstance(el, int) else el
+					for el in ([self._tags] if isinstance(self._tags, (int, str)) else self._tags)
+				) + " PLOT hovernow"
+			)
 		)
 
 		if title_on_top:
-			html += self._get_title(title_prefix, html_escape=True)
+			out.write(self._get_title(title_prefix, html_escape=True))
 
 		if tags_on_top:
-			html += self._get_tags(include_doc_tags, html_escape=True)
-
-		html += self._get_extra()
-
-		# html += SVGPlot.display_div
+			out.write(self._get_tags(include_doc_tags, html_escape=True))
 
-		if isinstance(self._record['svg'], bytes):
-			raise ValueError("SVGRecord should not be compressed")
+		out.write(self._get_extra())
 
-		if png_convert:
+		if src:
+			# Explicit dimensions: browsers otherwise load all (zero sized) images at once
+			size = src_size or (
+				png_size(self.get_svg(), dpi = png_convert, scale = scale) if png_convert
+				else svg_size(self.get_svg(), scale = scale)
+			)
+			out.write(
+				'<img class=mainimg loading="lazy" src="%s"%s>' % (
+					html.escape(src),
+					' width="%i" height="%i"' % size if size else ''
+				)
+			)
+		elif png_convert:
 			print(f"Converting {self.get_file_name()} to PNG")
 			if self._pngd and (scale, png_convert) in self._pngd:
-				html += self._pngd[(scale, png_convert)]
+				out.write(self._pngd[(scale, png_convert)])
 			else:
-				html += svg_to_png_html(
-					self._record['svg'],
-					scale = scale,
-					dpi = png_convert
+				out.write(
+					svg_to_png_html(
+						self.get_svg(),
+						scale = scale,
+						dpi = png_convert
+					)
 				)
 		else:
-			if scale == 1.0:
-				html += self._record['svg'].replace('xlink"', 'xlink" class=mainimg')
-			else:
-				html += rescale_str(self._record['svg'], scale=scale).replace('xlink"', 'xlink" class=mainimg')
+			_write_svg(out, self.get(scale), ' class=mainimg')
 
 		if not title_on_top:
-			html += self._get_title(title_prefix, html_escape=True)
+			out.write(self._get_title(title_prefix, html_escape=True))
 
 		if not tags_on_top:
-			html += self._get_tags(include_doc_tags, html_escape=True)
+			out.write(self._get_tags(include_doc_tags, html_escape=True))
+
+		out.write('</div>')
 
-		return html + '</div>'
+
+	def write_file(self,
+		path: str, scale: float = 1.0, png_convert: None | int = None
+	) -> None | tuple[int, int]:
+		"""
+		Writes this plot as standalone image file (svg or png if png_convert is set)
+		:param png_convert: DPI value of the produced image
+		:returns: dimensions (pixels) of the image (see transform.svg_size)
+		"""
+		svg = self.get_svg()
+		if png_convert:
+			return svg_to_png_file(svg, path, dpi = png_convert, scale = scale)
+		with open(path, 'w', encoding='utf-8') as f:
+			f.write(svg if scale == 1.0 else rescale_str(svg, scale))
+		return svg_size(svg, scale = scale)
 
 
 	def show_html(self, **kwargs):
@@ -199,3 +303,42 @@ class SVGPlot:
 		return HTML(
 			self._repr_html_(**kwargs)
 		)
+
+
+def _write_svg(out: TextIO, svg: str, attrs: str) -> None:
+	""" Writes the provided svg with attributes added to the root tag (the rest of the document is not scanned) """
+
+	start = svg.find('<svg')
+	end = -1 if start == -1 else svg.find('>', start)
+	if end == -1:
+		out.write(svg)
+		return
+
+	if svg[end - 1] == '/':
+		end -= 1
+
+	out.write(svg[:end])
+	out.write(attrs)
+	out.write(svg[end:])
+
+
+def _intern_tags(tags: Any) -> tuple[Tag | tuple[Tag, ...], frozenset[Tag]]:
+	""" :returns: interned tags (sequences are converted into shared tuples) and the shared tag set """
+
+	if isinstance(tags, str):
+		tags = sys.intern(tags)
+	elif isinstance(tags, (list, tuple)):
+		tags = tuple(sys.intern(el) if isinstance(el, str) else el for el in tags)
+		if (shared_tags := _tag_tuples.get(tags)) is not None:
+			tags = shared_tags
+		elif len(_tag_tuples) < _tag_sets_max:
+			_tag_tuples[tags] = tags
+
+	ts = tag_set(tags)
+	if (shared := _tag_sets.get(ts)) is not None:
+		return tags, shared
+
+	if len(_tag_sets) < _tag_sets_max:
+		_tag_sets[ts] = ts
+
+	return tags, ts
@@ -4,7 +4,7 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                15.06.2019
-# Last Modified Date:  23.12.2022
+# Last Modified Date:  17.10.2026
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
 from typing import Literal, Any
@@ -14,6 +14,7 @@ from ampel.model.operator.AnyOf import AnyOf
 from ampel.model.operator.AllOf import AllOf
 from ampel.model.operator.OneOf import OneOf
 from ampel.mongo.utils import match_one_or_many
+from ampel.plot.util.tags import TagFilter, compile_tag_filter
 
 
 class SVGQuery:
@@ -50,6 +51,9 @@ class SVGQuery:
 			Tag | AllOf[Tag] | AnyOf[Tag] | OneOf[Tag]
 		] = None
 
+		#: Compiled plot_tag criteria, used for client-side filtering of plots (see SVGLoader)
+		self.plot_tag_filter: None | TagFilter = None
+
 		if stock:
 			self.set_stock(stock)
 
@@ -82,6 +86,16 @@ class SVGQuery:
 		return self._query
 
 
+	def get_projection(self) -> None | dict[str, Any]:
+		"""
+		:returns: projection restricting documents to the query path
+		(None for the plot collection where documents are plots)
+		"""
+		if self.col == "plot":
+			return None
+		return {'stock': 1, self.path or 'body': 1}
+
+
 	def set_stock(self, stock: OneOrMany[StockId], invert: bool = False) -> None:
 
 		if isinstance(stock, str) and "," in stock:
@@ -117,13 +131,17 @@ class SVGQuery:
 	) -> None:
 
 		self.plot_tag = tag
+		self.plot_tag_filter = compile_tag_filter(tag.get('with'), tag.get('without'))
+
+		# Documents of the plot collection (empty path) are plots
+		path = f"{self.path}.tag" if self.path else "tag"
 
 		if 'with' in tag:
-			apply_schema(self._query, ".".join([self.path, "tag"]), tag['with'])
+			apply_schema(self._query, path, tag['with'])
 
 		# Order matters, parse_dict(...) must be called *after* parse_excl_dict(...)
 		if 'without' in tag:
-			apply_excl_schema(self._query, ".".join([self.path, "tag"]), tag['without'])
+			apply_excl_schema(self._query, path, tag['without'])
 
 
 	def set_query_parameter(self, name: str, value: Any, overwrite: bool = False) -> None:
@@ -4,22 +4,166 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                16.11.2021
-# Last Modified Date:  22.11.2021
+# Last Modified Date:  17.10.2026
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-import platform, json, time, re, gc # type: ignore[import]
+import os, platform, json, time, re, select # type: ignore[import]
 
 from typing import Any
+from collections.abc import Callable
 from pymongo.collection import Collection # type: ignore[import]
 from ampel.util.recursion import walk_and_process_dict
 from ampel.plot.SVGCollection import SVGCollection
 from ampel.model.PlotBrowseOptions import PlotBrowseOptions
-from ampel.plot.util.load import print_func, _handle_json, _gather_plots
+from ampel.plot.util.load import print_func, set_print, _handle_json, _gather_plots # noqa
+from ampel.plot.util.compression import use_db_dicts
 
-if platform.system() == 'Darwin':
-	import AppKit # type: ignore[import] # noqa
-else:
-	import pyperclip # type: ignore[import] # noqa
+json_loads: Callable[[str | bytes], Any]
+try:
+	import orjson # type: ignore[import]
+	json_loads = orjson.loads # raises orjson.JSONDecodeError (subclass of json.JSONDecodeError)
+except ImportError:
+	json_loads = json.loads
+
+# mongo shell / compass exports: NumberLong(123), ObjectId("...")
+pattern = re.compile(r"(?:NumberLong|ObjectId)\((.*?)\)", re.DOTALL)
+
+
+class ClipboardBackend:
+	"""
+	Notifies clipboard changes. Subclasses implement wait(...) and read().
+	The polling implementation compares (cheap) hashes of the clipboard content.
+	"""
+
+	#: Time (seconds) between two clipboard reads
+	interval: float = 0.2
+
+	# Time (monotonic) of the next clipboard read
+	_next_poll: float = 0.
+
+	def __init__(self) -> None:
+		import pyperclip # type: ignore[import]
+		self._paste = pyperclip.paste
+		self._value: None | str = None
+		self._hash = hash(self._paste()) # content present at startup is ignored
+
+	def wait(self, timeout: None | float = None) -> bool:
+		"""
+		Blocks until the clipboard changes or timeout (seconds) expires.
+		The clipboard is read at most once per interval, whatever the timeout.
+		:returns: True if the clipboard changed (new content is available through read())
+		"""
+		end = None if timeout is None else time.monotonic() + timeout
+		while True:
+			now = time.monotonic()
+			if now >= self._next_poll:
+				self._next_poll = now + self.interval
+				if self._poll():
+					return True
+			delay = self._next_poll - now
+			if end is not None:
+				if now >= end:
+					return False
+				delay = min(delay, end - now)
+			time.sleep(delay)
+
+	def _poll(self) -> bool:
+		""" :returns: True if the clipboard changed since the last call """
+		v = self._paste()
+		if (h := hash(v)) != self._hash:
+			self._hash = h
+			self._value = v
+			return True
+		return False
+
+	def read(self) -> None | str:
+		return self._value
+
+	def close(self) -> None:
+		pass
+
+
+class MacClipboardBackend(ClipboardBackend):
+	""" Polls the change count of the pasteboard (content is read only when it changed) """
+
+	interval = 0.1
+
+	def __init__(self) -> None:
+		import AppKit # type: ignore[import]
+		self._appkit = AppKit
+		self._board = AppKit.NSPasteboard.generalPasteboard()
+		self._count = self._board.changeCount()
+
+	def _poll(self) -> bool:
+		if (c := self._board.changeCount()) != self._count:
+			self._count = c
+			return True
+		return False
+
+	def read(self) -> None | str:
+		return self._board.stringForType_(self._appkit.NSStringPboardType)
+
+
+class XFixesClipboardBackend(ClipboardBackend):
+	"""
+	Event driven (Linux/X11): blocks on the X connection until the owner of the CLIPBOARD selection changes.
+	Requires package python-xlib and a X server supporting the XFIXES extension.
+	"""
+
+	def __init__(self) -> None:
+
+		from Xlib import display # type: ignore[import]
+		from Xlib.ext import xfixes # type: ignore[import]
+		import pyperclip # type: ignore[import]
+
+		self._paste = pyperclip.paste
+		self._display = display.Display()
+		if not self._display.has_extension('XFIXES'):
+			self._display.close()
+			raise RuntimeError("XFIXES extension not available")
+
+		self._display.xfixes_query_version()
+		self._display.xfixes_select_selection_input(
+			self._display.screen().root,
+			self._display.intern_atom('CLIPBOARD'),
+			xfixes.XFixesSetSelectionOwnerNotifyMask
+		)
+		self._event = self._display.extension_event.SetSelectionOwnerNotify
+
+	def wait(self, timeout: None | float = None) -> bool:
+
+		if not self._display.pending_events():
+			r, _, _ = select.select([self._display], [], [], timeout)
+			if not r:
+				return False
+
+		changed = False
+		for _ in range(self._display.pending_events()):
+			e = self._display.next_event()
+			if (e.type, getattr(e, 'sub_code', None)) == self._event:
+				changed = True
+		return changed
+
+	def read(self) -> None | str:
+		return self._paste()
+
+	def close(self) -> None:
+		self._display.close()
+
+
+def get_clipboard_backend() -> ClipboardBackend:
+	""" :returns: the most efficient backend available on this platform """
+
+	if platform.system() == 'Darwin':
+		return MacClipboardBackend()
+
+	if platform.system() == 'Linux' and os.environ.get('DISPLAY'):
+		try:
+			return XFixesClipboardBackend()
+		except Exception:
+			pass # python-xlib not installed, XFIXES not supported, wayland...
+
+	return ClipboardBackend()
 
 
 def read_from_clipboard(
@@ -27,92 +171,91 @@ def read_from_clipboard(
 	plots_col: Collection,
 	keyboard_callback: Any,
 	gui_callback: Any = None,
-	exit_on_interrupt: bool = True
+	exit_on_interrupt: bool = True,
+	backend: None | ClipboardBackend = None
 ) -> None:
 	"""
 	Note: method never returns unless CTRL-C is pressed or gui_callback raises KeyboardInterrupt
+	:param gui_callback: called at least every 50ms
+	:param backend: see get_clipboard_backend
 	"""
 
-	recent_value = ""
 	scol = SVGCollection()
-
-	pattern = re.compile(r"(?:NumberLong|ObjectId)\((.*?)\)", re.DOTALL)
-	#from bson.json_util import loads
+	use_db_dicts(plots_col.database.get_collection('plotdict'))
 
 	if gui_callback is None:
 		gui_callback = lambda: None
+		timeout = None
+	else:
+		timeout = 0.05
 
 	gui_callback()
-	print_func("Monitoring clipboard...")
+	if backend is None:
+		backend = get_clipboard_backend()
 
-	if platform.system() == 'Darwin':
-		board = AppKit.NSPasteboard.generalPasteboard()
-		get_cbc = lambda: board.changeCount()
-	else:
-		pyperclip.copy('')
-		get_cbc = pyperclip.paste()
+	print_func("Monitoring clipboard...")
 
 	try:
 		while True:
 
-			tmp_value = get_cbc()
+			changed = backend.wait(timeout)
 			gui_callback()
 
-			if tmp_value != recent_value:
-
-				recent_value = tmp_value
-				if platform.system() == 'Darwin':
-					tmp_value = board.stringForType_(AppKit.NSStringPboardType)
-
-				try:
-
-					# if pattern.match(tmp_value): # no time to check why it doesn't work
-					if tmp_value and ("NumberLong" in tmp_value or "ObjectId" in tmp_value):
-						j = json.loads(
-							re.sub(pattern, r"\1", tmp_value)
-						)
-					else:
-						j = json.loads(tmp_value)
-
-					ctrl_pressed = keyboard_callback()
-					if pbo.debug and ctrl_pressed:
-						print_func("CTRL is pressed")
-
-					if (
-						(isinstance(j, dict) and 'svg' not in j) or
-						(isinstance(j, list) and len(j) > 0 and 'svg' not in j[0])
-					):
-						plots: list[dict] = []
-						walk_and_process_dict(
-							arg = j,
-							callback = _gather_plots,
-							match = ['plot'],
-							plots = plots,
-							debug = pbo.debug
-						)
-						if plots:
-							scol = _handle_json(plots, scol, plots_col, pbo, ctrl_pressed)
-					else:
-						scol = _handle_json(j, scol, plots_col, pbo, ctrl_pressed)
-					gc.collect()
-				except KeyboardInterrupt:
-					raise
-				except json.decoder.JSONDecodeError:
-					if pbo.debug:
-						import traceback
-						print_func("JSONDecodeError")
-						print_func(traceback.format_exc())
-						print_func(tmp_value)
-				except Exception:
+			if not changed:
+				continue
+
+			tmp_value = backend.read()
+
+			# Not json
+			if not tmp_value or tmp_value.lstrip()[:1] not in ('{', '['):
+				continue
+
+			try:
+
+				# Regex pass only needed for shell-like exports
+				if "NumberLong" in tmp_value or "ObjectId" in tmp_value:
+					tmp_value = re.sub(pattern, r"\1", tmp_value)
+
+				j = json_loads(tmp_value)
+
+				ctrl_pressed = keyboard_callback()
+				if pbo.debug and ctrl_pressed:
+					print_func("CTRL is pressed")
+
+				if (
+					(isinstance(j, dict) and 'svg' not in j) or
+					(isinstance(j, list) and len(j) > 0 and 'svg' not in j[0])
+				):
+					plots: list[dict] = []
+					walk_and_process_dict(
+						arg = j,
+						callback = _gather_plots,
+						match = ['plot'],
+						plots = plots,
+						debug = pbo.debug
+					)
+					if plots:
+						scol = _handle_json(plots, scol, plots_col, pbo, ctrl_pressed)
+				else:
+					scol = _handle_json(j, scol, plots_col, pbo, ctrl_pressed)
+			except KeyboardInterrupt:
+				raise
+			except json.decoder.JSONDecodeError:
+				if pbo.debug:
 					import traceback
-					with open('error.log', 'w') as f:
-						traceback.print_exc(file=f)
+					print_func("JSONDecodeError")
 					print_func(traceback.format_exc())
-
-			time.sleep(0.1)
+					print_func(tmp_value)
+			except Exception:
+				import traceback
+				with open('error.log', 'w') as f:
+					traceback.print_exc(file=f)
+				print_func(traceback.format_exc())
 
 	except KeyboardInterrupt:
 		if exit_on_interrupt:
 			import sys
 			print_func("\nUntil next time...\n")
 			sys.exit(0)
+	finally:
+		backend.close()
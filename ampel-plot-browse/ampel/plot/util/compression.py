@@ -7,19 +7,42 @@
 # Last Modified Date:  13.04.2022
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
+from pymongo.collection import Collection # type: ignore[import]
 from ampel.content.SVGRecord import SVGRecord
-from ampel.util.compression import decompress_str
+from ampel.plot.codec import decompress_svg, add_zstd_dict_loader
+
+_dict_cols: dict[str, Collection] = {}
 
 
 def decompress_svg_dict(svg_dict: SVGRecord) -> SVGRecord:
 	"""
-	Modifies input dict by potentionaly decompressing compressed 'svg' value
+	Modifies input dict by potentionaly decompressing compressed 'svg' value.
+	The decoder is selected using the record's 'codec' field if available (magic bytes otherwise).
 	"""
 
 	if not isinstance(svg_dict, dict):
 		raise ValueError("Parameter svg_dict must be an instance of dict")
 
-	if isinstance(svg_dict['svg'], bytes):
-		svg_dict['svg'] = decompress_str(svg_dict['svg'])
+	if isinstance(svg_dict['svg'], (bytes, memoryview)):
+		svg_dict['svg'] = decompress_svg(svg_dict['svg'], svg_dict.get('codec'), svg_dict.get('dict_id'))
 
 	return svg_dict
+
+
+def use_db_dicts(col: Collection) -> None:
+	"""
+	Registers the provided collection (typically 'plotdict') as source of zstd
+	dictionaries referenced by plot records (see 'ampel plot dict')
+	"""
+
+	k = f"{col.database.name}.{col.name}"
+	if k in _dict_cols:
+		return
+
+	def load_dict(dict_id: int) -> None | bytes:
+		if (doc := next(col.find({'_id': dict_id}), None)):
+			return doc['dict']
+		return None
+
+	_dict_cols[k] = col
+	add_zstd_dict_loader(load_dict)
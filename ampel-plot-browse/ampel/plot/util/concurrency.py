@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-plot/ampel-plot-browse/ampel/plot/util/concurrency.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                17.10.2026
+# Last Modified Date:  17.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from queue import Queue, Full
+from threading import Event
+from typing import Any, TypeVar
+from collections.abc import Iterable, Sequence, Generator
+from concurrent.futures import ThreadPoolExecutor
+
+T = TypeVar("T")
+_done = object()
+
+
+def iter_ordered(
+	iterables: Sequence[Iterable[T]],
+	threads: int = 4,
+	prefetch: int = 0
+) -> Generator[tuple[int, T], None, None]:
+	"""
+	Consumes the provided iterables (typically DB cursors) concurrently using a pool of threads
+	and yields their items in a deterministic order: items of the first iterable,
+	then items of the second iterable, etc. (same order as a sequential iteration).
+	Iterables are started in order, so the iterable being yielded is always running.
+
+	:param threads: max number of iterables consumed at once (values < 2: sequential iteration)
+	:param prefetch: max number of items buffered per iterable (0: no limit)
+	:returns: (index of the iterable, item) tuples.
+	Exceptions raised by an iterable are re-raised when its turn comes.
+	"""
+
+	if threads < 2 or len(iterables) < 2:
+		for i, it in enumerate(iterables):
+			for el in it:
+				yield i, el
+		return
+
+	stop = Event()
+	queues: list[Queue] = [Queue(prefetch) for _ in iterables]
+
+	def produce(i: int) -> None:
+		try:
+			for el in iterables[i]:
+				if not _put(queues[i], (True, el), stop):
+					return
+			_put(queues[i], _done, stop)
+		except BaseException as e:
+			_put(queues[i], (False, e), stop)
+
+	executor = ThreadPoolExecutor(min(threads, len(iterables)))
+	try:
+		for i in range(len(iterables)):
+			executor.submit(produce, i)
+
+		for i, q in enumerate(queues):
+			while (item := q.get()) is not _done:
+				if not item[0]:
+					raise item[1]
+				yield i, item[1]
+	finally:
+		# Unblocks producers if the consumer stopped early
+		stop.set()
+		executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _put(q: Queue, item: Any, stop: Event) -> bool:
+	""" :returns: False if the consumer stopped """
+	while not stop.is_set():
+		try:
+			q.put(item, timeout=0.1)
+			return True
+		except Full:
+			continue
+	return False
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-plot/ampel-plot-browse/ampel/plot/util/index.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                17.10.2026
+# Last Modified Date:  17.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from time import time
+from typing import Any
+from pymongo.collection import Collection # type: ignore[import]
+from ampel.plot.SVGQuery import SVGQuery
+
+# Fields used by SVGQuery, ordered by expected selectivity
+# ('_tag_path_' stands for the plot tag path of the query, ex: body.data.plot.tag)
+query_fields = ('stock', 'meta.run', 'run', 'meta.jobid', 'unit', 'config', '_tag_path_', 'tag')
+
+# Compound index for the plot collection: plots of a run, optionally with tags, sorted by _id
+plot_index = [('run', 1), ('tag', 1), ('_id', 1)]
+
+
+def explain_query(col: Collection, q: SVGQuery) -> dict[str, Any]:
+	"""
+	:returns: dict with keys 'stages' (stages of the winning plan), 'indexes' (names of the indexes used),
+	'collscan' (bool), 'docs_examined', 'returned' and 'ms' (execution time)
+	If the server does not support explain (mongomock), only the execution time is measured.
+	"""
+
+	try:
+		plan = col.find(q._query, q.get_projection()).explain()
+	except (AttributeError, NotImplementedError):
+		t = time()
+		n = sum(1 for _ in col.find(q._query, q.get_projection()))
+		return {
+			'stages': [], 'indexes': [], 'collscan': None,
+			'docs_examined': None, 'returned': n, 'ms': round((time() - t) * 1000, 2)
+		}
+
+	stages: list[str] = []
+	indexes: list[str] = []
+	_walk_plan(plan['queryPlanner']['winningPlan'], stages, indexes)
+	stats = plan.get('executionStats', {})
+
+	return {
+		'stages': stages,
+		'indexes': indexes,
+		'collscan': 'COLLSCAN' in stages,
+		'docs_examined': stats.get('totalDocsExamined'),
+		'returned': stats.get('nReturned'),
+		'ms': stats.get('executionTimeMillis')
+	}
+
+
+def _walk_plan(plan: dict[str, Any], stages: list[str], indexes: list[str]) -> None:
+
+	stages.append(plan['stage'])
+	if 'indexName' in plan:
+		indexes.append(plan['indexName'])
+
+	if 'inputStage' in plan:
+		_walk_plan(plan['inputStage'], stages, indexes)
+
+	for el in plan.get('inputStages', []):
+		_walk_plan(el, stages, indexes)
+
+
+def get_index_keys(q: SVGQuery, col: Collection) -> list[tuple[str, int]]:
+	"""
+	Builds a compound index supporting the provided query (fields ordered by expected selectivity).
+	At most one field containing arrays (checked using a sample document) is included
+	since mongodb rejects documents with parallel arrays in compound indexes.
+	"""
+
+	fields = list(q._query.keys())
+	sample = col.find_one({}, {'_id': 0, 'stock': 1, 'meta': 1, 'tag': 1, 'run': 1, 'body': 1}) or {}
+	keys: list[tuple[str, int]] = []
+	with_array = False
+
+	for k in query_fields:
+
+		if k == '_tag_path_':
+			if not q.path:
+				continue
+			k = f"{q.path}.tag"
+
+		if k not in fields:
+			continue
+
+		if _has_array(sample, k.split(".")):
+			if with_array:
+				continue
+			with_array = True
+
+		keys.append((k, 1))
+
+	return keys
+
+
+def _has_array(d: Any, path: list[str]) -> bool:
+	""" :returns: True if any element along the provided path is a list """
+
+	if isinstance(d, list):
+		return True
+
+	if not path or not isinstance(d, dict) or path[0] not in d:
+		return False
+
+	return _has_array(d[path[0]], path[1:])
+
+
+def get_plot_index_keys(col: Collection) -> list[tuple[str, int]]:
+	"""
+	:returns: plot_index, or ('run', '_id') if plot deduplication (list of run ids) is used
+	as tags are lists as well (see AmpelPlotAdapter)
+	"""
+	if col.find_one({'run.0': {'$exists': True}}, {'_id': 1}):
+		return [('run', 1), ('_id', 1)]
+	return plot_index
+
+
+def has_index(col: Collection, keys: list[tuple[str, int]]) -> bool:
+	""" :returns: True if an index starting with the provided keys exists """
+	return any(
+		list(v['key'])[:len(keys)] == keys
+		for v in col.index_information().values()
+	)
@@ -4,11 +4,13 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                17.05.2019
-# Last Modified Date:  23.08.2022
+# Last Modified Date:  17.10.2026
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
 import base64
 from typing import Any
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 from bson import ObjectId # type: ignore[import]
 from pymongo.collection import Collection # type: ignore[import]
 from ampel.plot.SVGCollection import SVGCollection
@@ -63,7 +65,7 @@ def _load_and_add_plot(
 	_check_side_load(j, plots_col)
 	if (d := _check_adapt(j)):
 		splot = SVGPlot(d) # type: ignore
-		print_func("Adding", splot._record['name'])
+		print_func("Adding", splot.get_file_name())
 		svg_col.add_svg_plot(splot)
 		if (len(svg_col._svgs) % pbo.stack) == 0:
 			print_func(f"Displaying plot stack ({len(svg_col._svgs)} figures)")
@@ -78,7 +80,7 @@ def _load_and_show_plot(j: Any, plots_col: Collection, pbo: PlotBrowseOptions) -
 	_check_side_load(j, plots_col)
 	if (d := _check_adapt(j)):
 		splot = SVGPlot(d) # type: ignore
-		print_func("Displaying", splot._record['name'])
+		print_func("Displaying", splot.get_file_name())
 		show_svg_plot(splot, pbo) # type: ignore
 
 
@@ -111,11 +113,11 @@ def _check_side_load(j: Any, col: Collection) -> None:
 		if isinstance(j['svg'], str) and len(j['svg']) == 24:
 			print_func(f"Side-loading {j['name']}")
 			j['oid'] = j['svg']
-			j['svg'] = next(col.find({'_id': ObjectId(j['svg'])}))['svg']
+			_copy_payload(next(col.find({'_id': ObjectId(j['svg'])})), j)
 		elif isinstance(j['svg'], ObjectId):
 			print_func(f"Side-loading {j['name']}")
 			j['oid'] = str(j['svg'])
-			j['svg'] = next(col.find({'_id': j['svg']}))['svg']
+			_copy_payload(next(col.find({'_id': j['svg']})), j)
 
 	elif isinstance(j, list):
 
@@ -130,11 +132,60 @@ def _check_side_load(j: Any, col: Collection) -> None:
 
 		if ids:
 			resolved = {
-				doc['_id']: doc['svg']
+				doc['_id']: doc
 				for doc in col.find({'_id': {'$in': [x[1] for x in ids]}})
 			}
 
 			for i, el in ids:
 				print_func(f"Side-loading {j[i]['name']}")
-				j[i]['svg'] = resolved[el]
+				_copy_payload(resolved[el], j[i])
 				j[i]['oid'] = str(el)
+
+
+def _copy_payload(doc: dict[str, Any], el: dict[str, Any]) -> None:
+	""" The stored payload might use another codec / dictionary than the one of the referencing record """
+	el['svg'] = doc['svg']
+	for k in ('codec', 'dict_id'):
+		if k in doc:
+			el[k] = doc[k]
+		else:
+			el.pop(k, None)
+
+
+def side_load(
+	records: Sequence[dict[str, Any]],
+	col: Collection,
+	batch_size: int = 1000,
+	threads: int = 4
+) -> list[dict[str, Any]]:
+	"""
+	Resolves (in place) records whose 'svg' value is the ObjectId of a document from the plot collection.
+	Ids are deduplicated and retrieved using $in queries of at most batch_size ids,
+	executed concurrently by the provided number of threads.
+	:returns: records which could not be resolved (missing plot documents)
+	"""
+
+	oids = list(dict.fromkeys(el['svg'] for el in records))
+	batches = [oids[i:i + batch_size] for i in range(0, len(oids), batch_size)]
+
+	def fetch(batch: list[ObjectId]) -> list[dict[str, Any]]:
+		return list(col.find({'_id': {'$in': batch}}, {'svg': 1, 'codec': 1, 'dict_id': 1}))
+
+	resolved: dict[ObjectId, dict[str, Any]] = {}
+	if threads > 1 and len(batches) > 1:
+		with ThreadPoolExecutor(min(threads, len(batches))) as executor:
+			for docs in executor.map(fetch, batches):
+				resolved.update((doc['_id'], doc) for doc in docs)
+	else:
+		for batch in batches:
+			resolved.update((doc['_id'], doc) for doc in fetch(batch))
+
+	missing = []
+	for el in records:
+		if (doc := resolved.get(el['svg'])) is None:
+			missing.append(el)
+			continue
+		el['oid'] = str(el['svg'])
+		_copy_payload(doc, el)
+
+	return missing
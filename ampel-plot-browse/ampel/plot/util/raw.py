@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-plot/ampel-plot-browse/ampel/plot/util/raw.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                17.10.2026
+# Last Modified Date:  17.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+import struct, bson # type: ignore[import]
+from bisect import bisect_left
+from typing import Any
+from collections.abc import Generator, Sequence
+from bson import ObjectId # type: ignore[import]
+
+# Decoding of raw BSON documents (see bson.raw_bson.RawBSONDocument) restricted to plots.
+# Sub-documents not containing the matched key are skipped using their encoded length,
+# plots are decoded with their (compressed) svg payloads referenced as memoryviews
+# of the raw document (no copy). Note that these memoryviews keep the raw document in memory.
+
+_int32 = struct.Struct('<i').unpack_from
+_int64 = struct.Struct('<q').unpack_from
+_double = struct.Struct('<d').unpack_from
+
+# Value sizes of fixed length BSON types
+_fixed = {
+	0x01: 8, 0x06: 0, 0x07: 12, 0x08: 1, 0x09: 8, 0x0A: 0,
+	0x10: 4, 0x11: 8, 0x12: 8, 0x13: 16, 0x7F: 0, 0xFF: 0
+}
+
+
+def decode_pruned(
+	raw: bytes | memoryview, match: str = 'plot', keep: Sequence[str] = ('_id', 'stock')
+) -> dict[str, Any]:
+	"""
+	:param raw: BSON document (RawBSONDocument.raw, memoryviews are copied once)
+	:param match: key of the sub-documents to decode (plots)
+	:param keep: top-level fields to decode as well
+	:returns: document restricted to the 'keep' fields and the values of 'match' keys
+	(including the dicts/lists leading to them). Elements of lists not leading to a matched key
+	are replaced with None so that list indexes (and the last element of lists) are preserved.
+	"""
+
+	if isinstance(raw, memoryview):
+		raw = raw.tobytes()
+
+	mv = memoryview(raw)
+	out: dict[str, Any] = {}
+
+	# Offsets of the encoded key (false positives, ex: string values, are harmless)
+	pat = match.encode('utf8') + b'\x00'
+	pos: list[int] = []
+	i = raw.find(pat)
+	while i != -1:
+		pos.append(i)
+		i = raw.find(pat, i + 1)
+
+	for t, k, vs, ve in _iter_elements(raw, 0):
+		if k == match or k in keep:
+			out[k] = _decode(raw, mv, t, vs, ve)
+		elif t in (0x03, 0x04) and _contains(pos, vs, ve):
+			if (sub := _prune(raw, mv, t, vs, match, pos)) is not None:
+				out[k] = sub
+
+	return out
+
+
+def decode_document(raw: bytes | memoryview) -> dict[str, Any]:
+	""" Decodes the whole document, binaries are returned as memoryviews """
+	if isinstance(raw, memoryview):
+		raw = raw.tobytes()
+	return _decode(raw, memoryview(raw), 0x03, 0, len(raw))
+
+
+def _contains(pos: list[int], start: int, end: int) -> bool:
+	i = bisect_left(pos, start)
+	return i < len(pos) and pos[i] < end
+
+
+def _prune(
+	raw: bytes, mv: memoryview, t: int, start: int, match: str, pos: list[int]
+) -> None | dict[str, Any] | list[Any]:
+
+	if t == 0x03:
+		d: dict[str, Any] = {}
+		for tt, k, vs, ve in _iter_elements(raw, start):
+			if k == match:
+				d[k] = _decode(raw, mv, tt, vs, ve)
+			elif tt in (0x03, 0x04) and _contains(pos, vs, ve):
+				if (sub := _prune(raw, mv, tt, vs, match, pos)) is not None:
+					d[k] = sub
+		return d or None
+
+	found = False
+	l: list[Any] = []
+	for tt, k, vs, ve in _iter_elements(raw, start):
+		if tt in (0x03, 0x04) and _contains(pos, vs, ve):
+			l.append(sub := _prune(raw, mv, tt, vs, match, pos))
+			found = found or sub is not None
+		else:
+			l.append(None)
+
+	return l if found else None
+
+
+def _iter_elements(raw: bytes, start: int) -> Generator[tuple[int, str, int, int], None, None]:
+	""" :returns: (type, key, value start, value end) of the elements of the document located at start """
+
+	end = start + _int32(raw, start)[0] - 1
+	i = start + 4
+
+	while i < end:
+		t = raw[i]
+		kend = raw.index(0, i + 1)
+		vs = kend + 1
+		ve = vs + _size(raw, t, vs)
+		yield t, raw[i + 1:kend].decode('utf8'), vs, ve
+		i = ve
+
+
+def _size(raw: bytes, t: int, i: int) -> int:
+
+	if t in _fixed:
+		return _fixed[t]
+	if t in (0x02, 0x0D, 0x0E): # string, js code, symbol
+		return 4 + _int32(raw, i)[0]
+	if t in (0x03, 0x04, 0x0F): # document, array, code with scope
+		return _int32(raw, i)[0]
+	if t == 0x05: # binary
+		return 5 + _int32(raw, i)[0]
+	if t == 0x0B: # regex
+		return raw.index(0, raw.index(0, i) + 1) + 1 - i
+	if t == 0x0C: # db pointer
+		return 16 + _int32(raw, i)[0]
+
+	raise ValueError(f"Unsupported BSON type: {t}")
+
+
+def _decode(raw: bytes, mv: memoryview, t: int, vs: int, ve: int) -> Any:
+
+	if t == 0x02:
+		return raw[vs + 4:ve - 1].decode('utf8')
+	if t == 0x03:
+		return {k: _decode(raw, mv, tt, s, e) for tt, k, s, e in _iter_elements(raw, vs)}
+	if t == 0x04:
+		return [_decode(raw, mv, tt, s, e) for tt, k, s, e in _iter_elements(raw, vs)]
+	if t == 0x05 and raw[vs + 4] == 0:
+		return mv[vs + 5:ve]
+	if t == 0x10:
+		return _int32(raw, vs)[0]
+	if t == 0x12:
+		return _int64(raw, vs)[0]
+	if t == 0x01:
+		return _double(raw, vs)[0]
+	if t == 0x08:
+		return raw[vs] == 1
+	if t == 0x0A:
+		return None
+	if t == 0x07:
+		return ObjectId(raw[vs:ve])
+
+	# Other types (datetime, decimal128, binary subtypes, ...) are decoded by bson
+	return bson.decode(
+		struct.pack('<i', ve - vs + 8) + bytes((t,)) + b'v\x00' + raw[vs:ve] + b'\x00'
+	)['v']
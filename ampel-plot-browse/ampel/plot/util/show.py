@@ -4,13 +4,14 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                16.11.2021
-# Last Modified Date:  13.01.2023
+# Last Modified Date:  17.10.2026
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-import os, webbrowser, tempfile, hashlib
-from typing import Any, TYPE_CHECKING
+import os, shutil, webbrowser, tempfile, hashlib
+from typing import Any, IO, TYPE_CHECKING
+from contextlib import contextmanager
 from appdirs import user_data_dir # type: ignore[import]
-from collections.abc import Callable
+from collections.abc import Callable, Generator
 from ampel.plot.util.transform import svg_to_png
 from ampel.model.PlotBrowseOptions import PlotBrowseOptions
 
@@ -41,9 +42,7 @@ def show_svg_plot(svg: "SVGPlot", pbo: PlotBrowseOptions) -> None:
 	elif pbo.html:
 		path = path.removesuffix(".svg") + ".html"
 		with open(path, 'w', encoding='utf-8') as fh:
-			fh.write(
-				svg._repr_html_(scale = pbo.scale)
-			)
+			svg.write_html(fh, scale = pbo.scale)
 
 	else:
 		with open(path, 'w', encoding='utf-8') as ft:
@@ -64,26 +63,73 @@ def show_collection(
 	db_name: None | str = None
 ) -> None:
 	"""
+	The html page is written plot by plot into the output file (see SVGCollection.write_html).
+	If pbo.external is set, plots are written as separate files into a directory
+	located next to the html file (named after it), the page then only references them.
+	Partially written files are removed if writing fails.
 	:param temp_dir: True: folder in /tmp, False: folder in ampel app dir
 	"""
 
-	if x := scol._repr_html_(
-		scale = pbo.scale, png_convert = pbo.png,
-		run_id = run_id, job_schema = job_schema, db_name = db_name
-	):
-
-		tmp_file = os.path.join(
-			_get_ampel_dir(temp_dir),
-			f"{db_name}_run_{run_id}.html" if (db_name and run_id)
-			else hashlib.md5(x.encode('utf8')).hexdigest() + ".html"
-		)
-
-		with open(tmp_file, 'w', encoding='utf-8') as fh:
-			fh.write(x)
-
-		webbrowser.open('file://' + tmp_file)
-	elif print_func:
-		print_func("Empty plot collection: nothing to display") # type: ignore[operator]
+	if not scol._svgs:
+		if print_func:
+			print_func("Empty plot collection: nothing to display") # type: ignore[operator]
+		return
+
+	base_dir = _get_ampel_dir(temp_dir)
+	kwargs: dict[str, Any] = {
+		'scale': pbo.scale, 'png_convert': pbo.png,
+		'run_id': run_id, 'job_schema': job_schema, 'db_name': db_name
+	}
+
+	if db_name and run_id:
+		tmp_file = os.path.join(base_dir, f"{db_name}_run_{run_id}.html")
+		if pbo.external:
+			kwargs['asset_dir'] = tmp_file.removesuffix('.html') + '_files'
+		with _remove_on_error(tmp_file, kwargs.get('asset_dir')), open(tmp_file, 'w', encoding='utf-8') as fh:
+			scol.write_html(fh, **kwargs)
+	elif pbo.external:
+		# Plot files are written into a new directory, the page is named after it
+		kwargs['asset_dir'] = tempfile.mkdtemp(dir=base_dir, prefix='plots_')
+		tmp_file = kwargs['asset_dir'] + '.html'
+		with _remove_on_error(tmp_file, kwargs['asset_dir']), open(tmp_file, 'w', encoding='utf-8') as fh:
+			scol.write_html(fh, **kwargs)
+	else:
+		# File named after the md5 digest of its content, computed while writing
+		tf = tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=base_dir, suffix='.html', delete=False)
+		with _remove_on_error(tf.name), tf:
+			hw = _HashWriter(tf)
+			scol.write_html(hw, **kwargs) # type: ignore[arg-type]
+		tmp_file = os.path.join(base_dir, hw.hexdigest() + ".html")
+		os.replace(tf.name, tmp_file)
+
+	webbrowser.open('file://' + tmp_file)
+
+
+@contextmanager
+def _remove_on_error(path: str, asset_dir: None | str = None) -> Generator[None, None, None]:
+	""" Removes the html file and the plot files directory (if any) when writing fails """
+	try:
+		yield
+	except BaseException:
+		if os.path.exists(path):
+			os.unlink(path)
+		if asset_dir:
+			shutil.rmtree(asset_dir, ignore_errors=True)
+		raise
+
+
+class _HashWriter:
+
+	def __init__(self, f: IO[str]) -> None:
+		self._f = f
+		self._md5 = hashlib.md5()
+
+	def write(self, s: str) -> int:
+		self._md5.update(s.encode('utf8'))
+		return self._f.write(s)
+
+	def hexdigest(self) -> str:
+		return self._md5.hexdigest()
 
 
 def _get_ampel_dir(temp_dir: bool = True) -> str:
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-plot/ampel-plot-browse/ampel/plot/util/tags.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                17.10.2026
+# Last Modified Date:  17.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from typing import Any
+from collections.abc import Callable
+from ampel.types import Tag
+from ampel.model.operator.AnyOf import AnyOf
+from ampel.model.operator.AllOf import AllOf
+from ampel.model.operator.OneOf import OneOf
+
+TagFilter = Callable[[frozenset[Tag]], bool]
+TagSchema = Tag | AllOf[Tag] | AnyOf[Tag] | OneOf[Tag] | dict[str, Any]
+
+
+def tag_set(tags: Any) -> frozenset[Tag]:
+	""" :param tags: 'tag' value of a plot or document (None, scalar or sequence) """
+	if not tags:
+		return frozenset()
+	if isinstance(tags, (int, str)):
+		return frozenset((tags,))
+	return frozenset(tags)
+
+
+def compile_tag_filter(
+	with_tag: None | TagSchema = None,
+	without_tag: None | TagSchema = None
+) -> None | TagFilter:
+	"""
+	Compiles tag matching criteria (same syntax as ampel.mongo.schema.apply_schema / apply_excl_schema)
+	into a predicate operating on frozensets of tags (see tag_set) that behaves like the DB query.
+	Criteria are parsed once, evaluating the returned predicate only involves set operations.
+
+	Example::
+
+		f = compile_tag_filter({'any_of': [{'all_of': ["a", "b"]}, "c"]}, "d")
+		f(frozenset(["a", "b"])) # True
+		f(frozenset(["c", "d"])) # False
+
+	:returns: None if no criteria were provided
+	"""
+
+	w = None if with_tag is None else _compile(with_tag, False)
+	wo = None if without_tag is None else _compile(without_tag, True)
+
+	if w and wo:
+		return lambda ts: w(ts) and wo(ts) # type: ignore[misc]
+
+	return w or wo
+
+
+def _compile(arg: TagSchema, exclude: bool) -> TagFilter:
+
+	if isinstance(arg, (AllOf, AnyOf, OneOf)):
+		arg = arg.dict()
+
+	if isinstance(arg, (int, str)):
+		if exclude:
+			return lambda ts: arg not in ts
+		return lambda ts: arg in ts
+
+	if not isinstance(arg, dict) or len(arg) != 1:
+		raise ValueError(f"Invalid tag schema: {arg}")
+
+	if 'all_of' in arg:
+		s = _flat(arg['all_of'], arg)
+		if exclude:
+			return lambda ts: not s.issubset(ts)
+		return s.issubset
+
+	if 'one_of' in arg:
+		# DB matches the exact tag array, order is not considered here
+		s = _flat(arg['one_of'], arg)
+		if exclude:
+			return s.__ne__
+		return s.__eq__
+
+	if 'any_of' not in arg:
+		raise ValueError(f"Invalid tag schema: {arg}")
+
+	values = frozenset(el for el in arg['any_of'] if isinstance(el, (int, str)))
+	groups = [
+		_flat(el['all_of'], el) for el in arg['any_of']
+		if isinstance(el, dict) and set(el) == {'all_of'}
+	]
+
+	if len(values) + len(groups) != len(arg['any_of']):
+		raise ValueError(f"Invalid tag schema: {arg}")
+
+	if not groups:
+		# Like apply_excl_schema ($not $all): non-nested any_of exclusions reject plots with all values
+		if exclude:
+			return lambda ts: not values.issubset(ts)
+		return lambda ts: not values.isdisjoint(ts)
+
+	if exclude:
+		return lambda ts: values.isdisjoint(ts) and not any(g.issubset(ts) for g in groups)
+	return lambda ts: not values.isdisjoint(ts) or any(g.issubset(ts) for g in groups)
+
+
+def _flat(seq: Any, arg: Any) -> frozenset[Tag]:
+	if isinstance(seq, (int, str)) or not all(isinstance(el, (int, str)) for el in seq):
+		raise ValueError(f"No further nesting allowed beyond 'all_of' / 'one_of': {arg}")
+	return frozenset(seq)
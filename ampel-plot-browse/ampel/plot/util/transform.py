@@ -4,16 +4,54 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                17.05.2019
-# Last Modified Date:  19.08.2022
+# Last Modified Date:  17.10.2026
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
+import re
 from typing import Literal
 import pyvips, base64 # type: ignore[import]
 
+# Root svg tag (xml prolog and comments can precede it)
+_svg_tag = re.compile(r'<svg\b[^>]*>')
+_svg_dim = re.compile(r'(?<![\w-])(width|height)\s*=\s*["\']\s*([0-9.]+)\s*(pt|pc|in|cm|mm|px)?\s*["\']')
+# Inches per physical unit
+_phys_units = {'pt': 1 / 72, 'pc': 1 / 6, 'in': 1.0, 'cm': 1 / 2.54, 'mm': 1 / 25.4}
+
 def svg_to_png(svg: str, dpi: int = 96, scale: float = 1.0) -> bytes:
 	image = pyvips.Image.svgload_buffer(bytes(svg, 'utf8'), dpi=dpi, scale=scale)
 	return image.write_to_buffer('.png')
 
+def svg_to_png_file(svg: str, path: str, dpi: int = 96, scale: float = 1.0) -> tuple[int, int]:
+	""" :returns: (width, height) of the written png """
+	image = pyvips.Image.svgload_buffer(bytes(svg, 'utf8'), dpi=dpi, scale=scale)
+	with open(path, 'wb') as f:
+		f.write(image.write_to_buffer('.png'))
+	return image.width, image.height
+
+def png_size(svg: str, dpi: int = 96, scale: float = 1.0) -> tuple[int, int]:
+	"""
+	:returns: (width, height) of the png produced by svg_to_png.
+	Only the svg header is loaded (no rendering). Note that libvips applies the dpi
+	to user units as well, png dimensions can thus not be derived from svg_size.
+	"""
+	image = pyvips.Image.svgload_buffer(bytes(svg, 'utf8'), dpi=dpi, scale=scale)
+	return image.width, image.height
+
+def svg_size(svg: str, dpi: int = 96, scale: float = 1.0) -> None | tuple[int, int]:
+	"""
+	:returns: (width, height) in pixels of the svg as displayed by browsers (according to the root tag attributes)
+	or None if the svg has no absolute size (unsupported unit, percentages, missing attribute).
+	User units (px or no unit) are not affected by dpi, physical units (pt, pc, in, cm, mm) are converted using dpi.
+	"""
+	if not (m := _svg_tag.search(svg, 0, 4096)):
+		return None
+	d: dict[str, float] = {}
+	for k, v, unit in _svg_dim.findall(m.group()):
+		d[k] = float(v) * (dpi * _phys_units[unit] if unit in _phys_units else 1.0) * scale
+	if len(d) != 2:
+		return None
+	return round(d['width']), round(d['height'])
+
 def svg_to_png_b64(svg: str, dpi: int = 96, scale: float = 1.0) -> str:
 	return str(
 		base64.b64encode(
@@ -4,63 +4,247 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                13.04.2022
-# Last Modified Date:  20.04.2022
+# Last Modified Date:  17.10.2026
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-import gc, bson # type: ignore[import]
+import bson # type: ignore[import]
 from time import sleep, time
+from datetime import datetime, timezone
+from typing import Any
+from collections.abc import Generator, Mapping
+from bson import ObjectId # type: ignore[import]
 from bson.codec_options import CodecOptions # type: ignore[import]
 from bson.raw_bson import RawBSONDocument # type: ignore[import]
 from pymongo.collection import Collection # type: ignore[import]
+from pymongo.errors import OperationFailure, InvalidOperation # type: ignore[import]
 from ampel.util.recursion import walk_and_process_dict
 from ampel.plot.SVGCollection import SVGCollection
 from ampel.model.PlotBrowseOptions import PlotBrowseOptions
 from ampel.plot.util.load import print_func, _gather_plots, _handle_json
+from ampel.plot.util.compression import use_db_dicts
+from ampel.plot.util.raw import decode_pruned
 
 
-def read_from_db(col: Collection, pbo: PlotBrowseOptions) -> None:
+class DBWatcher:
+	"""
+	Iterates over documents inserted (or updated) in a collection after the watcher was started.
+	MongoDB change streams are used if available (replica sets), the resume token of the last
+	change is available through the attribute resume_token and can be used to resume watching later.
+
+	Otherwise (standalone server, mongomock), the collection is tailed with exponential backoff
+	between empty queries. Tailing queries match the timestamps (see ts_field) or the ids (ObjectIds
+	are generated by clients and are not monotonic across writers) of the last 'overlap' seconds,
+	only the ids of matched documents are retrieved. Documents not yielded yet are then loaded.
+	Updates of existing documents are detected if a timestamp field updated by writers is tailed.
+	The tailed field should be indexed (_id always is).
+	"""
+
+	def __init__(self,
+		col: Collection,
+		resume_token: None | Mapping[str, Any] = None,
+		change_stream: bool = True,
+		min_wait: float = 0.05,
+		max_wait: float = 2.0,
+		overlap: float = 10.0,
+		ts_field: None | str = None
+	) -> None:
+		"""
+		:param resume_token: change stream token to resume after
+		:param change_stream: use change streams if available
+		:param min_wait: min time (seconds) between two tailing queries
+		:param max_wait: max time (seconds) between two tailing queries (reached after successive empty results)
+		:param overlap: time window (seconds) re-scanned by tailing queries, must exceed the time between
+		id (or timestamp) generation and document insertion plus the clock skew between writers
+		:param ts_field: tailed field, either '_id' or a field containing unix timestamps.
+		Defaults to 'meta.ts' (updated by ampel whenever plots are added to t documents),
+		except for the plot collection ('_id': plot documents are never updated)
+		"""
+		if ts_field is None:
+			ts_field = '_id' if col.name == 'plot' else 'meta.ts'
+		self._col = col
+		self.resume_token = resume_token
+		self.change_stream = change_stream
+		self.min_wait = min_wait
+		self.max_wait = max_wait
+		self.overlap = overlap
+		#: tailed timestamp field (None: _id)
+		self.ts_field = None if ts_field == '_id' else ts_field
+		#: _id of the last document yielded by tailing queries
+		self.last_id: None | ObjectId = None
+		#: 'change_stream' or 'tailing' once iteration has started
+		self.mode: None | str = None
+		# Tailing: id -> timestamp of the documents yielded (or existing at startup) within the overlap window
+		self._seen: dict[ObjectId, float] = {}
+		self._since: None | float = None
+
+
+	def __iter__(self) -> Generator[Any, None, None]:
+
+		start = None
+		if self._since is None and not self.resume_token:
+			if self.change_stream:
+				# The change stream starts before the scan below: changes applied in the meantime are not missed
+				start = self._operation_time()
+			# Documents inserted while failing to open the change stream are found by tailing queries
+			self._since = self._scan(self._latest_ts())[1]
+
+		if self.change_stream:
+			try:
+				stream = self._col.watch(
+					[{'$match': {'operationType': {'$in': ['insert', 'update', 'replace']}}}],
+					full_document = 'updateLookup',
+					resume_after = self.resume_token,
+					start_at_operation_time = start
+				)
+			# Standalone servers raise OperationFailure, mongomock (no watch method) raises TypeError
+			except (OperationFailure, InvalidOperation, NotImplementedError, TypeError):
+				pass
+			else:
+				self.mode = 'change_stream'
+				with stream:
+					for change in stream:
+						self.resume_token = stream.resume_token
+						if (doc := change.get('fullDocument')) is not None:
+							yield doc
+				return
+
+		self.mode = 'tailing'
+		yield from self._tail()
+
+
+	def _operation_time(self) -> Any:
+		""" :returns: current cluster time (replica sets) or None """
+		try:
+			return self._col.database.command('ping').get('operationTime')
+		except (OperationFailure, NotImplementedError):
+			return None
+
+
+	def _tail(self) -> Generator[Any, None, None]:
+
+		if self._since is None:
+			self._since = self._scan(self._latest_ts())[1]
+
+		wait = self.min_wait
+		while True:
+
+			new, since = self._scan(self._since, mark=False)
+
+			if new:
+				for doc in self._col.find({'_id': {'$in': list(new)}}).sort('_id', 1):
+					self._seen[doc['_id']] = new[doc['_id']]
+					self.last_id = doc['_id']
+					yield doc
+				wait = self.min_wait
+			else:
+				sleep(wait)
+				wait = min(wait * 2, self.max_wait)
+
+			self._since = since
+			limit = since - self.overlap
+			self._seen = {k: v for k, v in self._seen.items() if v >= limit}
+
+
+	def _scan(self, since: float, mark: bool = True) -> tuple[dict[ObjectId, float], float]:
+		"""
+		Retrieves the ids and timestamps of the documents of the overlap window preceding 'since'
+		:param mark: mark matched documents as seen (startup)
+		:returns: ids of the documents not yielded yet (or updated since) -> timestamp, new value of since
+		"""
+
+		new: dict[ObjectId, float] = {}
+		if self.ts_field:
+			match: dict[str, Any] = {self.ts_field: {'$gte': since - self.overlap}}
+		else:
+			match = {
+				'_id': {'$gte': ObjectId.from_datetime(datetime.fromtimestamp(since - self.overlap, timezone.utc))}
+			}
+
+		for el in self._col.find(match, {self.ts_field or '_id': 1}):
+			ts = self._get_ts(el)
+			since = max(since, ts)
+			if mark:
+				self._seen[el['_id']] = ts
+			elif self._seen.get(el['_id'], -1) < ts:
+				new[el['_id']] = ts
+
+		return new, since
+
+
+	def _latest_ts(self) -> float:
+		""" :returns: timestamp of the most recent document (current time if the collection is empty) """
+		f = self.ts_field or '_id'
+		if (doc := next(self._col.find({}, {f: 1}).sort(f, -1).limit(1), None)):
+			if not self.ts_field:
+				self.last_id = doc['_id']
+			return self._get_ts(doc)
+		return time()
+
+
+	def _get_ts(self, doc: dict[str, Any]) -> float:
+
+		if not self.ts_field:
+			return doc['_id'].generation_time.timestamp()
+
+		# Values of lists of sub-documents (ex: T2 documents meta) are gathered
+		vals: list[Any] = [doc]
+		for k in self.ts_field.split('.'):
+			vals = [
+				el[k] for v in vals for el in (v if isinstance(v, list) else [v])
+				if isinstance(el, Mapping) and k in el
+			]
+		ts = [el for v in vals for el in (v if isinstance(v, list) else [v]) if isinstance(el, (int, float))]
+		return max(ts) if ts else -1
+
+
+def read_from_db(
+	col: Collection, pbo: PlotBrowseOptions,
+	watcher: None | DBWatcher = None, ts_field: None | str = None
+) -> None:
+	"""
+	:param watcher: custom watcher (a watcher on the raw version of the collection is created otherwise)
+	:param ts_field: see DBWatcher ('meta.ts' by default, '_id' for the plot collection)
+	"""
 
 	try:
 
 		print_func(f"Waching {col.database.name}->{col.name}")
-		last_doc = next(col.find({'_id': -1}).limit(1), None)
-		latest_ts = last_doc['meta']['ts'] if last_doc else time()
 
 		plots_col = col.database.get_collection('plot')
-		col = col.database.get_collection(
-			col.name,
-			codec_options = CodecOptions(document_class=RawBSONDocument)
-		)
+		use_db_dicts(col.database.get_collection('plotdict'))
 
-		while True:
+		if watcher is None:
+			try:
+				col = col.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+			except NotImplementedError: # mongomock
+				pass
+			watcher = DBWatcher(col, ts_field=ts_field)
 
-			for rdoc in col.find({'meta.ts': {'$gt': latest_ts}}):
+		for rdoc in watcher:
 
-				print_func("*"*20)
+			print_func("*"*20)
+			if isinstance(rdoc, RawBSONDocument):
 				print_func(f"Loaded doc size: {round(len(rdoc.raw)/1024/1024, 2)} MBytes")
-				doc = bson.decode(rdoc.raw)
-				if doc['meta']['ts'] > latest_ts:
-					latest_ts = doc['meta']['ts']
-
-				scol = SVGCollection()
-				plots: list[dict] = []
-
-				walk_and_process_dict(
-					arg = doc,
-					callback = _gather_plots,
-					match = ['plot'],
-					plots = plots,
-					debug = pbo.debug
-				)
+				# Only plots are decoded
+				doc = decode_pruned(rdoc.raw, keep=('_id',))
+			else:
+				doc = rdoc
 
-				_handle_json(
-					plots if plots else doc,
-					scol, plots_col, pbo, concatenate = False
-				)
+			scol = SVGCollection()
+			plots: list[dict] = []
 
-			gc.collect()
-			sleep(1)
+			walk_and_process_dict(
+				arg = doc,
+				callback = _gather_plots,
+				match = ['plot'],
+				plots = plots,
+				debug = pbo.debug
+			)
 
+			_handle_json(
+				plots if plots else (bson.decode(rdoc.raw) if isinstance(rdoc, RawBSONDocument) else doc),
+				scol, plots_col, pbo, concatenate = False
+			)
 
 	except KeyboardInterrupt:
 		import sys
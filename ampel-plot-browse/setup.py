@@ -18,5 +18,6 @@ setup(
 		'data': ['*.html', '**/*.htm']
 	},
 	python_requires = '>=3.10,<3.12',
-	install_requires = ["ampel-plot", "pyperclip", "pynput", "pyvips", "pygments", "pyyaml"]
+	install_requires = ["ampel-plot", "pyperclip", "pynput", "pyvips", "pygments", "pyyaml"],
+	extras_require = {"ORJSON": ["orjson"], "XFIXES": ["python-xlib"]}
 )
@@ -0,0 +1,96 @@
+"""
+Latency of plot queries (see SVGQuery) before and after creating the indexes
+proposed by 'ampel plot index' (see ampel.plot.util.index).
+Usage: python benchmark_index.py [number of documents] [mongodb uri]
+Without uri, mongomock is used: mongomock does not use indexes (nor supports explain),
+latencies are then expected to be unchanged. Use a local mongod for meaningful results.
+"""
+
+import sys
+from statistics import median
+from time import perf_counter
+from typing import Any
+from ampel.plot.SVGQuery import SVGQuery
+from ampel.plot.util.index import get_index_keys, get_plot_index_keys, explain_query
+
+
+def populate(db: Any, n_docs: int, n_runs: int = 10) -> None:
+
+	db.t2.insert_many(
+		{
+			'stock': i, 'unit': 'T2LightCurvePlot' if i % 2 else 'T2SNCosmo', 'config': 1,
+			'meta': [{'run': i % n_runs, 'ts': i}],
+			'body': [{'data': {'plot': [{'name': f"{i}.svg", 'tag': ['LIGHTCURVE', 'ZTF'], 'svg': b'svg'}]}}]
+		}
+		for i in range(n_docs)
+	)
+
+	db.plot.insert_many(
+		{'run': i % n_runs, 'name': f"{i}.svg", 'tag': ['LIGHTCURVE', 'SNIA' if i % 3 else 'SNII'], 'svg': b'svg'}
+		for i in range(n_docs)
+	)
+
+
+def get_queries(n_docs: int) -> dict[str, SVGQuery]:
+	return {
+		't2 stock': SVGQuery('t2', stock=list(range(0, n_docs, n_docs // 10 or 1))),
+		't2 unit+run': SVGQuery('t2', unit='T2LightCurvePlot', run_id=3),
+		'plot run+tag': SVGQuery('plot', path='', run_id=3, plot_tag={'with': 'SNII'})
+	}
+
+
+def measure(db: Any, queries: dict[str, SVGQuery], repeat: int) -> dict[str, dict[str, Any]]:
+	""" :returns: query name -> {'ms' (median latency), 'returned', 'docs_examined'} """
+
+	res = {}
+	for k, q in queries.items():
+		col = db[q.col]
+		times = []
+		for i in range(repeat):
+			t = perf_counter()
+			n = sum(1 for _ in col.find(q.get_query(), q.get_projection()))
+			times.append(perf_counter() - t)
+		res[k] = {'ms': median(times) * 1000, 'returned': n, 'docs_examined': explain_query(col, q)['docs_examined']}
+	return res
+
+
+def run(n_docs: int = 100_000, uri: None | str = None, repeat: int = 5) -> dict[str, dict[str, dict[str, Any]]]:
+	""" :returns: 'before' / 'after' -> query name -> results (see measure) """
+
+	if uri:
+		from pymongo import MongoClient # type: ignore[import]
+	else:
+		from mongomock import MongoClient # type: ignore[import]
+
+	client = MongoClient(uri)
+	client.drop_database("ampel_plot_benchmark")
+	db = client["ampel_plot_benchmark"]
+
+	try:
+		populate(db, n_docs)
+		queries = get_queries(n_docs)
+		res = {'before': measure(db, queries, repeat)}
+		for q in queries.values():
+			db[q.col].create_index(
+				get_plot_index_keys(db.plot) if q.col == 'plot' else get_index_keys(q, db[q.col])
+			)
+		res['after'] = measure(db, queries, repeat)
+		return res
+	finally:
+		client.drop_database("ampel_plot_benchmark")
+
+
+def main() -> None:
+	n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+	res = run(n, sys.argv[2] if len(sys.argv) > 2 else None)
+	print(f"{'query':>14} {'returned':>9} {'ms before':>10} {'ms after':>9} {'examined before':>16} {'examined after':>15}")
+	for k, b in res['before'].items():
+		a = res['after'][k]
+		print(
+			f"{k:>14} {b['returned']:>9} {b['ms']:10.2f} {a['ms']:9.2f} "
+			f"{b['docs_examined']!s:>16} {a['docs_examined']!s:>15}"
+		)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,62 @@
+"""
+Decoding of T3 like documents (large bodies, few plots): full BSON decoding vs
+ampel.plot.util.raw.decode_pruned (only plots are decoded).
+Usage: python benchmark_raw.py [number of documents]
+"""
+
+import os, sys, bson # type: ignore[import]
+from time import perf_counter
+from bson import ObjectId # type: ignore[import]
+from ampel.plot.util.raw import decode_pruned
+
+
+def make_doc(n_points: int = 2000, n_bodies: int = 3, svg_size: int = 20_000) -> bytes:
+	""" :returns: encoded document with light curves of n_points datapoints and one plot per body """
+	return bson.encode({
+		'_id': ObjectId(),
+		'stock': 123456,
+		'body': [
+			{
+				'data': {
+					'lightcurve': [
+						{'jd': 2459000.5 + i, 'mag': 18.5, 'magerr': 0.05, 'fid': i % 3, 'candid': 10**15 + i, 'ra': 12.3, 'dec': 45.6}
+						for i in range(n_points)
+					],
+					'meta': {'version': '1.0', 'flags': list(range(100))},
+					'plot': [{'name': f'p{j}.svg', 'title': 't', 'tag': ['LC', 'SNIA'], 'svg': os.urandom(svg_size)}]
+				}
+			}
+			for j in range(n_bodies)
+		]
+	})
+
+
+def run(n_docs: int = 100, repeat: int = 3, **kwargs) -> dict[str, float]:
+	""" :returns: best time per document (seconds) of both methods and the speedup """
+
+	docs = [make_doc(**kwargs) for i in range(n_docs)]
+	res: dict[str, float] = {}
+	for name, f in (('bson.decode', bson.decode), ('decode_pruned', decode_pruned)):
+		times = []
+		for i in range(repeat):
+			t = perf_counter()
+			for raw in docs:
+				f(raw)
+			times.append((perf_counter() - t) / n_docs)
+		res[name] = min(times)
+
+	res['speedup'] = res['bson.decode'] / res['decode_pruned']
+	return res
+
+
+def main() -> None:
+	n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+	res = run(n)
+	print(f"Document size: {len(make_doc()) / 1024:.0f} KB")
+	for k in ('bson.decode', 'decode_pruned'):
+		print(f"{k:>15}: {res[k] * 1000:8.3f} ms/doc")
+	print(f"{'speedup':>15}: {res['speedup']:8.1f}x")
+
+
+if __name__ == "__main__":
+	main()
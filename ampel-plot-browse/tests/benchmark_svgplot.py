@@ -0,0 +1,69 @@
+"""
+Memory used per plot (excluding the svg payload) by plot records as loaded from the DB
+(kept by SVGPlot instances previously) and by SVGPlot / SVGCollection.
+Usage: python benchmark_svgplot.py [number of plots]
+"""
+
+import gc, os, sys, tracemalloc
+from typing import Any
+from collections.abc import Callable
+from bson import ObjectId # type: ignore[import]
+from ampel.plot.SVGPlot import SVGPlot
+from ampel.plot.SVGCollection import SVGCollection
+
+
+def make_record(i: int, payload: bytes) -> dict[str, Any]:
+	""" Plot document of the plot collection (strings are new objects, as returned by bson.decode) """
+	return {
+		'_id': ObjectId(),
+		'name': f"ZTF{i:08d}_lightcurve.svg",
+		'title': f"ZTF{i:08d}\nSALT2 fit",
+		'tag': [''.join(('LIGHT', 'CURVE')), ''.join(('SAL', 'T2')), ''.join(('Z', 'TF'))],
+		'svg': payload,
+		'codec': ''.join(('ZS', 'TD')),
+		'hash': f"{i:032x}",
+		'fingerprint': f"{i:032x}",
+		'run': [1, 2],
+		'oid': f"ZTF{i:08d}"
+	}
+
+
+def measure(f: Callable[[], Any], n: int) -> float:
+	""" :returns: memory (bytes) retained by the object returned by f, per plot """
+	gc.collect()
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	obj = f()
+	gc.collect()
+	size = tracemalloc.get_traced_memory()[0] - before
+	tracemalloc.stop()
+	del obj
+	return size / n
+
+
+def run(n: int = 100_000) -> dict[str, float]:
+
+	# Shared payload, not accounted
+	payload = os.urandom(1000)
+
+	def collection() -> SVGCollection:
+		scol = SVGCollection()
+		for i in range(n):
+			scol.add_svg_dict(make_record(i, payload)) # type: ignore[arg-type]
+		return scol
+
+	return {
+		'record': measure(lambda: [make_record(i, payload) for i in range(n)], n),
+		'SVGPlot': measure(lambda: [SVGPlot(make_record(i, payload)) for i in range(n)], n), # type: ignore[arg-type]
+		'SVGCollection': measure(collection, n)
+	}
+
+
+def main() -> None:
+	n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+	for k, v in run(n).items():
+		print(f"{k:>14}: {v:6.0f} bytes per plot")
+
+
+if __name__ == "__main__":
+	main()
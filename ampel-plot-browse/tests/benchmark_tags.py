@@ -0,0 +1,84 @@
+"""
+Time per plot of tag matching: compiled frozenset predicates (see ampel.plot.util.tags)
+vs the previous per-plot isinstance dispatch with linear scans of tag lists.
+Usage: python benchmark_tags.py [number of tag sets]
+"""
+
+import random, sys
+from time import perf_counter
+from typing import Any
+from ampel.model.operator.AllOf import AllOf
+from ampel.model.operator.AnyOf import AnyOf
+from ampel.model.operator.OneOf import OneOf
+from ampel.plot.util.tags import compile_tag_filter, tag_set
+
+vocabulary = [
+	'LIGHTCURVE', 'SNCOSMO', 'SALT2', 'ZTF', 'LSST', 'SNIA', 'SNII', 'SNIBC', 'TDE', 'AGN',
+	'FIT', 'RESIDUALS', 'CORNER', 'HOST', 'CUTOUT', 'SCIENCE', 'REFERENCE', 'DIFFERENCE', 'T2', 'T3'
+]
+
+# Criteria supported by the previous implementation
+criteria: dict[str, Any] = {
+	'tag': 'SALT2',
+	'all_of': AllOf(all_of=['LIGHTCURVE', 'SALT2', 'ZTF']),
+}
+
+
+def legacy_match(wqt: Any, tags: Any) -> bool:
+	""" Previous implementation (SVGLoader._load_plots) """
+	return not (
+		(isinstance(wqt, AllOf) and not all(x in tags for x in wqt.all_of)) or
+		(isinstance(wqt, AnyOf) and not [y in tags for y in wqt.any_of]) or
+		(isinstance(wqt, OneOf) and not wqt.any_of == [tags]) or
+		(isinstance(wqt, (int, str)) and wqt not in tags)
+	)
+
+
+def make_tags(n: int, seed: int = 0) -> list[list[str]]:
+	rng = random.Random(seed)
+	return [rng.sample(vocabulary, rng.randint(1, 6)) for i in range(n)]
+
+
+def run(n: int = 1_000_000) -> dict[str, dict[str, float]]:
+	"""
+	:returns: criteria -> {'legacy', 'compiled' (tag lists converted with tag_set), 'compiled_sets'
+	(precomputed tag sets, as held by SVGPlot)} -> ns per tag set
+	"""
+
+	tags = make_tags(n)
+	sets = [tag_set(el) for el in tags]
+	res: dict[str, dict[str, float]] = {}
+
+	for k, wqt in criteria.items():
+
+		f = compile_tag_filter(wqt)
+		assert f is not None
+
+		t = perf_counter()
+		legacy = [el for el in tags if legacy_match(wqt, el)]
+		tl = perf_counter() - t
+
+		t = perf_counter()
+		compiled = [el for el in tags if f(tag_set(el))]
+		tc = perf_counter() - t
+
+		t = perf_counter()
+		compiled_sets = [el for el in sets if f(el)]
+		ts = perf_counter() - t
+
+		assert legacy == compiled and len(compiled) == len(compiled_sets)
+		res[k] = {'legacy': tl / n * 1e9, 'compiled': tc / n * 1e9, 'compiled_sets': ts / n * 1e9}
+
+	return res
+
+
+def main() -> None:
+	n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+	print(f"{n} tag sets, ns per tag set")
+	print(f"{'criteria':>9} {'legacy':>8} {'compiled':>9} {'compiled (sets)':>16}")
+	for k, v in run(n).items():
+		print(f"{k:>9} {v['legacy']:8.0f} {v['compiled']:9.0f} {v['compiled_sets']:16.0f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,107 @@
+import io, os, re, struct
+import pytest
+from ampel.plot import SVGPlot as svgplot_module
+from ampel.plot.codec import get_codec
+from ampel.plot.SVGPlot import SVGPlot
+from ampel.plot.SVGCollection import SVGCollection
+from ampel.plot.util.transform import svg_size, png_size
+
+svg = '<svg xmlns="http://www.w3.org/2000/svg" width="72pt" height="36pt">' + \
+	'<rect width="10" height="10"/>' + '</svg>'
+
+
+def compress(s: str) -> bytes:
+	c = get_codec("ZIP_DEFLATED").compressor("svg")
+	c.write(s.encode())
+	return c.finish()
+
+
+def get_collection(n: int) -> SVGCollection:
+	scol = SVGCollection()
+	payload = compress(svg)
+	for i in range(n):
+		scol.add_svg_dict({'name': f'p/{i}', 'title': 't', 'tag': ['A'], 'svg': payload})
+	return scol
+
+
+def test_write_assets_decompress_once(tmp_path, monkeypatch):
+
+	calls = []
+	decompress = svgplot_module.decompress_svg
+	monkeypatch.setattr(
+		svgplot_module, "decompress_svg",
+		lambda *args: calls.append(1) or decompress(*args) # type: ignore[func-returns-value]
+	)
+
+	# More plots than decompressed svgs kept in memory (SVGPlot.max_decompressed)
+	n = svgplot_module.SVGPlot.max_decompressed + 50 # type: ignore[operator]
+	out = io.StringIO()
+	get_collection(n).write_html(out, asset_dir=str(tmp_path / "assets"))
+
+	assert len(calls) == n
+	assert len(os.listdir(tmp_path / "assets")) == n
+	html = out.getvalue()
+	assert html.count('<img class=mainimg loading="lazy" src="assets/') == n
+	assert html.count('width="96" height="48"') == n
+
+
+def read_png_size(path) -> tuple[int, int]:
+	with open(path, "rb") as f:
+		head = f.read(24)
+	assert head[:8] == b'\x89PNG\r\n\x1a\n'
+	return struct.unpack('>II', head[16:24])
+
+
+def test_write_assets_png(tmp_path):
+
+	pytest.importorskip("pyvips")
+	out = io.StringIO()
+	get_collection(3).write_html(out, asset_dir=str(tmp_path / "assets"), png_convert=144)
+
+	files = sorted(os.listdir(tmp_path / "assets"))
+	assert files == ['0_p_0.png', '1_p_1.png', '2_p_2.png']
+
+	# Dimensions of img tags match the rendered pngs
+	tags = re.findall(r'src="assets/([^"]+)" width="(\d+)" height="(\d+)"', out.getvalue())
+	assert len(tags) == 3
+	for name, w, h in tags:
+		assert read_png_size(tmp_path / "assets" / name) == (int(w), int(h))
+
+
+@pytest.mark.parametrize("dim", ['100', '100px', '72pt', '6pc', '1in', '2.54cm', '25.4mm'])
+@pytest.mark.parametrize("dpi", [72, 96, 144])
+@pytest.mark.parametrize("scale", [1.0, 1.5])
+def test_png_size(tmp_path, dim, dpi, scale):
+
+	pytest.importorskip("pyvips")
+	s = f'<svg xmlns="http://www.w3.org/2000/svg" width="{dim}" height="{dim}"><rect width="1" height="1"/></svg>'
+	path = tmp_path / "p.png"
+	size = SVGPlot({'name': 'p', 'title': 't', 'tag': [], 'svg': s}).write_file(str(path), scale, dpi) # type: ignore[typeddict-item]
+
+	assert size == read_png_size(path)
+	assert png_size(s, dpi, scale) == size
+	out = io.StringIO()
+	SVGPlot({'name': 'p', 'title': 't', 'tag': [], 'svg': s}).write_html( # type: ignore[typeddict-item]
+		out, scale = scale, png_convert = dpi, src = 'p.png'
+	)
+	assert f'width="{size[0]}" height="{size[1]}"' in out.getvalue()
+
+
+def test_svg_size():
+
+	s = '<svg xmlns="http://www.w3.org/2000/svg" width="%s" height="%s"></svg>'
+	# User units are css pixels, physical units are converted at the given dpi
+	assert svg_size(s % ('100', '50px')) == (100, 50)
+	assert svg_size(s % ('100', '50px'), dpi=144) == (100, 50)
+	assert svg_size(s % ('72pt', '1in')) == (96, 96)
+	assert svg_size(s % ('72pt', '1in'), dpi=144, scale=2) == (288, 288)
+	assert svg_size(s % ('2.54cm', '25.4mm'), dpi=300) == (300, 300)
+	assert svg_size(s % ('100%', '100%')) is None
+
+
+def test_write_embedded_png():
+
+	pytest.importorskip("pyvips")
+	out = io.StringIO()
+	get_collection(3).write_html(out, png_convert=96)
+	assert out.getvalue().count('<img class=mainimg src="data:image/png;base64,') == 3
@@ -0,0 +1,40 @@
+import weakref
+from ampel.plot.SVGPlot import SVGPlot
+from benchmark_svgplot import make_record, run
+
+
+class Data(dict):
+	pass
+
+
+def test_record_fields_not_referenced():
+
+	data = Data(chi2=1.2)
+	ref = weakref.ref(data)
+	rec = make_record(0, b"") | {'svg': "<svg/>", 'codec': None, 'data': data}
+	plot = SVGPlot(rec) # type: ignore[arg-type]
+	del rec, data
+	assert ref() is None
+	assert not hasattr(plot, '__dict__')
+	assert plot.get_file_name() == "ZTF00000000_lightcurve.svg"
+	assert plot.get_oid() == "ZTF00000000"
+	assert plot.get_svg() == "<svg/>"
+	assert plot.has_tags(['LIGHTCURVE', 'ZTF'])
+
+
+def test_shared_tags():
+	p1, p2 = SVGPlot(make_record(1, b"")), SVGPlot(make_record(2, b"")) # type: ignore[arg-type]
+	assert p1._tags is p2._tags and p1._tag_set is p2._tag_set
+	assert "['LIGHTCURVE', 'SALT2', 'ZTF']" in p1._get_tags()
+
+
+def test_set_title():
+	plot = SVGPlot(make_record(0, b"")) # type: ignore[arg-type]
+	plot.set_title(plot.get_title() + "\nrun 2")
+	assert plot.get_title() == "ZTF00000000\nSALT2 fit\nrun 2"
+	assert "SALT2 fit<br/>run 2" in plot._get_title()
+
+
+def test_benchmark():
+	res = run(1000)
+	assert res['SVGPlot'] < res['record']
@@ -0,0 +1,113 @@
+import pytest
+from ampel.plot.util import clipboard as module
+from ampel.plot.util.clipboard import ClipboardBackend, MacClipboardBackend
+
+
+class FakeClock:
+	""" Replaces time.monotonic/time.sleep: sleeping advances the clock """
+
+	def __init__(self) -> None:
+		self.now = 0.
+		self.sleeps = 0
+
+	def monotonic(self) -> float:
+		return self.now
+
+	def sleep(self, t: float) -> None:
+		assert t > 0
+		self.sleeps += 1
+		self.now += t
+
+
+class DummyClipboard:
+
+	def __init__(self) -> None:
+		self.value = "init"
+		self.reads = 0
+
+	def paste(self) -> str:
+		self.reads += 1
+		return self.value
+
+
+class DummyPasteboard:
+
+	def __init__(self) -> None:
+		self.count = 0
+		self.reads = 0
+
+	def changeCount(self) -> int:
+		self.reads += 1
+		return self.count
+
+
+@pytest.fixture
+def clock(monkeypatch):
+	c = FakeClock()
+	monkeypatch.setattr(module.time, "monotonic", c.monotonic)
+	monkeypatch.setattr(module.time, "sleep", c.sleep)
+	return c
+
+
+@pytest.fixture
+def clipboard(monkeypatch, clock):
+	import pyperclip # type: ignore[import]
+	cb = DummyClipboard()
+	monkeypatch.setattr(pyperclip, "paste", cb.paste)
+	return cb
+
+
+# Binary exact values: no rounding in the fake clock
+interval = 0.25
+timeout = 0.0625
+
+
+def wait_for(backend: ClipboardBackend, clock: FakeClock, duration: float) -> int:
+	""" Calls wait() like read_from_clipboard with a gui callback, returns the number of calls """
+	calls = 0
+	while clock.now < duration:
+		assert not backend.wait(timeout)
+		calls += 1
+	return calls
+
+
+def test_polling_rate(clipboard, clock):
+
+	backend = ClipboardBackend()
+	backend.interval = interval
+	assert clipboard.reads == 1
+
+	# wait() returns after each timeout (gui callback) but reads the clipboard once per interval only
+	# Reads at t = 0, 0.25, 0.5, 0.75, 1.0 (in addition to the read at startup)
+	assert wait_for(backend, clock, 1.0) == 16
+	assert clipboard.reads == 1 + 5
+	assert clock.sleeps == 16
+
+
+def test_change_detected(clipboard, clock):
+
+	backend = ClipboardBackend()
+	backend.interval = interval
+	assert not backend.wait(timeout)
+	clipboard.value = '{"a": 1}'
+	# Detected by the next scheduled read
+	assert backend.wait(1)
+	assert clock.now == interval
+	assert backend.read() == '{"a": 1}'
+	assert not backend.wait(timeout)
+	assert clipboard.reads == 3
+
+
+def test_mac_polling_rate(clock):
+
+	backend = MacClipboardBackend.__new__(MacClipboardBackend)
+	backend._board = board = DummyPasteboard() # type: ignore[attr-defined]
+	backend._count = 0 # type: ignore[attr-defined]
+	backend.interval = interval
+
+	assert wait_for(backend, clock, 1.0) == 16
+	assert board.reads == 5
+
+	board.count += 1
+	assert backend.wait(1)
+	assert board.reads == 6
@@ -0,0 +1,29 @@
+import pytest
+from ampel.plot.SVGQuery import SVGQuery
+from ampel.plot.util.index import get_index_keys, get_plot_index_keys, plot_index, has_index
+from benchmark_index import populate, get_queries, run
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def test_plot_tag_query():
+	assert SVGQuery('plot', path='', run_id=3, plot_tag={'with': 'SNII'}).get_query() == {'tag': 'SNII', 'run': 3}
+	assert 'body.data.plot.tag' in SVGQuery('t2', plot_tag={'with': 'SNII'}).get_query()
+
+
+def test_index_keys():
+	db = mongomock.MongoClient().db
+	populate(db, 20)
+	queries = get_queries(20)
+	assert get_index_keys(queries['t2 stock'], db.t2) == [('stock', 1)]
+	assert get_index_keys(queries['t2 unit+run'], db.t2) == [('meta.run', 1), ('unit', 1)]
+	assert get_plot_index_keys(db.plot) == plot_index
+	db.plot.create_index(plot_index)
+	assert has_index(db.plot, plot_index[:2])
+
+
+def test_benchmark():
+	res = run(n_docs=300, repeat=1)
+	for k, v in res['before'].items():
+		assert v['returned'] > 0
+		assert res['after'][k]['returned'] == v['returned']
@@ -0,0 +1,35 @@
+import bson # type: ignore[import]
+import pytest
+from ampel.plot.util.raw import decode_pruned, decode_document
+from benchmark_raw import make_doc, run
+
+
+@pytest.mark.parametrize("as_memoryview", [False, True])
+def test_decode_pruned(as_memoryview):
+
+	raw = make_doc(n_points=10, n_bodies=3)
+	doc = bson.decode(raw)
+	res = decode_pruned(memoryview(raw) if as_memoryview else raw)
+
+	assert res['_id'] == doc['_id'] and res['stock'] == doc['stock']
+	assert len(res['body']) == 3
+	for b, rb in zip(doc['body'], res['body']):
+		assert 'lightcurve' not in rb['data'] and 'meta' not in rb['data']
+		p, rp = b['data']['plot'][0], rb['data']['plot'][0]
+		assert isinstance(rp['svg'], memoryview)
+		assert bytes(rp['svg']) == p['svg']
+		assert {k: v for k, v in rp.items() if k != 'svg'} == {k: v for k, v in p.items() if k != 'svg'}
+
+
+@pytest.mark.parametrize("as_memoryview", [False, True])
+def test_decode_document(as_memoryview):
+
+	raw = make_doc(n_points=10, n_bodies=1)
+	res = decode_document(memoryview(raw) if as_memoryview else raw)
+	res['body'][0]['data']['plot'][0]['svg'] = bytes(res['body'][0]['data']['plot'][0]['svg'])
+	assert res == bson.decode(raw)
+
+
+def test_benchmark():
+	res = run(n_docs=2, repeat=1, n_points=100)
+	assert res['bson.decode'] > 0 and res['decode_pruned'] > 0
@@ -0,0 +1,72 @@
+import os, tempfile, webbrowser
+import pytest
+from ampel.plot.SVGCollection import SVGCollection
+from ampel.plot.util.show import show_collection
+from ampel.model.PlotBrowseOptions import PlotBrowseOptions
+
+svg = '<svg xmlns="http://www.w3.org/2000/svg" width="10pt" height="10pt">' + \
+	'<path d="M 0 0 L 1 1"/>' * 100 + '</svg>'
+
+
+def get_collection(n: int) -> SVGCollection:
+	scol = SVGCollection()
+	for i in range(n):
+		scol.add_svg_dict({'name': f'p{i}', 'title': f'plot {i}', 'tag': ['A', 'B'], 'svg': svg})
+	return scol
+
+
+@pytest.fixture
+def plot_dir(tmp_path, monkeypatch):
+	monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+	monkeypatch.setattr(webbrowser, "open", lambda url: None)
+	return tmp_path / "ampel" / "plots"
+
+
+def test_show_collection(plot_dir):
+	show_collection(get_collection(3), PlotBrowseOptions())
+	files = os.listdir(plot_dir)
+	assert len(files) == 1 and files[0].endswith(".html")
+
+
+@pytest.mark.parametrize("external", [False, True])
+@pytest.mark.parametrize("run", [False, True])
+def test_show_collection_error_cleanup(plot_dir, monkeypatch, external, run):
+
+	def write_html(out, **kwargs):
+		out.write("<html>")
+		if kwargs.get('asset_dir'):
+			os.makedirs(kwargs['asset_dir'], exist_ok=True)
+			with open(os.path.join(kwargs['asset_dir'], "0_p0.svg"), "w") as f:
+				f.write(svg)
+		raise ValueError("conversion failed")
+
+	scol = get_collection(3)
+	monkeypatch.setattr(scol, "write_html", write_html)
+
+	with pytest.raises(ValueError):
+		show_collection(
+			scol, PlotBrowseOptions(external=external),
+			**({'db_name': 'db', 'run_id': 1} if run else {}) # type: ignore[arg-type]
+		)
+	assert os.listdir(plot_dir) == []
+
+
+class WriteRecorder:
+
+	def __init__(self) -> None:
+		self.sizes: list[int] = []
+
+	def write(self, s: str) -> int:
+		self.sizes.append(len(s))
+		return len(s)
+
+
+def test_write_html_streaming():
+	""" The page is written plot by plot: apart from the page head, no write exceeds the size of a plot """
+
+	n = 10_000
+	out = WriteRecorder()
+	get_collection(n).write_html(out) # type: ignore[arg-type]
+	assert len(out.sizes) > n
+	assert max(out.sizes[1:]) <= len(svg)
+	assert sum(out.sizes) > n * len(svg)
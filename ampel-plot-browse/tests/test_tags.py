@@ -0,0 +1,40 @@
+import pytest
+from ampel.model.operator.AllOf import AllOf
+from ampel.plot.util.tags import compile_tag_filter, tag_set
+from benchmark_tags import legacy_match, make_tags, run
+
+
+@pytest.mark.parametrize("with_tag, without_tag, tags, expected", [
+	("a", None, ["a", "b"], True),
+	("a", None, "b", False),
+	(None, "a", "a", False),
+	(AllOf(all_of=["a", "b"]), None, ["b", "a", "c"], True),
+	({'all_of': ["a", "b"]}, None, ["a"], False),
+	({'any_of': [{'all_of': ["a", "b"]}, "c"]}, "d", ["a", "b"], True),
+	({'any_of': [{'all_of': ["a", "b"]}, "c"]}, "d", ["c", "d"], False),
+	({'any_of': ["a", "b"]}, None, ["c"], False),
+	(None, {'any_of': ["a", "b"]}, ["a"], True),
+	(None, {'any_of': ["a", "b"]}, ["a", "b"], False),
+	({'one_of': ["a", "b"]}, None, ["b", "a"], True),
+	({'one_of': ["a", "b"]}, None, ["a", "b", "c"], False),
+])
+def test_compile_tag_filter(with_tag, without_tag, tags, expected):
+	f = compile_tag_filter(with_tag, without_tag)
+	assert f is not None and f(tag_set(tags)) is expected
+
+
+def test_invalid_schema():
+	with pytest.raises(ValueError):
+		compile_tag_filter({'any_of': [{'any_of': ["a"]}]})
+
+
+@pytest.mark.parametrize("criteria", ["SALT2", AllOf(all_of=["LIGHTCURVE", "ZTF"])])
+def test_legacy_equivalence(criteria):
+	f = compile_tag_filter(criteria)
+	for tags in make_tags(1000):
+		assert f(tag_set(tags)) == legacy_match(criteria, tags) # type: ignore[misc]
+
+
+def test_benchmark():
+	res = run(1000)
+	assert set(res) == {'tag', 'all_of'}
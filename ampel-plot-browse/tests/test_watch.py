@@ -0,0 +1,154 @@
+import mongomock, pytest
+from time import time
+from bson import ObjectId # type: ignore[import]
+from ampel.plot.util import watch
+from ampel.plot.util.watch import DBWatcher
+
+
+class Idle(Exception):
+	pass
+
+
+@pytest.fixture
+def col(monkeypatch):
+	# Tailing queries sleep when nothing was found: stop iterating instead
+	def sleep(t):
+		raise Idle
+	monkeypatch.setattr(watch, "sleep", sleep)
+	return mongomock.MongoClient().db.t3
+
+
+def drain(watcher: DBWatcher) -> list[dict]:
+	docs = []
+	try:
+		for doc in watcher:
+			docs.append(doc)
+	except Idle:
+		pass
+	return docs
+
+
+def test_tailing(col):
+
+	col.insert_many([{'n': i} for i in range(3)])
+	watcher = DBWatcher(col, ts_field='_id')
+	assert drain(watcher) == []
+	assert watcher.mode == 'tailing'
+
+	col.insert_many([{'n': i} for i in range(3, 6)])
+	assert [d['n'] for d in drain(watcher)] == [3, 4, 5]
+	assert drain(watcher) == []
+
+
+def test_tailing_non_monotonic_ids(col):
+
+	col.insert_one({'n': 0})
+	watcher = DBWatcher(col, ts_field='_id')
+	drain(watcher)
+
+	# Id generated by another writer before the last yielded document, inserted afterwards
+	late_id = ObjectId()
+	col.insert_one({'n': 1})
+	assert [d['n'] for d in drain(watcher)] == [1]
+	col.insert_one({'_id': late_id, 'n': 2})
+	assert [d['n'] for d in drain(watcher)] == [2]
+	assert drain(watcher) == []
+
+
+def test_tailing_ts_field_updates(col):
+
+	now = time()
+	col.insert_one({'n': 0, 'meta': [{'ts': now - 1}]})
+	watcher = DBWatcher(col, ts_field='meta.ts')
+	assert drain(watcher) == []
+
+	col.insert_one({'n': 1, 'meta': [{'ts': now}]})
+	assert [d['n'] for d in drain(watcher)] == [1]
+
+	# Update of an existing document (new meta entry)
+	col.update_one({'n': 0}, {'$push': {'meta': {'ts': now + 1}}})
+	assert [d['n'] for d in drain(watcher)] == [0]
+	assert drain(watcher) == []
+
+
+def test_default_ts_field(col):
+
+	assert DBWatcher(col).ts_field == 'meta.ts'
+	assert DBWatcher(col.database.plot).ts_field is None
+
+	# Plots added to an existing t document (meta entry appended) are shown
+	now = time()
+	col.insert_one({'n': 0, 'meta': [{'ts': now - 1}]})
+	watcher = DBWatcher(col)
+	assert drain(watcher) == []
+	col.update_one({'n': 0}, {'$push': {'meta': {'ts': now}}})
+	assert [d['n'] for d in drain(watcher)] == [0]
+
+
+class ChangeStream:
+
+	def __init__(self, changes: list[dict]) -> None:
+		self.changes = changes
+		self.resume_token = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args) -> None:
+		pass
+
+	def __iter__(self):
+		for c in self.changes:
+			self.resume_token = {'_data': c['fullDocument']['n']}
+			yield c
+
+
+def test_change_stream_start(col, monkeypatch):
+
+	calls = []
+	def watch(pipeline, **kwargs):
+		calls.append(kwargs)
+		# Document inserted after the startup scan, before the stream was opened
+		return ChangeStream([{'fullDocument': {'n': 1}}])
+
+	monkeypatch.setattr(col, "watch", watch, raising=False)
+	monkeypatch.setattr(col.database, "command", lambda cmd: {'ok': 1.0, 'operationTime': 42})
+
+	watcher = DBWatcher(col)
+	assert list(watcher) == [{'n': 1}]
+	assert watcher.mode == 'change_stream'
+	assert calls[0]['start_at_operation_time'] == 42
+	assert watcher.resume_token == {'_data': 1}
+
+	# Resumed streams do not use the operation time
+	list(watcher)
+	assert calls[1]['start_at_operation_time'] is None
+	assert calls[1]['resume_after'] == {'_data': 1}
+
+
+def test_overlap_window_pruned(col):
+
+	watcher = DBWatcher(col, overlap=1, ts_field='_id')
+	drain(watcher)
+	col.insert_one({'_id': ObjectId.from_datetime(watch.datetime.fromtimestamp(time() + 5, watch.timezone.utc))})
+	assert len(drain(watcher)) == 1
+	# Ids older than since - overlap are forgotten
+	assert not any(v < watcher._since - 1 for v in watcher._seen.values()) # type: ignore[operator]
+
+
+def test_read_from_db(col, monkeypatch):
+
+	from ampel.model.PlotBrowseOptions import PlotBrowseOptions
+	handled = []
+	monkeypatch.setattr(watch, "_handle_json", lambda plots, *args, **kwargs: handled.append(plots))
+	monkeypatch.setattr(watch, "print_func", lambda *args: None)
+
+	watcher = DBWatcher(col)
+	drain(watcher)
+	col.insert_one({'stock': 1, 'meta': [{'ts': time() + 1}], 'body': {'data': {'plot': {'name': 'a', 'title': 't', 'tag': ['X'], 'svg': '<svg/>'}}}})
+
+	with pytest.raises(Idle):
+		watch.read_from_db(col, PlotBrowseOptions(), watcher)
+
+	assert len(handled) == 1
+	assert handled[0][0]['name'] == 'a'
@@ -4,7 +4,7 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                15.03.2021
-# Last Modified Date:  23.12.2022
+# Last Modified Date:  17.10.2026
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
 import os
@@ -29,11 +29,16 @@ from ampel.plot.SVGLoader import SVGLoader
 from ampel.plot.SVGQuery import SVGQuery
 from ampel.plot.SVGPlot import SVGPlot
 from ampel.core.AmpelContext import AmpelContext
+from ampel.core.AmpelDB import AmpelDB
 from ampel.model.PlotBrowseOptions import PlotBrowseOptions
 from ampel.plot.util.clipboard import read_from_clipboard
 from ampel.plot.util.watch import read_from_db
 from ampel.plot.util.show import show_collection, show_svg_plot
 from ampel.plot.util.transform import svg_inkscape, svg_to_png
+from ampel.plot.util.compression import decompress_svg_dict, use_db_dicts
+from ampel.plot.util.concurrency import iter_ordered
+from ampel.plot.util.index import explain_query, get_index_keys, get_plot_index_keys, has_index
+from ampel.plot.codec import train_zstd_dict, register_zstd_dict
 from ampel.mongo.utils import match_one_or_many
 from ampel.mongo.schema import apply_schema, apply_excl_schema
 from ampel.util.pretty import out_stack
@@ -45,6 +50,8 @@ h = {
 	'clipboard': 'Monitor the clipboard for ampel plots and display them in browser',
 	'watch': 'Monitor a given collection for new ampel plots and display them in browser',
 	'export': 'Exports plots (matched by oid or run-id) to EPS/PDF/SVG (EPS and PDF require inkscape)',
+	'dict': 'Train a zstd compression dictionary using a sample of the plot collection',
+	'index': 'Report query plans of the queries generated by "show" (same arguments) and create missing indexes',
 	'config': 'path to an ampel config file (yaml/json)',
 	'secrets': 'path to a YAML secrets store in sops format',
 	'stock': 'stock id(s). Comma sperated values can be used (without space)',
@@ -56,6 +63,8 @@ h = {
 	'enforce-base-path': 'within a given doc, load only plots with base-path',
 	'last-body': 'If body is a sequence (t2 docs), parse only the last body element',
 	'latest': 'using the provided matching criteria, show plot(s) only from latest doc',
+	'ts-field': 'watch: field tailed if change streams are not available: timestamps (default: meta.ts, should be indexed, updated documents are then detected as well) or _id (default for the plot collection)',
+	'sort': 'group plots by stock (documents are sorted by stock within each collection, ignored with -page-size). Default: DB order',
 	'with-plot-tag': 'match plots with tag',
 	'without-plot-tag': 'exclude plots with tag',
 	'with-doc-tag': 'match plots embedded in doc with tag',
@@ -63,6 +72,7 @@ h = {
 	'add-tags-to-filename': 'appends underline-joined lower case plot tags as filename suffix (if not already present in filename)',
 	'png': 'convert to png (from svg). Default: 96 DPI',
 	'html': 'html output format (includes plot titles)',
+	'external': 'write plots as separate files referenced by a light html page (lazy loading, for large stacks)',
 	'stack': 'stack <n> images into one html structure (activates html option). Default: 100',
 	'out': 'path to file (printed to stdout otherwise)',
 	'db': 'Database prefix. Multiple prefixes are supported (one query per db will be executed).\nIf set, "-mongo.prefix" value will be ignored',
@@ -72,6 +82,13 @@ h = {
 	'job-id': 'Matches plots created by specified job ids (-job arg will be ignored)',
 	'job-time-from': 'Restrict event collection search using provided timestamp\n(used automatically by ampel job ... -show-plots)',
 	'format': 'Export file format (svg, png, pdf, eps). Use png:150 to set custom DPI (default: 150)',
+	'samples': 'number of plots sampled for training the dictionary. Default: 1000',
+	'dict-size': 'max dictionary size in bytes. Default: 112640',
+	'create': 'create missing indexes',
+	'page-size': 'number of *documents* per page (documents are sorted by _id, -limit is ignored)',
+	'page': 'page number (requires -page-size). Slow for large page numbers: the ids of all documents of previous pages\n(page-size * (page - 1)) are scanned. To browse page after page, use -resume <token> instead',
+	'resume': 'resume token printed at the end of the previous page (requires -page-size).\nPages are resumed directly from the token (no scan of previous documents)',
+	'threads': 'number of DB queries (collections, databases) executed concurrently. Default: 4',
 	'user-dir': 'create images in ampel app dir instead of temp dir (plot collections will be persistent accross os restarts)',
 	'verbose': 'increases verbosity',
 	'debug': 'debug'
@@ -82,7 +99,7 @@ class PlotCommand(AbsCoreCommand):
 
 	@staticmethod
 	def get_sub_ops() -> list[str]:
-		return ['show', 'export', 'clipboard', 'watch']
+		return ['show', 'export', 'clipboard', 'watch', 'dict', 'index']
 
 	# Implement
 	def get_parser(self, sub_op: None | str = None) -> ArgumentParser | AmpelArgumentParser:
@@ -111,20 +128,30 @@ class PlotCommand(AbsCoreCommand):
 		builder.opt('secrets')
 		builder.opt('debug', action='store_true')
 		builder.opt('id-mapper', 'show', type=str)
-		builder.opt('base-path', 'show', type=str)
-		builder.opt('unit', 'show', type=str)
-		builder.opt('run-id', 'show|export', action=MaybeIntAction, nargs='+')
+		builder.opt('base-path', 'show|index', type=str)
+		builder.opt('unit', 'show|index', type=str)
+		builder.opt('run-id', 'show|export|dict|index', action=MaybeIntAction, nargs='+')
 		builder.opt('enforce-base-path', 'show', action='store_true')
 		builder.opt('last-body', 'show', action='store_true')
 		builder.opt('latest', 'show', action='store_true')
+		builder.opt('sort', 'show', action='store_true')
+		builder.opt('ts-field', 'watch', type=str)
 		builder.opt('user-dir', 'show', action='store_false')
-		builder.opt('db', 'show|export|clipboard', type=str, nargs='+')
-		builder.opt('job', 'show|watch|clipboard', type=str, nargs='+')
-		builder.opt('job-id', 'show|watch|clipboard', action=MaybeIntAction, nargs='+')
-		builder.opt('job-time-from', 'show', action=MaybeIntAction, nargs='?')
+		builder.opt('db', 'show|export|clipboard|dict|index', type=str, nargs='+')
+		builder.opt('job', 'show|watch|clipboard|index', type=str, nargs='+')
+		builder.opt('job-id', 'show|watch|clipboard|index', action=MaybeIntAction, nargs='+')
+		builder.opt('job-time-from', 'show|index', action=MaybeIntAction, nargs='?')
 		builder.opt('format', 'export', default='svg')
 		builder.opt('add-tags-to-filename', 'export', action='store_true')
 		builder.opt('oid', 'export', nargs='+')
+		builder.opt('out', 'dict')
+		builder.opt('samples', 'dict', type=int, default=1000)
+		builder.opt('dict-size', 'dict', type=int, default=112640)
+		builder.opt('threads', 'show', type=int, default=4)
+		builder.opt('page-size', 'show', type=int, default=0)
+		builder.opt('page', 'show', type=int, default=1)
+		builder.opt('resume', 'show', type=str)
+		builder.opt('create', 'index', action='store_true')
 
 		# Optional mutually exclusive args
 		builder.xargs(
@@ -133,44 +160,48 @@ class PlotCommand(AbsCoreCommand):
 				{'name': 'html', 'action': 'store_true'}
 			]
 		)
+		builder.opt('external', 'show|watch|clipboard', action='store_true')
 		builder.opt(
 			'stack', 'show|watch|clipboard',
 			action='store', metavar='#', const=100, nargs='?', type=int, default=0
 		)
 
-		builder.add_group('match', 'Plot selection arguments', sub_ops='show|watch|export')
+		builder.add_group('match', 'Plot selection arguments', sub_ops='show|watch|export|dict|index')
 		for el in (0, 1, 2, 3):
 			builder.arg(
-				f'no-t{el}', group='match', sub_ops='show|watch',
+				f'no-t{el}', group='match', sub_ops='show|watch|index',
 				action='store_true', help=f'Ignore t{el} plots'
 			)
 			builder.arg(
-				f't{el}', group='match', sub_ops='show|watch',
+				f't{el}', group='match', sub_ops='show|watch|index',
 				action='store_true', help=f'Match only t{el} plots'
 			)
 
 		builder.arg(
-			'plot-col', group='match', sub_ops='show|watch', action='store_true',
+			'plot-col', group='match', sub_ops='show|watch|index', action='store_true',
 			help='Match only plots from plots collections'
 		)
-		builder.arg('stock', group='match', sub_ops='show|watch', action=MaybeIntAction, nargs='+')
-		builder.arg('no-stock', group='match', sub_ops='show|watch', action=MaybeIntAction, nargs='+')
+		builder.arg('stock', group='match', sub_ops='show|watch|index', action=MaybeIntAction, nargs='+')
+		builder.arg('no-stock', group='match', sub_ops='show|watch|index', action=MaybeIntAction, nargs='+')
 		builder.logic_args('channel', descr='Channel', group='match', sub_ops='show|watch')
-		builder.logic_args('with-doc-tag', descr='Doc tag', group='match', sub_ops='show|watch', json=False)
-		builder.logic_args('without-doc-tag', descr='Doc tag', group='match', sub_ops='show|watch', json=False)
+		builder.logic_args('with-doc-tag', descr='Doc tag', group='match', sub_ops='show|watch|index', json=False)
+		builder.logic_args('without-doc-tag', descr='Doc tag', group='match', sub_ops='show|watch|index', json=False)
 		builder.logic_args(
 			'with-plot-tag', descr='Plot tag', group='match',
-			sub_ops='show|watch|export', json=False
+			sub_ops='show|watch|export|dict|index', json=False
 		)
 		builder.logic_args(
 			'without-plot-tag', descr='Plot tag', group='match',
-			sub_ops='show|watch|export', json=False
+			sub_ops='show|watch|export|index', json=False
 		)
-		builder.arg('custom-match', group='match', sub_ops='show|watch', metavar='#', action=LoadJSONAction)
+		builder.arg('custom-match', group='match', sub_ops='show|watch|index', metavar='#', action=LoadJSONAction)
 		builder.example('show', '-stack -300 -t2')
 		builder.example('show', '-html -t3 -base-path body.plot -latest -db HelloAmpel')
 		builder.example('show', '-html -t2 -stock 123456 -db DB1 DB2')
 		builder.example('show', '-stack -t2 -png 300 -limit 10')
+		builder.example('show', '-stack 5000 -external -t2 -png 150')
+		builder.example('show', '-stack -t2 -run-id 12 -page-size 500')
+		builder.example('show', '-stack -t2 -run-id 12 -page-size 500 -resume 0:64f1c2e5a1b2c3d4e5f60718')
 		builder.example('show',
 			'-stack -limit 10 -t2 -with-plot-tag SNCOSMO -with-doc-tag NED_NEAREST_IS_SPEC ' +
 			'-custom-match \'{\"body.data.ned.sep\": {\"$lte\": 10}}\''
@@ -188,6 +219,8 @@ class PlotCommand(AbsCoreCommand):
 		builder.example('export', '-db SIM -out /Users/you/Documents/ -oid 62fde88cf4880a864494b291')
 		builder.example('export', '-db SIM -format pdf -out /Users/you/Documents/ -oid 62fde88cf4880a864494b291 62fde88cf4880a864494b292')
 		builder.example('export', '-db SIM -format png:200 -out /Users/you/Documents/ -oid 62fde88cf4880a864494b295')
+		builder.example('index', '-db SIM -t2 -run-id 12 -with-plot-tag SNCOSMO -create')
+		builder.example('dict', '-db SIM -samples 2000 -with-plot-tag SNCOSMO -out /path/to/sncosmo.zdict')
 		
 		self.parsers.update(
 			builder.get()
@@ -338,6 +371,48 @@ class PlotCommand(AbsCoreCommand):
 
 			return
 
+		if sub_op == 'dict':
+
+			mcrit = {'run': match_one_or_many([int(el) for el in args['run_id']])} if args.get('run_id') else {}
+			for el in ('with_plot_tag', 'with_plot_tags_and', 'with_plot_tags_or'):
+				if args.get(el):
+					apply_schema(mcrit, 'tag', args.get(el)) # type: ignore
+					break
+
+			use_db_dicts(dbs[0].get_collection('plotdict', mode='r'))
+			samples = [
+				decompress_svg_dict(doc)['svg']
+				for doc in dbs[0].get_collection('plot', mode='r').aggregate([
+					{'$match': mcrit},
+					{'$sample': {'size': args['samples']}},
+					{'$project': {'svg': 1, 'codec': 1, 'dict_id': 1}}
+				])
+			]
+
+			if not samples:
+				print("Plot(s) not found")
+				return
+
+			zdict = train_zstd_dict(samples, args['dict_size'])
+			dict_id = register_zstd_dict(zdict)
+			dbs[0].get_collection('plotdict').insert_one({
+				'_id': dict_id,
+				'dict': zdict,
+				'samples': len(samples),
+				'match': str(mcrit),
+				'ts': datetime.now().timestamp()
+			})
+
+			if args.get('out'):
+				with open(args['out'], 'wb') as f:
+					f.write(zdict)
+
+			logger.info(
+				f'Trained dictionary {dict_id} ({len(zdict)} bytes) using {len(samples)} plots' +
+				(f', saved to {args["out"]}' if args.get('out') else '')
+			)
+			return
+
 		if sub_op == 'clipboard':
 			from ampel.plot.util.keyboard import InlinePynput
 			ipo = InlinePynput()
@@ -353,7 +428,8 @@ class PlotCommand(AbsCoreCommand):
 		if sub_op == 'watch':
 			read_from_db(
 				dbs[0].get_collection(args['col'], mode='r'),
-				PlotBrowseOptions(**args)
+				PlotBrowseOptions(**args),
+				ts_field = args.get('ts_field')
 			)
 
 		if 'id_mapper' in args:
@@ -383,10 +459,24 @@ class PlotCommand(AbsCoreCommand):
 				ptags['without'] = args.get(el)
 				break
 
+		if sub_op == 'index':
+			for db in dbs:
+				self.check_indexes(
+					db, self.get_queries(args, ptags, dtags, job_sig, run_ids), args['create'], logger
+				)
+			return
+
 		if stack:
 			scol = SVGCollection()
 
-		for db in dbs:
+		page_size = args.get('page_size') or 0
+		tokens = args['resume'].split(",") if args.get('resume') else [None] * len(dbs)
+		if len(tokens) != len(dbs):
+			raise ValueError("Resume token does not match the number of databases")
+
+		loaders: list[SVGLoader] = []
+		empty: set[int] = set() # index of loaders without documents left (page mode)
+		for db, token in zip(dbs, tokens):
 
 			loader = SVGLoader(
 				db,
@@ -394,82 +484,50 @@ class PlotCommand(AbsCoreCommand):
 				limit = limit,
 				enforce_base_path= args['enforce_base_path'],
 				last_body = args['last_body'],
-				latest_doc = args['latest']
+				latest_doc = args['latest'],
+				query_threads = args.get('threads', 4),
+				page_size = page_size,
+				resume_token = None if token == "-" else token
 			)
 
-			if args['plot_col']:
-				loader.add_query(
-					SVGQuery(
-						col = 'plot',
-						path = '',
-						plot_tag = ptags,
-						doc_tag = dtags,
-						unit = args.get('unit'),
-						stock = args.get('stock'),
-						no_stock = args.get('no_stock'),
-						job_sig = job_sig,
-						run_id = run_ids,
-						custom_match = args.get('custom_match')
+			for q in self.get_queries(args, ptags, dtags, job_sig, run_ids):
+				loader.add_query(q)
+
+			if page_size and token != "-" and args.get('page', 1) > 1:
+				loader.resume_token = loader.get_page_token(args['page'])
+
+			# "-": no documents left in this db
+			if page_size and (token == "-" or (args.get('page', 1) > 1 and loader.resume_token is None)):
+				empty.add(len(loaders))
+
+			loaders.append(loader)
+
+		# Plots are displayed as the DB cursors advance (one stack at a time).
+		# Loaders (one per db) run concurrently, plots are merged in db order.
+		# Plots of a given stock are yielded consecutively (per queried collection) if -sort is set.
+		sort_by_stock = not page_size and bool(args.get('sort'))
+		i = 1
+		pbo = PlotBrowseOptions(**args)
+		for k, (stock, svg) in iter_ordered(
+			[iter(()) if k in empty else loader.iter_plots(sort_by_stock) for k, loader in enumerate(loaders)],
+			threads = args.get('threads', 4),
+			prefetch = 1000
+		):
+			i += 1
+			if stack:
+				if len(dbs) > 1:
+					svg.set_title(svg.get_title() + f'\n<span style="color: steelblue">{dbs[k].prefix}</span>')
+				scol.add_svg_plot(svg, stock)
+				if i % stack == 0:
+					show_collection(
+						scol, pbo, print_func = print,
+						temp_dir = args['user_dir'],
+						run_id = args.get('run_id'),
+						db_name = try_reduce(db_prefixes)
 					)
-				)
+					scol = SVGCollection()
 			else:
-				if [k for k in ('t0', 't1', 't2', 't3') if args.get(k, False)]:
-					for el in ('t0', 't1', 't2', 't3'):
-						if args[el]:
-							loader.add_query(
-								SVGQuery(
-									col = el, # type: ignore[arg-type]
-									path = args.get('base_path') or 'body.data.plot',
-									plot_tag = ptags,
-									doc_tag = dtags,
-									unit = args.get('unit'),
-									stock = args.get('stock'),
-									job_sig = job_sig,
-									run_id = run_ids,
-									custom_match = args.get('custom_match')
-								)
-							)
-				else:
-					for el in ('t0', 't1', 't2', 't3'):
-						if not args.get(f'no-{el}'):
-							loader.add_query(
-								SVGQuery(
-									col = el, # type: ignore[arg-type]
-									path = args.get('base_path') or 'body.data.plot',
-									plot_tag = ptags,
-									doc_tag = dtags,
-									unit = args.get('unit'),
-									stock = args.get('stock'),
-									job_sig = job_sig,
-									run_id = run_ids,
-									custom_match = args.get('custom_match')
-								)
-							)
-
-			loader.run()
-
-			i = 1
-			for v in loader._plots.values():
-
-				pbo = PlotBrowseOptions(**args)
-				if stack:
-					for svg in v._svgs:
-						i += 1
-						if len(dbs) > 1:
-							svg._record['title'] += f'\n<span style="color: steelblue">{db.prefix}</span>'
-						scol.add_svg_plot(svg)
-						if i % stack == 0:
-							show_collection(
-								scol, pbo, print_func = print,
-								temp_dir = args['user_dir'],
-								run_id = args.get('run_id'),
-								db_name = try_reduce(db_prefixes)
-							)
-							scol = SVGCollection()
-				else:
-					for svg in v._svgs:
-						i += 1
-						show_svg_plot(svg, pbo)
+				show_svg_plot(svg, pbo)
 
 		if stack:
 
@@ -495,6 +553,133 @@ class PlotCommand(AbsCoreCommand):
 		if i == 1:
 			AmpelLogger.get_logger().info('No plot matched')
 
+		if page_size:
+			if any(loader.next_token for loader in loaders):
+				logger.info(
+					'Next page: -resume ' + ",".join(loader.next_token or "-" for loader in loaders)
+				)
+			else:
+				logger.info('Last page')
+
+
+	def get_queries(self,
+		args: dict[str, Any], ptags: dict, dtags: dict,
+		job_sig: None | int | list[int], run_ids: None | int | list[int]
+	) -> list[SVGQuery]:
+		""" :returns: the queries matching the provided command line arguments """
+
+		queries: list[SVGQuery] = []
+		if args['plot_col']:
+			queries.append(
+				SVGQuery(
+					col = 'plot',
+					path = '',
+					plot_tag = ptags,
+					doc_tag = dtags,
+					unit = args.get('unit'),
+					stock = args.get('stock'),
+					no_stock = args.get('no_stock'),
+					job_sig = job_sig,
+					run_id = run_ids,
+					custom_match = args.get('custom_match')
+				)
+			)
+		else:
+			if [k for k in ('t0', 't1', 't2', 't3') if args.get(k, False)]:
+				for el in ('t0', 't1', 't2', 't3'):
+					if args[el]:
+						queries.append(
+							SVGQuery(
+								col = el, # type: ignore[arg-type]
+								path = args.get('base_path') or 'body.data.plot',
+								plot_tag = ptags,
+								doc_tag = dtags,
+								unit = args.get('unit'),
+								stock = args.get('stock'),
+								job_sig = job_sig,
+								run_id = run_ids,
+								custom_match = args.get('custom_match')
+							)
+						)
+			else:
+				for el in ('t0', 't1', 't2', 't3'):
+					if not args.get(f'no-{el}'):
+						queries.append(
+							SVGQuery(
+								col = el, # type: ignore[arg-type]
+								path = args.get('base_path') or 'body.data.plot',
+								plot_tag = ptags,
+								doc_tag = dtags,
+								unit = args.get('unit'),
+								stock = args.get('stock'),
+								job_sig = job_sig,
+								run_id = run_ids,
+								custom_match = args.get('custom_match')
+							)
+						)
+
+		return queries
+
+
+	def check_indexes(self,
+		db: AmpelDB, queries: list[SVGQuery], create: bool, logger: AmpelLogger
+	) -> None:
+		"""
+		Reports the query plans of the provided queries and optionally creates
+		missing compound indexes (plus an index on run/tag/_id for the plot collection)
+		"""
+
+		mdb = db.get_collection('plot', mode='r').database
+		col_names = set(mdb.list_collection_names())
+
+		if 'plot' in col_names:
+			plot_col = db.get_collection('plot')
+			keys = get_plot_index_keys(plot_col)
+			if not has_index(plot_col, keys):
+				if create:
+					logger.info(f"[{mdb.name}.plot] Creating index {keys}")
+					plot_col.create_index(keys)
+				else:
+					logger.info(f"[{mdb.name}.plot] Missing index {keys}")
+
+		for q in queries:
+
+			if q.col not in col_names:
+				continue
+
+			col = db.get_collection(q.col)
+			before = explain_query(col, q)
+			logger.info(f"[{mdb.name}.{q.col}] Query: {q._query}")
+			logger.info(f"[{mdb.name}.{q.col}] Plan: {_fmt_plan(before)}")
+
+			if before['collscan'] is False:
+				continue
+
+			keys = get_index_keys(q, col)
+			if not keys or has_index(col, keys):
+				continue
+
+			if not create:
+				logger.info(f"[{mdb.name}.{q.col}] Missing index {keys} (use -create)")
+				continue
+
+			logger.info(f"[{mdb.name}.{q.col}] Creating index {keys}")
+			try:
+				col.create_index(keys)
+			except Exception as e:
+				logger.error(f"[{mdb.name}.{q.col}] Index creation failed: {e}")
+				continue
+
+			logger.info(f"[{mdb.name}.{q.col}] Plan: {_fmt_plan(explain_query(col, q))}")
+
+
+def _fmt_plan(d: dict[str, Any]) -> str:
+	return (
+		f"{' > '.join(d['stages']) or 'n/a'}" +
+		(f" (index: {', '.join(d['indexes'])})" if d['indexes'] else "") +
+		f", examined: {d['docs_examined']}, returned: {d['returned']}, time: {d['ms']} ms"
+	)
+
 
 def get_outpath(base_path: str, filename: str) -> str:
 
@@ -20,7 +20,16 @@ class SVGRecord(TypedDict, total=False):
 	tag: Tag | Sequence[Tag]
 	svg: bytes | str # bytes means compressed svg
 	svg_str: NotRequired[str]
+	# name of the codec used for compressing 'svg' (see ampel.plot.codec)
+	codec: NotRequired[str]
+	# id of the zstd dictionary used for compressing 'svg'
+	dict_id: NotRequired[int]
 	oid: NotRequired[str]
-	run: NotRequired[int]
+	# list of run ids if plot deduplication is enabled (see AmpelPlotAdapter)
+	run: NotRequired[int | list[int]]
+	# blake2b digest (hex, 16 bytes) of the uncompressed svg
+	hash: NotRequired[str]
+	# digest of the figure input data and plot properties (see ampel.plot.cache)
+	fingerprint: NotRequired[str]
 	# data used to create figure (compressed numpy array bytes for example)
 	data: NotRequired[Any]
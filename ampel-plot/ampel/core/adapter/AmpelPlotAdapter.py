@@ -4,21 +4,153 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                20.04.2022
-# Last Modified Date:  28.08.2022
+# Last Modified Date:  17.10.2026
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
+import atexit, weakref, hashlib
+from time import time
+from queue import Queue
+from threading import Thread, Lock
+from typing import Any
+from collections import OrderedDict
+from collections.abc import Iterable
 from bson import ObjectId # type: ignore[import]
+from pymongo.collection import Collection # type: ignore[import]
+from pymongo.errors import BulkWriteError # type: ignore[import]
 from ampel.util.recursion import walk_and_process_dict
 from ampel.abstract.AbsUnitResultAdapter import AbsUnitResultAdapter
+from ampel.metrics.AmpelMetricsRegistry import AmpelMetricsRegistry
 from ampel.struct.UnitResult import UnitResult
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.log.utils import report_exception
+
+stat_batch_size = AmpelMetricsRegistry.histogram(
+	'batch_size',
+	'Number of plots inserted per bulk write',
+	subsystem = 'plot',
+	buckets = (1, 10, 50, 100, 250, 500, 1000, 5000)
+)
+
+stat_flush_time = AmpelMetricsRegistry.summary(
+	'flush_time',
+	'Time spent inserting plot batches',
+	unit = 'seconds',
+	subsystem = 'plot'
+)
+
+
+class KnownIds:
+	""" LRU mapping content hash -> id of the plots known to exist in the DB """
+
+	def __init__(self, max_size: int) -> None:
+		self._ids: OrderedDict[str, ObjectId] = OrderedDict()
+		self._max_size = max_size
+		self._lock = Lock()
+
+	def get(self, content_hash: str) -> None | ObjectId:
+		with self._lock:
+			if (oid := self._ids.get(content_hash)) is not None:
+				self._ids.move_to_end(content_hash)
+			return oid
+
+	def update(self, items: Iterable[tuple[str, ObjectId]]) -> None:
+		with self._lock:
+			for k, oid in items:
+				self._ids[k] = oid
+				self._ids.move_to_end(k)
+			while len(self._ids) > self._max_size:
+				self._ids.popitem(last=False)
+
+	def discard(self, content_hashes: Iterable[str]) -> None:
+		with self._lock:
+			for k in content_hashes:
+				self._ids.pop(k, None)
+
+
+# Per collection (full name)
+_known_ids: dict[str, KnownIds] = {}
 
 
 class AmpelPlotAdapter(AbsUnitResultAdapter):
 	"""
 	Provides logic for handling plots embedded in UnitResult.
 	These will be saved into dedicated collection
+
+	Detached plots are replaced by pre-assigned ObjectIds in the unit result body
+	and inserted using unordered bulk writes (one per unit result).
+	Insert errors are raised by handle(), before the unit result body is committed by the caller.
+
+	If defer is enabled, plots are buffered across unit results and inserted when one of the limits
+	batch_size, batch_bytes or batch_time is reached (limits are checked when unit results are handled)
+	and when close() is called. Bodies committed in the meantime reference plots not inserted yet,
+	the owner of the adapter must thus call close() once processing is done (errors are raised there).
+	Adapters discarded or alive at process exit without close() being called are flushed as last resort,
+	errors are then reported into the troubles collection.
+
+	If dedup is enabled, plots providing a svg hash (see fig_to_plot_record) are stored with
+	a 'content_hash' field (digest of svg hash, codec, dict_id, name, title and tags, unique index).
+	Identical plots are thus stored only once and referenced by many unit results.
+	Plot ids remain regular (time ordered) ObjectIds: unit result bodies reference the id of the
+	stored plot, which is resolved when the unit result is handled. Content hashes known to exist
+	in the DB (or queued for insertion) are cached locally, others are checked with one query per unit result.
+	Existing plots are not re-inserted, the current run id is added to their 'run' field instead
+	(which is a list for deduplicated plots). Identical plots inserted concurrently by another
+	process are stored again without content hash (unit result bodies may reference them already).
+
+	Detached plots whose svg is an ObjectId already (references returned by PlotCache) are not inserted,
+	the current run id is added to the 'run' field of the referenced plot instead. Plots providing a
+	fingerprint (see create_plot_record) are thus stored with a list of run ids.
 	"""
 
+	#: Buffer plots across unit results (close() must be called, see class docstring)
+	defer: bool = False
+
+	#: Max number of buffered plots (requires defer)
+	batch_size: int = 500
+
+	#: Max cumulated size (bytes) of the buffered svg payloads
+	batch_bytes: int = 8_000_000
+
+	#: Max time (seconds) plots are kept in buffer
+	batch_time: float = 5.
+
+	#: Perform inserts in a background thread (unit processing is not blocked by DB writes, requires defer)
+	background: bool = False
+
+	#: Store identical plots only once
+	dedup: bool = False
+
+	#: Max number of plot ids (known to exist in the DB) cached by the process
+	dedup_cache_size: int = 100_000
+
+
+	def __init__(self, **kwargs) -> None:
+
+		super().__init__(**kwargs)
+		self._col = self.context.db.get_collection('plot')
+		self._buffer: list[dict[str, Any]] = []
+		self._buffer_bytes = 0
+		self._buffer_ts = time()
+		self._buffer_keys: dict[str, ObjectId] = {} # content hash -> id of buffered plots
+		self._buffer_runs: set[ObjectId] = set() # existing (or cached) plots referenced by buffered unit results
+		self._pending: list[tuple[dict[str, Any], dict[str, Any]]] = [] # deduplicated plots of current unit result
+		self._errors: list[Exception] = [] # populated by the writer thread
+		self._queue: None | Queue = None
+
+		if self.background:
+			if not self.defer:
+				raise ValueError("Option 'background' requires option 'defer'")
+			self._queue = Queue(maxsize=4)
+			# Target must not reference self (adapters are flushed when garbage collected)
+			Thread(
+				target = _write_loop,
+				args = (self._queue, self._col, self.run_id, self._get_known_ids(), self._errors),
+				daemon = True
+			).start()
+
+		_live_adapters.add(self)
+
+
 	def handle(self, ur: UnitResult) -> UnitResult:
 
 		if ur.body is None or not isinstance(ur.body, (dict, list)):
@@ -27,10 +159,20 @@ class AmpelPlotAdapter(AbsUnitResultAdapter):
 		walk_and_process_dict(
 			arg = ur.body,
 			callback = self.insert_plots,
-			match = ['plot'],
-			col = self.context.db.get_collection('plot')
+			match = ['plot']
 		)
 
+		if self._pending:
+			self._resolve_pending()
+
+		if (self._buffer or self._buffer_runs) and (
+			not self.defer or
+			len(self._buffer) >= self.batch_size or
+			self._buffer_bytes >= self.batch_bytes or
+			time() - self._buffer_ts >= self.batch_time
+		):
+			self.flush()
+
 		return ur
 
 
@@ -39,21 +181,216 @@ class AmpelPlotAdapter(AbsUnitResultAdapter):
 
 		if isinstance(d[k], dict):
 			if d[k].get('detached'):
-				d[k]['run'] = self.run_id
-				d[k]['svg'] = kwargs['col'].insert_one(d[k]).inserted_id
-				del d[k]['run']
-				del d[k]['detached']
-
-		elif isinstance(d[k], list) and d[k]:
-			insert = []
-			for i in range(len(d[k])):
-				d2 = d[k][i]
-				if d2.get('detached'):
-					del d2['detached']
-					d3 = d2.copy()
-					d3['_id'] = ObjectId()
-					d3['run'] = self.run_id
-					d2['svg'] = d3['_id']
-					insert.append(d3)
-
-			kwargs['col'].insert_many(insert)
+				self._add_plot(d[k])
+
+		elif isinstance(d[k], list):
+			for el in d[k]:
+				if el.get('detached'):
+					self._add_plot(el)
+
+
+	def _add_plot(self, d: dict[str, Any]) -> None:
+		""" Replaces svg with the ObjectId of the plot document to be inserted """
+
+		del d['detached']
+		if isinstance(d['svg'], ObjectId):
+			# Reference to a saved plot (see PlotCache)
+			self._buffer_runs.add(d['svg'])
+			return
+
+		doc = d.copy()
+		doc['_id'] = ObjectId()
+
+		if self.dedup and 'hash' in d:
+			doc['content_hash'] = hashlib.blake2b(
+				repr(
+					(d['hash'], d.get('codec'), d.get('dict_id'), d.get('name'), d.get('title'), d.get('tag'))
+				).encode('utf8'),
+				digest_size = 16
+			).hexdigest()
+			doc['run'] = [self.run_id]
+			self._pending.append((d, doc)) # see _resolve_pending
+			return
+
+		doc['run'] = [self.run_id] if 'fingerprint' in d else self.run_id
+		d['svg'] = doc['_id']
+		self._buffer_doc(doc)
+
+
+	def _buffer_doc(self, doc: dict[str, Any]) -> None:
+
+		if not self._buffer:
+			self._buffer_ts = time()
+
+		self._buffer.append(doc)
+		if isinstance(doc['svg'], (bytes, str)):
+			self._buffer_bytes += len(doc['svg'])
+
+
+	def _resolve_pending(self) -> None:
+		""" References existing (or buffered) identical plots, buffers the others """
+
+		pending, self._pending = self._pending, []
+		known_ids: KnownIds = self._get_known_ids() # type: ignore[assignment]
+
+		if (unknown := {
+			doc['content_hash'] for d, doc in pending
+			if doc['content_hash'] not in self._buffer_keys and known_ids.get(doc['content_hash']) is None
+		}):
+			known_ids.update(
+				(el['content_hash'], el['_id'])
+				for el in self._col.find({'content_hash': {'$in': list(unknown)}}, {'content_hash': 1})
+			)
+
+		for d, doc in pending:
+			k = doc['content_hash']
+			if (oid := self._buffer_keys.get(k)) is not None:
+				d['svg'] = oid
+			elif (oid := known_ids.get(k)) is not None:
+				d['svg'] = oid
+				self._buffer_runs.add(oid)
+			else:
+				d['svg'] = self._buffer_keys[k] = doc['_id']
+				self._buffer_doc(doc)
+
+
+	def flush(self) -> None:
+		""" Inserts (or queues) buffered plots, errors of previous background writes are raised first """
+		self._raise_errors()
+		self._flush()
+
+
+	def _flush(self) -> None:
+
+		if not self._buffer and not self._buffer_runs:
+			return
+
+		docs, self._buffer = self._buffer, []
+		runs, self._buffer_runs = self._buffer_runs, set()
+		self._buffer_keys = {}
+		self._buffer_bytes = 0
+
+		known_ids = self._get_known_ids()
+		if self._queue is None:
+			_insert(self._col, docs, runs, self.run_id, known_ids)
+		else:
+			if known_ids is not None:
+				# Identical plots of the next unit results reference the queued plots
+				# (ids of plots failing to be inserted are discarded by _write_loop)
+				known_ids.update((d['content_hash'], d['_id']) for d in docs if 'content_hash' in d)
+			self._queue.put((docs, runs))
+
+
+	def close(self) -> None:
+		"""
+		Flushes buffered plots and waits for pending background writes.
+		Buffered plots are flushed even if previous writes failed, the first error is raised afterwards.
+		"""
+		try:
+			self._flush()
+		finally:
+			if self._queue is not None:
+				self._queue.join()
+		self._raise_errors()
+
+
+	def _raise_errors(self) -> None:
+		""" Raises the first error of the writer thread (errors of subsequent batches are dropped) """
+		if self._errors:
+			e = self._errors[0]
+			self._errors.clear() # shared with the writer thread
+			raise e
+
+
+	def _get_known_ids(self) -> None | KnownIds:
+		if not self.dedup:
+			return None
+		k = self._col.full_name
+		if k not in _known_ids:
+			_known_ids[k] = KnownIds(self.dedup_cache_size)
+		return _known_ids[k]
+
+
+	def _finalize(self) -> None:
+		""" Last resort flush (close() was not called): errors cannot be propagated anymore """
+
+		_live_adapters.discard(self)
+		try:
+			self.close()
+		except Exception as e:
+			report_exception(
+				self.context.db, AmpelLogger.get_logger(), exc=e,
+				info={'unit': 'AmpelPlotAdapter', 'run': self.run_id, 'msg': 'Plot insertion failed'}
+			)
+		finally:
+			if self._queue is not None:
+				self._queue.put(None) # stops writer thread
+				self._queue = None
+
+
+	def __del__(self) -> None:
+		if hasattr(self, '_queue'):
+			self._finalize()
+
+
+def _insert(
+	col: Collection, docs: list[dict[str, Any]], runs: set[ObjectId],
+	run_id: int, known_ids: None | KnownIds = None
+) -> None:
+	"""
+	:param runs: ids of existing (deduplicated) plots to be associated with the run
+	"""
+
+	stat_batch_size.observe(len(docs))
+	with stat_flush_time.time():
+
+		if docs:
+			try:
+				col.insert_many(docs, ordered=False)
+			except BulkWriteError as e:
+				# Identical plots inserted concurrently by another process
+				dups = {
+					err['op']['_id'] for err in e.details['writeErrors']
+					if err['code'] == 11000 and 'content_hash' in err.get('keyValue', err['op'])
+				}
+				if len(dups) != len(e.details['writeErrors']):
+					raise
+				# Ids of these documents are referenced already
+				retry = [d for d in docs if d['_id'] in dups]
+				for d in retry:
+					del d['content_hash']
+				col.insert_many(retry, ordered=False)
+
+		if runs:
+			col.update_many({'_id': {'$in': list(runs)}}, {'$addToSet': {'run': run_id}})
+
+		if known_ids is not None:
+			known_ids.update((d['content_hash'], d['_id']) for d in docs if 'content_hash' in d)
+
+
+def _write_loop(
+	queue: Queue, col: Collection, run_id: int,
+	known_ids: None | KnownIds, errors: list[Exception]
+) -> None:
+
+	while (item := queue.get()) is not None:
+		docs, runs = item
+		try:
+			_insert(col, docs, runs, run_id, known_ids)
+		except Exception as e:
+			if known_ids is not None:
+				known_ids.discard(d['content_hash'] for d in docs if 'content_hash' in d)
+			# Raised by the next call to flush()
+			errors.append(e)
+		finally:
+			queue.task_done()
+
+
+def _close_adapters() -> None:
+	for adapter in list(_live_adapters):
+		adapter._finalize()
+
+
+# Adapters not finalized yet (flushed at process exit)
+_live_adapters: weakref.WeakSet[AmpelPlotAdapter] = weakref.WeakSet()
+atexit.register(_close_adapters)
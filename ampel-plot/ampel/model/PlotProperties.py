@@ -4,12 +4,15 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                12.02.2021
-# Last Modified Date:  20.04.2022
+# Last Modified Date:  17.10.2026
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
 from typing import Any
+from operator import itemgetter
+from collections import OrderedDict
+from collections.abc import Sequence
 from ampel.types import StockId, Tag
-from ampel.util.compression import TCompression
+from ampel.plot.codec import TPlotCompression
 from ampel.base.AmpelBaseModel import AmpelBaseModel
 from ampel.abstract.AbsIdMapper import AbsIdMapper
 from ampel.base.AuxUnitRegister import AuxUnitRegister
@@ -23,6 +26,60 @@ class FormatModel(AmpelBaseModel):
 	format_str: str
 	arg_keys: None | list[str]
 
+	# Compiled at validation
+	_getter: Any = None
+	_stock_idx: None | int = None
+
+	def __init__(self, **kwargs) -> None:
+		super().__init__(**kwargs)
+		if self.arg_keys:
+			self._getter = itemgetter(*self.arg_keys)
+			if 'stock' in self.arg_keys:
+				self._stock_idx = self.arg_keys.index('stock')
+
+
+	def format(self, extra: None | dict[str, Any] = None, stock_name: None | str = None) -> str:
+		"""
+		:param stock_name: replaces extra['stock'] (external name of the stock) if provided
+		"""
+
+		if not self.arg_keys or not extra:
+			return self.format_str
+
+		try:
+			args = self._getter(extra)
+			args = list(args) if len(self.arg_keys) > 1 else [args]
+			if stock_name is not None and self._stock_idx is not None:
+				args[self._stock_idx] = stock_name
+		except KeyError:
+			# Missing keys are skipped
+			args = [
+				stock_name if k == 'stock' and stock_name is not None else extra[k]
+				for k in self.arg_keys if k in extra
+			]
+
+		try:
+			return self.format_str % tuple(args)
+		except TypeError as e:
+			raise TypeError(
+				f"Cannot format {self.format_str!r} with arguments {tuple(args)!r} "
+				f"(arg_keys: {self.arg_keys})"
+			) from e
+
+
+class SVGMinifyModel(AmpelBaseModel):
+	"""
+	Optional svg optimization stage run before compression (see ampel.plot.minify.minify_svg)
+	:param precision: number of decimals kept for coordinates
+	:param dedup_defs: merge identical <defs> entries
+	:param strip_metadata: remove metadata, comments and doctype
+	:param collapse_groups: remove identity transforms and redundant groups
+	"""
+	precision: None | int = 2
+	dedup_defs: bool = True
+	strip_metadata: bool = True
+	collapse_groups: bool = True
+
 
 class PlotProperties(AmpelBaseModel):
 	"""
@@ -102,18 +159,28 @@ class PlotProperties(AmpelBaseModel):
 	width: None | int = None
 	height: None | int = None
 	compression_behavior: None | int = None
-	compression_alg: TCompression = "ZIP_BZIP2"
+	compression_alg: TPlotCompression = "ZIP_BZIP2"
 	compression_level: int = 9
+	compression_dict: None | str = None # Path to zstd dictionary file (see ampel plot dict)
 	detached: bool = True
 	id_mapper: None | str | type[AbsIdMapper] = None
 	disk_save: None | str = None # Local folder path
 	mpl_kwargs: None | dict[str, Any] = None
+	minify: None | SVGMinifyModel = None
+	# Rasterize artists made of more elements than this threshold (axes and text remain vectorial)
+	rasterize_threshold: None | int = None
+	rasterize_dpi: int = 150
+	rasterize_report: bool = False # log bytes saved by rasterization (renders figures twice)
 
 
 	# TODO: implement other validators ?:
 	# - for title and file_name: if FormatModel.arg_keys then format_str must contain '%s'
 	# - if id_mapper is set but FormatModel.arg_keys does not contain 'stock' do ?
 
+	#: Max number of external stock names cached by get_ext_name(...)
+	_ext_names_max: int = 100_000
+	_ext_names: Any = None
+
 	def get_file_name(self, extra: None | dict[str, Any] = None) -> str:
 		return self._format_attr(self.file_name, extra)
 
@@ -123,37 +190,95 @@ class PlotProperties(AmpelBaseModel):
 	def get_fig_text(self, extra: None | dict[str, Any] = None) -> None | str:
 		return self._format_attr(self.fig_text, extra) if self.fig_text else None
 
+	def get_file_names(self, extras: Sequence[dict[str, Any]]) -> list[str]:
+		""" Batch version of get_file_name(...), external stock names are converted at once """
+		return self._format_attrs(self.file_name, extras)
+
+	def get_titles(self, extras: Sequence[dict[str, Any]]) -> list[None | str]:
+		""" Batch version of get_title(...) """
+		return self._format_attrs(self.title, extras) if self.title else [None] * len(extras)
+
 	def _format_attr(self, attr: FormatModel, extra: None | dict[str, Any] = None) -> str:
 
-		if attr.arg_keys and extra:
-			try:
-				if 'stock' in attr.arg_keys and self.id_mapper:
-					extra = extra.copy()
-					extra['stock'] = self.get_ext_name(extra['stock'])
+		if extra and self.id_mapper and attr._stock_idx is not None and 'stock' in extra:
+			return attr.format(extra, self.get_ext_name(extra['stock']))
 
-				return attr.format_str % tuple(extra[k] for k in attr.arg_keys if k in extra)
-			except TypeError as e:
-				# TODO: require logger for get_file_name(), get_title, and get_fig_text
-				# pass it through and use it here
-				print("#" * 50)
-				print(f"Format model: {attr}")
-				print("Arguments: " + str(tuple(extra[k] for k in attr.arg_keys if k in extra)))
-				print("#" * 50)
-				raise e
+		return attr.format(extra)
 
-		return attr.format_str
+
+	def _format_attrs(self, attr: FormatModel, extras: Sequence[dict[str, Any]]) -> list[Any]:
+
+		if self.id_mapper and attr._stock_idx is not None:
+			names = self.get_ext_names([el['stock'] for el in extras if el and 'stock' in el])
+			return [
+				attr.format(el, names[el['stock']] if el and 'stock' in el else None)
+				for el in extras
+			]
+
+		return [attr.format(el) for el in extras]
 
 
 	def get_ext_name(self, ampel_id: StockId) -> str:
-		""" If no id mapper is avail, the stringified ampel id is returned """
+		"""
+		If no id mapper is avail, the stringified ampel id is returned.
+		Converted names are cached (LRU).
+		"""
 
 		if self.id_mapper is None:
 			return str(ampel_id)
 
+		if self._ext_names is None:
+			self._ext_names = OrderedDict()
+		elif ampel_id in self._ext_names:
+			self._ext_names.move_to_end(ampel_id)
+			return self._ext_names[ampel_id]
+
+		return self._cache_ext_names({ampel_id: self._get_id_mapper().to_ext_id(ampel_id)})[ampel_id]
+
+
+	def get_ext_names(self, ampel_ids: Sequence[StockId]) -> dict[StockId, str]:
+		"""
+		Batch version of get_ext_name(...): ids not found in cache are converted
+		using a single call to the id mapper.
+		:returns: dict ampel id -> external name
+		"""
+
+		if self.id_mapper is None:
+			return {el: str(el) for el in ampel_ids}
+
+		if self._ext_names is None:
+			self._ext_names = OrderedDict()
+
+		ret = {}
+		misses = []
+		for el in dict.fromkeys(ampel_ids):
+			if el in self._ext_names:
+				self._ext_names.move_to_end(el)
+				ret[el] = self._ext_names[el]
+			else:
+				misses.append(el)
+
+		if misses:
+			ret.update(
+				self._cache_ext_names(
+					dict(zip(misses, self._get_id_mapper().to_ext_id(misses)))
+				)
+			)
+
+		return ret
+
+
+	def _get_id_mapper(self) -> type[AbsIdMapper]:
 		if isinstance(self.id_mapper, str):
 			self.id_mapper = AuxUnitRegister.get_aux_class(self.id_mapper, sub_type=AbsIdMapper)
+		return self.id_mapper # type: ignore[return-value]
+
 
-		return self.id_mapper.to_ext_id(ampel_id)
+	def _cache_ext_names(self, names: dict[StockId, str]) -> dict[StockId, str]:
+		self._ext_names.update(names)
+		while len(self._ext_names) > self._ext_names_max:
+			self._ext_names.popitem(last=False)
+		return names
 
 
 	def get_compression_behavior(self) -> int:
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-plot/ampel-plot/ampel/plot/cache.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                17.10.2026
+# Last Modified Date:  17.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+import hashlib
+from collections import OrderedDict
+from typing import Any
+from bson import ObjectId # type: ignore[import]
+from pymongo.collection import Collection # type: ignore[import]
+from ampel.types import Tag, OneOrMany
+from ampel.content.NewSVGRecord import NewSVGRecord
+from ampel.model.PlotProperties import PlotProperties
+
+
+def plot_fingerprint(
+	data: Any,
+	props: None | PlotProperties = None,
+	extra: None | dict[str, Any] = None,
+	tag_complement: None | OneOrMany[Tag] = None
+) -> str:
+	"""
+	:param data: input data of the figure. Supported are (nested) dicts, lists, tuples, sets,
+	str, bytes, numbers, None and objects providing a tobytes() method (numpy arrays).
+	Other objects are fingerprinted using their repr().
+	Data should contain everything influencing the figure, including the version
+	of the plotting code if needed.
+	:returns: hex digest of the provided data and plot properties
+	"""
+	h = hashlib.blake2b(digest_size=16)
+	_feed(h, data)
+	_feed(h, props.dict() if props else None)
+	_feed(h, extra)
+	_feed(h, tag_complement)
+	return h.hexdigest()
+
+
+def _feed(h: Any, v: Any) -> None:
+
+	if v is None or isinstance(v, (bool, int, float)):
+		h.update(b"n" + repr(v).encode())
+	elif isinstance(v, str):
+		h.update(b"s%i:" % len(v) + v.encode("utf8"))
+	elif isinstance(v, (bytes, bytearray, memoryview)):
+		h.update(b"b%i:" % len(v) + bytes(v))
+	elif isinstance(v, dict):
+		h.update(b"d%i:" % len(v))
+		for k in sorted(v, key=repr):
+			_feed(h, k)
+			_feed(h, v[k])
+	elif isinstance(v, (list, tuple)):
+		h.update(b"l%i:" % len(v))
+		for el in v:
+			_feed(h, el)
+	elif isinstance(v, (set, frozenset)):
+		_feed(h, sorted(v, key=repr))
+	elif hasattr(v, "tobytes"):
+		# numpy arrays: dtype and shape matter as well
+		_feed(h, (str(getattr(v, "dtype", "")), tuple(getattr(v, "shape", ())), v.tobytes()))
+	else:
+		h.update(b"r" + repr(v).encode("utf8"))
+
+
+class PlotCache:
+	"""
+	Fingerprint based memoization of plot records (see create_plot_record parameter 'data').
+	Records are looked up in a local LRU cache and, if a plot collection is provided,
+	in the 'fingerprint' field of the plots saved by AmpelPlotAdapter.
+	Hits return reference records: the 'svg' value of detached plots already saved
+	into the DB is the ObjectId of the plot document (side-loaded by SVGLoader).
+	References are flagged 'detached': AmpelPlotAdapter does not insert them again
+	but adds the current run id to the referenced plot (selection by run remains complete).
+
+	Example::
+
+		cache = PlotCache(self.context.db.get_collection('plot'))
+		rec = create_plot_record(partial(make_fig, dps), self.plot, data=dps, cache=cache)
+	"""
+
+	def __init__(self, col: None | Collection = None, max_size: int = 10_000) -> None:
+		self._col = col
+		self._max_size = max_size
+		self._records: OrderedDict[str, NewSVGRecord] = OrderedDict()
+
+
+	def get(self, fingerprint: str) -> None | NewSVGRecord:
+
+		if (rec := self._records.get(fingerprint)) is not None:
+			self._records.move_to_end(fingerprint)
+			return _reference(rec)
+
+		if self._col is not None and (
+			doc := self._col.find_one(
+				{'fingerprint': fingerprint},
+				{'name': 1, 'title': 1, 'tag': 1, 'hash': 1, 'codec': 1, 'dict_id': 1}
+			)
+		):
+			doc['svg'] = doc.pop('_id')
+			doc['fingerprint'] = fingerprint
+			self.add(fingerprint, doc) # type: ignore[arg-type]
+			return _reference(doc) # type: ignore[arg-type]
+
+		return None
+
+
+	def add(self, fingerprint: str, rec: NewSVGRecord) -> None:
+		"""
+		Note that detached records are cached by reference: once processed by AmpelPlotAdapter,
+		their 'svg' value is the ObjectId of the saved plot
+		"""
+		self._records[fingerprint] = rec
+		self._records.move_to_end(fingerprint)
+		while len(self._records) > self._max_size:
+			self._records.popitem(last=False)
+
+
+def _reference(rec: NewSVGRecord) -> NewSVGRecord:
+	if isinstance(rec['svg'], ObjectId):
+		ref = {k: v for k, v in rec.items() if k not in ('svg_str', 'data')}
+		ref['detached'] = True # see AmpelPlotAdapter
+		return ref # type: ignore[return-value]
+	# Record not saved yet (or not detached)
+	return rec.copy()
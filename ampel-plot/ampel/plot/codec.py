@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-plot/ampel-plot/ampel/plot/codec.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                17.10.2026
+# Last Modified Date:  17.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+import io, zipfile
+from abc import ABC, abstractmethod
+from typing import Any, Literal, Protocol
+from collections.abc import Callable, Iterable
+from ampel.util.compression import TCompression, decompress as zip_decompress
+
+TPlotCompression = Literal[TCompression, 'ZSTD', 'LZ4']
+
+
+class SVGCompressor(Protocol):
+	""" Incremental compressor returned by SVGCodec.compressor(...) """
+
+	def write(self, b: bytes) -> int:
+		...
+
+	def finish(self) -> bytes:
+		...
+
+
+class SVGCodec(ABC):
+	"""
+	Base class for svg compression codecs.
+	Subclasses define the class attributes name and magic and implement compressor() and decompress().
+	Codecs are registered by name (see register_codec), the name is saved into
+	the 'codec' field of plot records and used to select the matching decoder.
+	Records lacking this field are decoded using the magic bytes of the payload.
+	Codecs supporting compression dictionaries accept the id of a registered dictionary
+	(see register_zstd_dict), which is saved into the 'dict_id' field of plot records.
+	"""
+
+	name: str
+	magic: bytes
+
+	@abstractmethod
+	def compressor(self,
+		file_name: str, compression_level: int = 9, dict_id: None | int = None
+	) -> SVGCompressor:
+		...
+
+	def compress(self,
+		payload: bytes, file_name: str, compression_level: int = 9, dict_id: None | int = None
+	) -> bytes:
+		c = self.compressor(file_name, compression_level, dict_id)
+		c.write(payload)
+		return c.finish()
+
+	@abstractmethod
+	def decompress(self, payload: bytes | memoryview, dict_id: None | int = None) -> bytes:
+		...
+
+	def _no_dict(self, dict_id: None | int) -> None:
+		if dict_id is not None:
+			raise ValueError(f"Codec {self.name} does not support compression dictionaries")
+
+
+class ZipCompressor:
+
+	def __init__(self, alg: TCompression, file_name: str, compression_level: int = 9) -> None:
+		self._outbio = io.BytesIO()
+		self._zf = zipfile.ZipFile(
+			self._outbio, "w", getattr(zipfile, alg), False,
+			compresslevel = compression_level
+		)
+		self._zfh = self._zf.open(file_name, "w")
+
+	def write(self, b: bytes) -> int:
+		return self._zfh.write(b)
+
+	def finish(self) -> bytes:
+		self._zfh.close()
+		self._zf.close()
+		return self._outbio.getvalue()
+
+
+class ZipCodec(SVGCodec):
+	""" Zip archives (as produced by ampel.util.compression) """
+
+	magic = b"PK\x03\x04"
+
+	def __init__(self, alg: TCompression) -> None:
+		self.name = alg
+
+	def compressor(self,
+		file_name: str, compression_level: int = 9, dict_id: None | int = None
+	) -> ZipCompressor:
+		self._no_dict(dict_id)
+		return ZipCompressor(self.name, file_name, compression_level) # type: ignore[arg-type]
+
+	def decompress(self, payload: bytes | memoryview, dict_id: None | int = None) -> bytes:
+		return zip_decompress(bytes(payload)) # no copy of bytes objects
+
+
+class ZstdCompressor:
+
+	def __init__(self, compression_level: int = 9, dict_id: None | int = None) -> None:
+		import zstandard # type: ignore[import]
+		self._outbio = io.BytesIO()
+		self._cobj = zstandard.ZstdCompressor(
+			level = compression_level,
+			dict_data = None if dict_id is None else get_zstd_dict(dict_id)
+		).compressobj()
+
+	def write(self, b: bytes) -> int:
+		self._outbio.write(self._cobj.compress(b))
+		return len(b)
+
+	def finish(self) -> bytes:
+		self._outbio.write(self._cobj.flush())
+		return self._outbio.getvalue()
+
+
+class ZstdCodec(SVGCodec):
+	""" Requires package 'zstandard'. Fast compression and (very) fast decompression """
+
+	name = "ZSTD"
+	magic = b"\x28\xb5\x2f\xfd"
+
+	def compressor(self,
+		file_name: str, compression_level: int = 9, dict_id: None | int = None
+	) -> ZstdCompressor:
+		return ZstdCompressor(compression_level, dict_id)
+
+	def decompress(self, payload: bytes | memoryview, dict_id: None | int = None) -> bytes:
+		import zstandard # type: ignore[import]
+		if dict_id is None:
+			# zstd frames reference the id of the dictionary used for compression (0: none)
+			dict_id = zstandard.get_frame_parameters(payload).dict_id or None
+		# Frames produced by compressor objects do not include the content size
+		return zstandard.ZstdDecompressor(
+			dict_data = None if dict_id is None else get_zstd_dict(dict_id)
+		).decompressobj().decompress(payload)
+
+
+class LZ4Compressor:
+
+	def __init__(self, compression_level: int = 9) -> None:
+		import lz4.frame # type: ignore[import]
+		self._outbio = io.BytesIO()
+		self._cobj = lz4.frame.LZ4FrameCompressor(compression_level=compression_level)
+		self._outbio.write(self._cobj.begin())
+
+	def write(self, b: bytes) -> int:
+		self._outbio.write(self._cobj.compress(b))
+		return len(b)
+
+	def finish(self) -> bytes:
+		self._outbio.write(self._cobj.flush())
+		return self._outbio.getvalue()
+
+
+class LZ4Codec(SVGCodec):
+	""" Requires package 'lz4'. Lower compression ratio but fastest decompression """
+
+	name = "LZ4"
+	magic = b"\x04\x22\x4d\x18"
+
+	def compressor(self,
+		file_name: str, compression_level: int = 9, dict_id: None | int = None
+	) -> LZ4Compressor:
+		self._no_dict(dict_id)
+		return LZ4Compressor(compression_level)
+
+	def decompress(self, payload: bytes | memoryview, dict_id: None | int = None) -> bytes:
+		import lz4.frame # type: ignore[import]
+		return lz4.frame.decompress(payload)
+
+
+_codecs: dict[str, SVGCodec] = {}
+
+
+def register_codec(codec: SVGCodec) -> None:
+	""" :raises ValueError: if the codec does not define a name and magic bytes """
+	if not getattr(codec, 'name', None) or not getattr(codec, 'magic', None):
+		raise ValueError(f"Codec {type(codec).__name__} must define attributes 'name' and 'magic'")
+	_codecs[codec.name] = codec
+
+
+def get_codec(name: str) -> SVGCodec:
+	if name not in _codecs:
+		raise ValueError(f"Unknown compression codec: {name}")
+	return _codecs[name]
+
+
+def guess_codec(payload: bytes | memoryview) -> SVGCodec:
+	""" Selects codec using the magic bytes of the provided payload """
+	head = bytes(payload[:8])
+	for codec in _codecs.values():
+		if head.startswith(codec.magic):
+			return codec
+	raise ValueError("Unrecognized compression format")
+
+
+def decompress_svg(payload: bytes | memoryview, codec: None | str = None, dict_id: None | int = None) -> str:
+	"""
+	:param codec: name of the codec used for compression (value of SVGRecord 'codec').
+	If None, the codec is guessed from the payload.
+	:param dict_id: id of the compression dictionary (value of SVGRecord 'dict_id')
+	"""
+	return str(
+		(get_codec(codec) if codec else guess_codec(payload)).decompress(payload, dict_id),
+		"utf8"
+	)
+
+
+# Zstd dictionaries
+###################
+
+_zdicts: dict[int, Any] = {}
+_zdict_files: dict[str, int] = {}
+_zdict_loaders: list[Callable[[int], None | bytes]] = []
+
+
+def train_zstd_dict(samples: Iterable[bytes | str], dict_size: int = 112640, level: int = 9) -> bytes:
+	"""
+	Trains a zstd dictionary using (uncompressed) svg samples.
+	Matplotlib svgs share most of their structure (defs, styles, glyphs, axes),
+	which is what the dictionary captures.
+	:returns: dictionary content, the dictionary id is embedded in it (see register_zstd_dict)
+	"""
+	import zstandard # type: ignore[import]
+	return zstandard.train_dictionary(
+		dict_size,
+		[el.encode("utf8") if isinstance(el, str) else el for el in samples],
+		level = level
+	).as_bytes()
+
+
+def register_zstd_dict(data: bytes) -> int:
+	""" :returns: the dictionary id """
+	import zstandard # type: ignore[import]
+	zd = zstandard.ZstdCompressionDict(data)
+	_zdicts[zd.dict_id()] = zd
+	return zd.dict_id()
+
+
+def load_zstd_dict(path: str) -> int:
+	"""
+	Loads and registers the dictionary saved in the provided file
+	(files are loaded only once per process).
+	:returns: the dictionary id
+	"""
+	if path not in _zdict_files:
+		with open(path, "rb") as f:
+			_zdict_files[path] = register_zstd_dict(f.read())
+	return _zdict_files[path]
+
+
+def add_zstd_dict_loader(loader: Callable[[int], None | bytes]) -> None:
+	"""
+	:param loader: callable returning the content of the dictionary with the provided id
+	(or None if unknown). Used when decompressing records referencing unregistered dictionaries.
+	"""
+	if loader not in _zdict_loaders:
+		_zdict_loaders.append(loader)
+
+
+def get_zstd_dict(dict_id: int) -> Any:
+	""" :returns: zstandard.ZstdCompressionDict instance """
+
+	if dict_id not in _zdicts:
+		for loader in _zdict_loaders:
+			if (data := loader(dict_id)) is not None:
+				register_zstd_dict(data)
+				break
+		else:
+			raise ValueError(f"Unknown zstd dictionary: {dict_id}")
+
+	return _zdicts[dict_id]
+
+
+for el in ('ZIP_DEFLATED', 'ZIP_BZIP2', 'ZIP_LZMA'):
+	register_codec(ZipCodec(el)) # type: ignore[arg-type]
+
+register_codec(ZstdCodec())
+register_codec(LZ4Codec())
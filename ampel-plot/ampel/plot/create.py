@@ -4,36 +4,62 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                17.05.2019
-# Last Modified Date:  27.04.2022
+# Last Modified Date:  17.10.2026
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-import io, os
+import io, os, hashlib
+import numpy as np
 import matplotlib as plt
 from matplotlib.figure import Figure
+from matplotlib.collections import Collection
+from matplotlib.lines import Line2D
+from multiprocessing import Pool
+from collections.abc import Callable, Sequence
 from typing import Any
 
 from ampel.types import Tag, OneOrMany
 from ampel.content.NewSVGRecord import NewSVGRecord
 from ampel.protocol.LoggerProtocol import LoggerProtocol
 from ampel.model.PlotProperties import PlotProperties
-from ampel.util.compression import TCompression, compress as compress_func
+from ampel.plot.codec import TPlotCompression, get_codec, load_zstd_dict
+from ampel.plot.minify import minify_svg
+from ampel.plot.cache import PlotCache, plot_fingerprint
 from ampel.util.tag import merge_tags
 
 
 def create_plot_record(
-	mpl_fig: Figure,
+	mpl_fig: Figure | Callable[[], Figure],
 	props: PlotProperties,
 	extra: None | dict[str, Any] = None,
 	tag_complement: None | OneOrMany[Tag] = None,
-	close: bool = True, logger: None | LoggerProtocol = None
+	close: bool = True, logger: None | LoggerProtocol = None,
+	data: Any = None,
+	cache: None | PlotCache = None
 ) -> NewSVGRecord:
 	"""
+	:param mpl_fig: matplotlib figure or callable returning a figure
+	(the figure is then not even created if the plot is found in cache)
 	:param extra: required if file_name, title or fig_text in PlotProperties use a format string ("such_%s_this")
+	:param data: input data of the figure. If provided with a cache, rendering is skipped
+	when a plot with the same fingerprint (data, props, extra, tag_complement) is known.
+	Rendered records carry the fingerprint in key 'fingerprint'.
+	:param cache: see ampel.plot.cache.PlotCache
 	"""
 
+	fingerprint = None
+	if cache is not None and data is not None:
+		fingerprint = plot_fingerprint(data, props, extra, tag_complement)
+		if (rec := cache.get(fingerprint)) is not None:
+			if logger:
+				logger.info("Plot %s unchanged (fingerprint %s)" % (rec['name'], fingerprint))
+			if close and isinstance(mpl_fig, Figure):
+				plt.pyplot.close(mpl_fig)
+			return rec
+
+	file_name = props.get_file_name(extra=extra)
 	svg_doc = fig_to_plot_record(
-		mpl_fig,
-		file_name = props.get_file_name(extra=extra),
+		mpl_fig if isinstance(mpl_fig, Figure) else mpl_fig(),
+		file_name = file_name,
 		title = props.get_title(extra=extra),
 		fig_include_title = props.fig_include_title,
 		width = props.width,
@@ -42,13 +68,18 @@ def create_plot_record(
 		compression_behavior = props.get_compression_behavior(),
 		compression_alg = props.compression_alg,
 		compression_level = props.compression_level,
+		compression_dict = props.compression_dict,
+		minify = props.minify.dict() if props.minify else None,
+		rasterize_threshold = props.rasterize_threshold,
+		rasterize_dpi = props.rasterize_dpi,
+		rasterize_report = props.rasterize_report,
 		detached = props.detached,
 		logger = logger,
 		close = close
 	)
 
 	if props.disk_save:
-		fname = os.path.join(props.disk_save, props.get_file_name(extra=extra))
+		fname = os.path.join(props.disk_save, file_name)
 		if logger and getattr(logger, "verbose", 0) > 1:
 			logger.debug(f"Saving {fname}")
 		with open(fname, "w") as f:
@@ -58,17 +89,118 @@ def create_plot_record(
 				else svg_doc['svg']
 			)
 
+	if fingerprint:
+		svg_doc['fingerprint'] = fingerprint
+		cache.add(fingerprint, svg_doc) # type: ignore[union-attr]
+
 	return svg_doc
 
 
+def create_plot_records(
+	figs: Sequence[Figure | Callable[[], Figure]],
+	props: PlotProperties,
+	extras: None | Sequence[None | dict[str, Any]] = None,
+	tag_complements: None | Sequence[None | OneOrMany[Tag]] = None,
+	processes: None | int = None,
+	chunksize: int = 1,
+	logger: None | LoggerProtocol = None,
+	data: None | Sequence[Any] = None,
+	cache: None | PlotCache = None
+) -> list[NewSVGRecord]:
+	"""
+	Batch version of create_plot_record(...).
+	SVG serialization and compression of the provided figures is spread over a pool of processes.
+
+	:param figs: matplotlib figures or picklable callables (module level functions, partials)
+	returning a figure. With callables, figures are also created by the worker processes
+	which spares the cost of pickling them.
+	:param extras: one 'extra' dict per figure (see create_plot_record)
+	:param tag_complements: one tag complement per figure (see create_plot_record)
+	:param processes: number of worker processes, defaults to os.cpu_count().
+	Values 0 or 1 disable multiprocessing.
+	:param chunksize: number of figures sent to a worker at once
+	:param data: input data of each figure, figures found in cache are not rendered
+	(see create_plot_record)
+	:param cache: see ampel.plot.cache.PlotCache (lookups happen in the calling process)
+	:returns: records in input order. Figures provided as argument are always closed.
+	"""
+
+	if extras is not None and len(extras) != len(figs):
+		raise ValueError("Parameter extras must contain one element per figure")
+
+	if tag_complements is not None and len(tag_complements) != len(figs):
+		raise ValueError("Parameter tag_complements must contain one element per figure")
+
+	if data is not None and len(data) != len(figs):
+		raise ValueError("Parameter data must contain one element per figure")
+
+	ret: list[None | NewSVGRecord] = [None] * len(figs)
+	fingerprints: list[None | str] = [None] * len(figs)
+	args = []
+
+	for i, f in enumerate(figs):
+		extra = extras[i] if extras else None
+		tag_complement = tag_complements[i] if tag_complements else None
+		if cache is not None and data is not None and data[i] is not None:
+			fingerprints[i] = plot_fingerprint(data[i], props, extra, tag_complement)
+			ret[i] = cache.get(fingerprints[i]) # type: ignore[arg-type]
+			if ret[i] is not None:
+				continue
+		args.append((f, props, extra, tag_complement))
+
+	try:
+		if processes in (0, 1) or len(args) < 2:
+			recs = [_create_plot_record(*el) for el in args]
+		else:
+			with Pool(processes) as pool:
+				recs = pool.starmap(_create_plot_record, args, chunksize)
+	finally:
+		for f in figs:
+			if isinstance(f, Figure):
+				plt.pyplot.close(f)
+
+	it = iter(recs)
+	for i, el in enumerate(ret):
+		if el is not None:
+			if logger:
+				logger.info("Plot %s unchanged (fingerprint %s)" % (el['name'], fingerprints[i]))
+			continue
+		ret[i] = rec = next(it)
+		if fp := fingerprints[i]:
+			rec['fingerprint'] = fp
+			cache.add(fp, rec) # type: ignore[union-attr]
+		if logger:
+			logger.info("Saved plot %s" % rec['name'])
+
+	return ret # type: ignore[return-value]
+
+
+def _create_plot_record(
+	fig: Figure | Callable[[], Figure],
+	props: PlotProperties,
+	extra: None | dict[str, Any],
+	tag_complement: None | OneOrMany[Tag]
+) -> NewSVGRecord:
+	""" Used by create_plot_records(...), runs in worker processes """
+	return create_plot_record(
+		fig if isinstance(fig, Figure) else fig(),
+		props, extra, tag_complement, close=True
+	)
+
+
 def fig_to_plot_record(
 	mpl_fig: Figure,
 	file_name: str,
 	title: None | str = None,
 	tags: None | OneOrMany[Tag] = None,
 	compression_behavior: int = 1,
-	compression_alg: TCompression = "ZIP_DEFLATED",
+	compression_alg: TPlotCompression = "ZIP_DEFLATED",
 	compression_level: int = 9,
+	compression_dict: None | int | str = None,
+	minify: None | dict[str, Any] = None,
+	rasterize_threshold: None | int = None,
+	rasterize_dpi: int = 150,
+	rasterize_report: bool = False,
 	width: None | int = None,
 	height: None | int = None,
 	close: bool = True,
@@ -84,25 +216,49 @@ def fig_to_plot_record(
 		1: compression_behavior svg, 'svg' value will be compressed bytes (usage: store plots into db)
 		2: compression_behavior svg and include uncompressed string into key 'sgv_str'
 		(useful for saving plots into db and additionaly to disk for offline analysis)
+	:param compression_alg: name of a registered codec (see ampel.plot.codec),
+	the name is saved into the 'codec' field of the returned record
+	:param compression_dict: path to a zstd dictionary file or id of a registered dictionary
+	(codec ZSTD only), the dictionary id is saved into the 'dict_id' field of the returned record
+	:param minify: if set, the svg is optimized before compression using
+	ampel.plot.minify.minify_svg(...) with the provided arguments
+	:param rasterize_threshold: artists (scatter collections, lines, ...) made of more elements
+	than this threshold are rasterized, axes and text remain vectorial (see rasterize_dense_artists)
+	:param rasterize_dpi: resolution of rasterized artists
+	:param rasterize_report: log the number of svg bytes saved by rasterization
+	(requires a logger, the figure is rendered twice)
 	:param width: figure width, for example 10 inches
 	:param height: figure height, for example 10 inches
-	:returns: svg dict instance
+	:returns: svg dict instance. Key 'hash' contains a digest of the uncompressed svg
+	(figure rendering is made deterministic for this purpose)
 	"""
 
 	if logger:
 		logger.info("Saving plot %s" % file_name)
 
-	imgdata = io.StringIO()
-
 	if width is not None and height is not None:
 		mpl_fig.set_size_inches(width, height)
 
 	if title and fig_include_title:
 		mpl_fig.suptitle(title)
 
-	mpl_fig.savefig(imgdata, format='svg', bbox_inches='tight')
-	if close:
-		plt.pyplot.close(mpl_fig)
+	savefig_kwargs: dict[str, Any] = {}
+	vector_size = 0 # svg size without rasterization (computed if rasterize_report is set)
+
+	if rasterize_threshold is not None:
+
+		if rasterize_report and logger:
+			vsink = SVGSink(None)
+			_savefig(mpl_fig, vsink, **savefig_kwargs)
+			vsink.flush()
+			vector_size = vsink.nbytes
+
+		if (n := rasterize_dense_artists(mpl_fig, rasterize_threshold)):
+			savefig_kwargs['dpi'] = rasterize_dpi
+			if logger:
+				logger.info(f"Rasterizing {n} artist(s) of {file_name}")
+		else:
+			vector_size = 0
 
 	ret: NewSVGRecord = {'name': file_name}
 
@@ -114,23 +270,152 @@ def fig_to_plot_record(
 
 	ret['detached'] = detached
 
-	if compression_behavior == 0:
-		ret['svg'] = imgdata.getvalue()
+	dict_id = load_zstd_dict(compression_dict) if isinstance(compression_dict, str) else compression_dict
+
+	if compression_behavior == 0 or minify is not None:
+
+		imgdata = io.StringIO()
+		_savefig(mpl_fig, imgdata, **savefig_kwargs)
+		if close:
+			plt.pyplot.close(mpl_fig)
+
+		svg = imgdata.getvalue()
+		del imgdata
+		if vector_size:
+			_report_rasterization(file_name, vector_size, len(svg.encode('utf8')), logger) # type: ignore[arg-type]
+		if minify is not None:
+			svg = minify_svg(svg, **minify)
+
+		ret['hash'] = hashlib.blake2b(svg.encode('utf8'), digest_size=16).hexdigest()
+		if compression_behavior == 0:
+			ret['svg'] = svg
+			return ret
+
+		ret['svg'] = get_codec(compression_alg).compress(
+			svg.encode('utf8'), file_name, compression_level, dict_id
+		)
+		ret['codec'] = compression_alg
+		if dict_id is not None:
+			ret['dict_id'] = dict_id
+		if compression_behavior == 2:
+			ret['svg_str'] = svg
+
 		return ret
 
-	ret['svg'] = compress_func(
-		imgdata.getvalue().encode('utf8'),
-		file_name,
-		alg = compression_alg,
-		compression_level = compression_level
-	)
+	# matplotlib's svg writer output is encoded and compressed chunk-wise,
+	# the uncompressed svg string is only built if requested
+	compressor = get_codec(compression_alg).compressor(file_name, compression_level, dict_id)
+	sink = SVGSink(compressor, keep = compression_behavior == 2)
+	_savefig(mpl_fig, sink, **savefig_kwargs)
+	sink.flush()
+	if vector_size:
+		_report_rasterization(file_name, vector_size, sink.nbytes, logger) # type: ignore[arg-type]
+
+	if close:
+		plt.pyplot.close(mpl_fig)
+
+	ret['svg'] = compressor.finish()
+	ret['hash'] = sink.hexdigest()
+	ret['codec'] = compression_alg
+	if dict_id is not None:
+		ret['dict_id'] = dict_id
 
 	if compression_behavior == 2:
-		ret['svg_str'] = imgdata.getvalue()
+		ret['svg_str'] = sink.get_str()
 
 	return ret
 
 
+def _savefig(mpl_fig: Figure, fh: Any, **kwargs) -> None:
+	# Fixed hash salt (ids of svg elements) and no creation date:
+	# identical figures result in identical svgs (see SVGRecord 'hash')
+	with plt.rc_context({'svg.hashsalt': 'ampel'}):
+		mpl_fig.savefig(
+			fh, format='svg', bbox_inches='tight', metadata={'Date': None}, **kwargs
+		)
+
+
+def _report_rasterization(file_name: str, vector_size: int, size: int, logger: LoggerProtocol) -> None:
+	logger.info(
+		f"Rasterization of {file_name} reduced svg size from {vector_size} "
+		f"to {size} bytes ({vector_size - size} bytes saved)"
+	)
+
+
+def rasterize_dense_artists(mpl_fig: Figure, threshold: int) -> int:
+	"""
+	Activates matplotlib's per-artist rasterization for artists of the figure's axes
+	made of more than 'threshold' elements (markers, path vertices, sub-paths).
+	Axes, ticks and text remain vectorial. Bounds the size of svgs created for dense
+	scatter/corner plots (BSON documents are limited to 16MB).
+	:returns: number of rasterized artists
+	"""
+
+	n = 0
+	for ax in mpl_fig.axes:
+		for artist in ax.get_children():
+			if isinstance(artist, Collection):
+				count = max(np.shape(artist.get_offsets())[0], len(artist.get_paths()))
+			elif isinstance(artist, Line2D):
+				count = np.shape(artist.get_xydata())[0]
+			else:
+				continue
+			if count > threshold and not artist.get_rasterized():
+				artist.set_rasterized(True)
+				n += 1
+	return n
+
+
+class SVGSink(io.RawIOBase):
+	"""
+	Binary file-like object passed to matplotlib's savefig(...).
+	matplotlib encodes the svg output to utf-8 when writing into binary streams;
+	the resulting (small) chunks are buffered and forwarded to the underlying stream
+	(typically an incremental compressor) once the buffer size exceeds 'buffer_size'.
+	"""
+
+	def __init__(self, fh: Any, keep: bool = False, buffer_size: int = 1 << 16) -> None:
+		"""
+		:param fh: writable binary stream. If None, written bytes are only counted (see nbytes)
+		:param keep: keep a reference to the written chunks (required by get_str())
+		"""
+		self._fh = fh
+		self._buf = bytearray()
+		self._buffer_size = buffer_size
+		self._chunks: None | list[bytes] = [] if keep else None
+		self._hash = hashlib.blake2b(digest_size=16)
+		self.nbytes = 0
+
+	def writable(self) -> bool:
+		return True
+
+	def write(self, b: bytes) -> int: # type: ignore[override]
+		self._buf += b
+		if len(self._buf) > self._buffer_size:
+			self.flush()
+		return len(b)
+
+	def flush(self) -> None:
+		if self._buf:
+			chunk = bytes(self._buf)
+			if self._fh is not None:
+				self._fh.write(chunk)
+			self._hash.update(chunk)
+			self.nbytes += len(chunk)
+			if self._chunks is not None:
+				self._chunks.append(chunk)
+			self._buf.clear()
+
+	def hexdigest(self) -> str:
+		""" :returns: blake2b digest (16 bytes) of the written data """
+		return self._hash.hexdigest()
+
+	def get_str(self) -> str:
+		if self._chunks is None:
+			raise ValueError("SVGSink was created with keep=False")
+		return b"".join(self._chunks).decode("utf8")
+
+
 def get_tags_as_str(
 	plot_tag: None | OneOrMany[Tag] = None,
 	extra_tags: None | OneOrMany[Tag] = None
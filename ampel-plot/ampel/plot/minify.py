@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-plot/ampel-plot/ampel/plot/minify.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                17.10.2026
+# Last Modified Date:  17.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+import re
+
+# Attributes containing coordinates (transform is handled separately)
+coord_attrs = re.compile(r'\s(d|points|x|y|x1|x2|y1|y2|cx|cy|r|rx|ry|width|height|viewBox)="([^"]*)"')
+translate = re.compile(r'translate\(([^)]*)\)')
+float_num = re.compile(r'-?\d+\.\d+')
+metadata = re.compile(r'\s*<metadata>.*?</metadata>', re.DOTALL)
+comment = re.compile(r'\s*<!--.*?-->', re.DOTALL)
+doctype = re.compile(r'\s*<!DOCTYPE[^>]*>', re.DOTALL)
+defs_block = re.compile(r'<defs>(.*?)</defs>', re.DOTALL)
+path_def = re.compile(r'\s*<path id="([^"]+)"([^>]*)/>')
+clip_def = re.compile(r'\s*<clipPath id="([^"]+)">(.*?)</clipPath>', re.DOTALL)
+empty_defs = re.compile(r'\s*<defs>\s*</defs>')
+identity_transform = re.compile(
+	r'\stransform="(?:translate\(0[ ,]0\)|scale\(1\)|matrix\(1[ ,]0[ ,]0[ ,]1[ ,]0[ ,]0\))"'
+)
+g_tag = re.compile(r'(\s*)<(/?)g\b([^>]*)>')
+g_id = re.compile(r'\sid="([^"]+)"')
+id_ref = re.compile(r'#([^")\s]+)')
+
+
+def minify_svg(
+	svg: str,
+	precision: None | int = 2,
+	dedup_defs: bool = True,
+	strip_metadata: bool = True,
+	collapse_groups: bool = True
+) -> str:
+	"""
+	Reduces the size of svgs generated by matplotlib without altering their rendering
+	(within the limits of the provided precision).
+
+	:param precision: number of decimals kept for coordinates (path data, positions and translations).
+	Scale factors and matrices are left unchanged. 2 decimals correspond to 1/7200 inch.
+	:param dedup_defs: merge identical <path> and <clipPath> definitions and update references
+	:param strip_metadata: remove <metadata> (creation date, creator), comments and doctype
+	:param collapse_groups: remove identity transforms, unreferenced group ids
+	and groups left without attributes. Only literal identity transforms are removed
+	(translate(0 0), scale(1), matrix(1 0 0 1 0 0)), groups keeping any attribute
+	(style, clip-path, non-identity transform) are left in place and nested translates
+	are not merged into their children.
+
+	Note that precision and collapse_groups are lossy (the svg text differs),
+	see tests/test_minify.py for the rendering tolerance.
+	"""
+
+	if strip_metadata:
+		svg = doctype.sub("", metadata.sub("", comment.sub("", svg)))
+
+	if precision is not None:
+
+		def fmt(m: re.Match) -> str:
+			s = f"{float(m.group(0)):.{precision}f}".rstrip("0").rstrip(".")
+			return "0" if s == "-0" else s
+
+		svg = coord_attrs.sub(
+			lambda m: f' {m.group(1)}="{float_num.sub(fmt, " ".join(m.group(2).split()))}"',
+			svg
+		)
+		svg = translate.sub(lambda m: f'translate({float_num.sub(fmt, m.group(1))})', svg)
+
+	if dedup_defs:
+		svg = _dedup_defs(svg)
+
+	if collapse_groups:
+		svg = _collapse_groups(identity_transform.sub("", svg))
+
+	return svg
+
+
+def _dedup_defs(svg: str) -> str:
+
+	# id of duplicate -> id of first definition
+	paths: dict[str, str] = {}
+	clips: dict[str, str] = {}
+	dups: dict[str, str] = {}
+
+	def sub_path(m: re.Match) -> str:
+		if m.group(2) in paths:
+			dups[m.group(1)] = paths[m.group(2)]
+			return ""
+		paths[m.group(2)] = m.group(1)
+		return m.group(0)
+
+	def sub_clip(m: re.Match) -> str:
+		k = " ".join(m.group(2).split())
+		if k in clips:
+			dups[m.group(1)] = clips[k]
+			return ""
+		clips[k] = m.group(1)
+		return m.group(0)
+
+	svg = defs_block.sub(
+		lambda m: "<defs>" + clip_def.sub(sub_clip, path_def.sub(sub_path, m.group(1))) + "</defs>",
+		svg
+	)
+
+	if not dups:
+		return svg
+
+	svg = re.sub(
+		r'(xlink:href="#|url\(#)([^")]+)',
+		lambda m: m.group(1) + dups.get(m.group(2), m.group(2)),
+		svg
+	)
+
+	return empty_defs.sub("", svg)
+
+
+def _collapse_groups(svg: str) -> str:
+
+	refs = set(id_ref.findall(svg))
+	stack: list[bool] = [] # True: group tag was removed
+
+	def sub_g(m: re.Match) -> str:
+
+		if m.group(2): # closing tag
+			return "" if stack.pop() else m.group(0)
+
+		attrs = g_id.sub(lambda mm: mm.group(0) if mm.group(1) in refs else "", m.group(3))
+		if attrs.strip() == "/": # self-closing empty group
+			return ""
+
+		if attrs.strip():
+			if not attrs.endswith("/"):
+				stack.append(False)
+			return f"{m.group(1)}<g{attrs}>"
+
+		stack.append(True)
+		return ""
+
+	return g_tag.sub(sub_g, svg)
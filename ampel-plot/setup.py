@@ -25,5 +25,5 @@ setup(
 		]
 	},
 	python_requires = '>=3.10,<3.12',
-	extras_require={"MPL": ["matplotlib"]},
+	extras_require={"MPL": ["matplotlib"], "ZSTD": ["zstandard"], "LZ4": ["lz4"]},
 )
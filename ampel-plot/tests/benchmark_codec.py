@@ -0,0 +1,58 @@
+"""
+Compression ratio, compression and decompression speed of the registered svg codecs (see ampel.plot.codec)
+on a corpus of light curve svgs.
+Usage: python benchmark_codec.py [number of svgs]
+"""
+
+import sys
+from time import perf_counter
+from ampel.plot.codec import get_codec, _codecs
+from figures import svg_corpus
+
+
+def run(corpus: list[bytes], compression_level: int = 9, repeat: int = 3) -> dict[str, dict[str, float]]:
+	"""
+	Codecs whose package is not installed are skipped.
+	:returns: codec name -> {'ratio', 'compress' (MB/s), 'decompress' (MB/s)}
+	"""
+
+	size = sum(len(el) for el in corpus)
+	res: dict[str, dict[str, float]] = {}
+
+	for name in _codecs:
+
+		codec = get_codec(name)
+		try:
+			codec.compress(corpus[0], "svg", compression_level)
+		except ImportError:
+			continue
+
+		tc = td = float("inf")
+		for i in range(repeat):
+			t = perf_counter()
+			payloads = [codec.compress(el, "svg", compression_level) for el in corpus]
+			tc = min(tc, perf_counter() - t)
+			t = perf_counter()
+			for p in payloads:
+				codec.decompress(p)
+			td = min(td, perf_counter() - t)
+
+		res[name] = {
+			'ratio': size / sum(len(p) for p in payloads),
+			'compress': size / tc / 1e6,
+			'decompress': size / td / 1e6
+		}
+
+	return res
+
+
+def main() -> None:
+	corpus = svg_corpus(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
+	print(f"Corpus: {len(corpus)} svgs, {sum(len(el) for el in corpus) / 1e6:.1f} MB")
+	print(f"{'codec':>13} {'ratio':>7} {'compress MB/s':>14} {'decompress MB/s':>16}")
+	for name, r in sorted(run(corpus).items(), key=lambda x: -x[1]['decompress']):
+		print(f"{name:>13} {r['ratio']:7.1f} {r['compress']:14.1f} {r['decompress']:16.1f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,48 @@
+"""
+Records per second created by create_plot_records(...) with a process pool vs serially
+(light curve figures provided as callables, rendered by the workers).
+Usage: python benchmark_create.py [number of figures] [number of processes]
+"""
+
+import os, sys
+from functools import partial
+from time import perf_counter
+from figures import lightcurve_fig
+from ampel.model.PlotProperties import PlotProperties
+from ampel.plot.create import create_plot_records
+
+
+def run(n: int = 64, processes: None | int = None, repeat: int = 1) -> dict[str, float]:
+	""" :returns: 'serial' / 'pool' -> records per second """
+
+	props = PlotProperties(
+		file_name = {'format_str': 'lc_%s.svg', 'arg_keys': ['stock']}, # type: ignore[arg-type]
+		tags = ['LIGHTCURVE'], compression_alg = 'ZIP_DEFLATED'
+	)
+	figs = [partial(lightcurve_fig, n_points=300, seed=i) for i in range(n)]
+	extras = [{'stock': i} for i in range(n)]
+
+	res: dict[str, float] = {}
+	for k, p in (('serial', 0), ('pool', processes or os.cpu_count())):
+		dt = float("inf")
+		for i in range(repeat):
+			t = perf_counter()
+			recs = create_plot_records(figs, props, extras, processes=p) # type: ignore[arg-type]
+			dt = min(dt, perf_counter() - t)
+		assert [r['name'] for r in recs] == [f"lc_{i}.svg" for i in range(n)]
+		res[k] = n / dt
+	return res
+
+
+def main() -> None:
+	n = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+	processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+	res = run(n, processes)
+	print(f"{n} figures, {processes} processes")
+	for k, v in res.items():
+		print(f"{k:>7}: {v:6.1f} records/s")
+	print(f"speedup: {res['pool'] / res['serial']:.2f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,49 @@
+"""
+Size (uncompressed and compressed) and rendering time of light curve svgs including
+a dense background scatter, with and without rasterization of dense artists
+(see fig_to_plot_record's rasterize_threshold).
+Usage: python benchmark_rasterize.py [max number of background points]
+"""
+
+import sys
+from time import perf_counter
+from figures import lightcurve_fig
+from ampel.plot.create import fig_to_plot_record
+
+
+def run(
+	n_backgrounds: tuple[int, ...] = (0, 1_000, 10_000, 100_000),
+	rasterize_threshold: int = 1000
+) -> dict[int, dict[str, dict[str, float]]]:
+	"""
+	:returns: number of background points -> 'vector'/'rasterized' ->
+	{'svg' (bytes), 'compressed' (bytes), 'time' (s)}
+	"""
+
+	res: dict[int, dict[str, dict[str, float]]] = {}
+	for n in n_backgrounds:
+		res[n] = {}
+		for k, threshold in (('vector', None), ('rasterized', rasterize_threshold)):
+			t = perf_counter()
+			rec = fig_to_plot_record(
+				lightcurve_fig(n_background=n), "lc.svg",
+				compression_behavior = 2, rasterize_threshold = threshold
+			)
+			res[n][k] = {
+				'svg': len(rec['svg_str'].encode()), # type: ignore[typeddict-item]
+				'compressed': len(rec['svg']),
+				'time': perf_counter() - t
+			}
+	return res
+
+
+def main() -> None:
+	max_n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+	print(f"{'background':>10} {'':>10} {'svg kB':>10} {'zip kB':>10} {'time s':>8}")
+	for n, r in run(tuple(n for n in (0, 1_000, 10_000, 100_000, 1_000_000) if n <= max_n)).items():
+		for k, v in r.items():
+			print(f"{n:>10} {k:>10} {v['svg'] / 1e3:10.1f} {v['compressed'] / 1e3:10.1f} {v['time']:8.2f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,56 @@
+"""
+Peak memory (tracemalloc) of fig_to_plot_record(...), which streams the svg output into
+the compressor, vs serializing the figure into a string which is then encoded and compressed
+(previous implementation), for light curves with a dense background scatter.
+Usage: python benchmark_stream.py [max number of background points]
+"""
+
+import io, sys, tracemalloc
+from collections.abc import Callable
+from figures import lightcurve_fig
+from matplotlib.figure import Figure # type: ignore[import]
+from ampel.plot.codec import get_codec
+from ampel.plot.create import fig_to_plot_record
+
+
+def buffered(fig: Figure) -> bytes:
+	""" Previous implementation of fig_to_plot_record (compression_behavior 1) """
+	imgdata = io.StringIO()
+	fig.savefig(imgdata, format='svg', bbox_inches='tight')
+	return get_codec("ZIP_DEFLATED").compress(imgdata.getvalue().encode('utf8'), "lc.svg", 9)
+
+
+def streamed(fig: Figure) -> bytes:
+	return fig_to_plot_record(fig, "lc.svg", compression_alg="ZIP_DEFLATED", close=False)['svg'] # type: ignore[return-value]
+
+
+def peak(f: Callable[[Figure], bytes], fig: Figure) -> tuple[int, int]:
+	""" :returns: peak memory (bytes) during the call, size of the payload """
+	tracemalloc.start()
+	payload = f(fig)
+	ret = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return ret, len(payload)
+
+
+def run(n_backgrounds: tuple[int, ...] = (10_000, 50_000, 100_000)) -> dict[int, dict[str, int]]:
+	""" :returns: number of background points -> {'svg', 'buffered', 'streamed'} (bytes) """
+
+	res: dict[int, dict[str, int]] = {}
+	for n in n_backgrounds:
+		fig = lightcurve_fig(n_background=n)
+		fig.savefig(sink := io.BytesIO(), format='svg', bbox_inches='tight') # warm-up (font cache)
+		res[n] = {'svg': sink.tell(), 'buffered': peak(buffered, fig)[0], 'streamed': peak(streamed, fig)[0]}
+		fig.clf()
+	return res
+
+
+def main() -> None:
+	max_n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+	print(f"{'background':>10} {'svg MB':>8} {'buffered MB':>12} {'streamed MB':>12}")
+	for n, r in run(tuple(n for n in (10_000, 50_000, 100_000, 200_000) if n <= max_n)).items():
+		print(f"{n:>10} {r['svg'] / 1e6:8.1f} {r['buffered'] / 1e6:12.1f} {r['streamed'] / 1e6:12.1f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,43 @@
+"""
+Figures used by tests and benchmarks: light curves similar to those produced by Ampel T2/T3 units
+"""
+
+import io
+import matplotlib # type: ignore[import]
+matplotlib.use("Agg")
+import numpy as np
+import matplotlib.pyplot as plt # type: ignore[import]
+from matplotlib.figure import Figure # type: ignore[import]
+
+
+def lightcurve_fig(n_points: int = 200, seed: int = 0, n_background: int = 0) -> Figure:
+	"""
+	:param n_points: number of datapoints (errorbars, three bands)
+	:param n_background: number of points of a dense background scatter (ex: reference population)
+	"""
+	rng = np.random.default_rng(seed)
+	fig, ax = plt.subplots(figsize=(8, 5))
+	if n_background:
+		ax.scatter(rng.uniform(0, 100, n_background), rng.normal(19, 1, n_background), s=1, c='lightgrey')
+	for band, color in zip('gri', ('green', 'red', 'orange')):
+		jd = np.sort(rng.uniform(0, 100, n_points // 3))
+		mag = 19 - 2 * np.exp(-((jd - 40) / 15) ** 2) + rng.normal(0, 0.05, len(jd))
+		ax.errorbar(jd, mag, yerr=rng.uniform(0.02, 0.1, len(jd)), fmt='o', ms=3, color=color, label=band)
+	ax.invert_yaxis()
+	ax.set_xlabel("Days since first detection")
+	ax.set_ylabel("Magnitude")
+	ax.set_title(f"ZTF{seed:08d}")
+	ax.legend(loc='upper right')
+	return fig
+
+
+def svg_corpus(n: int = 20, **kwargs) -> list[bytes]:
+	""" :returns: svgs of n light curves with 50 to 500 datapoints """
+	ret = []
+	for i in range(n):
+		fig = lightcurve_fig(n_points=50 + (450 * i) // max(n - 1, 1), seed=i, **kwargs)
+		buf = io.BytesIO()
+		fig.savefig(buf, format='svg')
+		plt.close(fig)
+		ret.append(buf.getvalue())
+	return ret
@@ -0,0 +1,233 @@
+import gc
+import mongomock, pytest
+from pymongo.errors import OperationFailure # type: ignore[import]
+from ampel.core.AmpelContext import AmpelContext
+from ampel.struct.UnitResult import UnitResult
+from ampel.core.adapter import AmpelPlotAdapter as module
+from ampel.core.adapter.AmpelPlotAdapter import AmpelPlotAdapter
+
+
+class DummyDB:
+	def __init__(self) -> None:
+		self.col = mongomock.MongoClient().db.plot
+	def get_collection(self, name: str):
+		return self.col
+
+
+@pytest.fixture
+def db():
+	# Known ids are cached per collection name
+	module._known_ids.clear()
+	return DummyDB()
+
+
+@pytest.fixture
+def failing_db(db, monkeypatch):
+	def insert_many(*args, **kwargs):
+		raise OperationFailure("insert failed")
+	monkeypatch.setattr(db.col, "insert_many", insert_many)
+	return db
+
+
+def get_adapter(db, **kwargs) -> AmpelPlotAdapter:
+	ctx = AmpelContext.__new__(AmpelContext)
+	ctx.db = db # type: ignore[misc]
+	return AmpelPlotAdapter(context=ctx, run_id=1, **kwargs)
+
+
+def get_result(i: int = 0) -> UnitResult:
+	return UnitResult(
+		body = {
+			'a': {'plot': {'name': f'p{i}', 'title': 't', 'tag': ['X'], 'svg': b'abc', 'detached': True}},
+			'b': {'plot': [{'name': f'q{i}', 'title': 't', 'tag': 'Y', 'svg': b'def', 'detached': True}]}
+		}
+	)
+
+
+def test_insert(db):
+	adapter = get_adapter(db)
+	ur = adapter.handle(get_result())
+	assert db.col.count_documents({}) == 2
+	assert db.col.find_one({'_id': ur.body['a']['plot']['svg']})['name'] == 'p0' # type: ignore
+	assert 'detached' not in db.col.find_one({'name': 'q0'})
+
+
+def test_insert_error_raised_by_handle(failing_db):
+	adapter = get_adapter(failing_db)
+	with pytest.raises(OperationFailure):
+		adapter.handle(get_result())
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_deferred_insert(db, background):
+	adapter = get_adapter(db, defer=True, background=background)
+	for i in range(3):
+		adapter.handle(get_result(i))
+	adapter.close()
+	assert db.col.count_documents({}) == 6
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_deferred_insert_error_raised_by_close(failing_db, background):
+	adapter = get_adapter(failing_db, defer=True, background=background)
+	adapter.handle(get_result())
+	with pytest.raises(OperationFailure):
+		adapter.close()
+
+
+def test_background_requires_defer(db):
+	with pytest.raises(ValueError):
+		get_adapter(db, background=True)
+
+
+def test_finalizer_reports_error(failing_db, monkeypatch):
+
+	reports = []
+	monkeypatch.setattr(module, "report_exception", lambda *args, **kwargs: reports.append(kwargs['exc']))
+	adapter = get_adapter(failing_db, defer=True)
+	adapter.handle(get_result())
+	del adapter
+	gc.collect()
+
+	assert len(reports) == 1
+	assert isinstance(reports[0], OperationFailure)
+	assert not module._live_adapters
+
+
+def get_dedup_result(codec: None | str = None) -> UnitResult:
+	plot = {'name': 'p', 'title': 't', 'tag': ['X'], 'svg': b'abc', 'hash': 'h1', 'detached': True}
+	if codec:
+		plot['codec'] = codec
+	return UnitResult(body={'plot': plot})
+
+
+@pytest.mark.parametrize("defer", [False, True])
+def test_dedup(db, defer):
+
+	db.col.create_index('content_hash', unique=True, sparse=True)
+	adapter = get_adapter(db, dedup=True, defer=defer)
+	bodies = [adapter.handle(get_dedup_result()).body for i in range(3)]
+	bodies.append(adapter.handle(get_dedup_result('zstd')).body)
+	adapter.close()
+
+	assert db.col.count_documents({}) == 2
+	oid = bodies[0]['plot']['svg'] # type: ignore
+	assert all(b['plot']['svg'] == oid for b in bodies[:3]) # type: ignore
+	assert bodies[3]['plot']['svg'] != oid # type: ignore
+
+	# Regular (time ordered) ObjectIds
+	assert db.col.find_one({'_id': oid})['content_hash']
+	assert max(el['_id'] for el in db.col.find()) == bodies[3]['plot']['svg'] # type: ignore
+
+	# Next run: existing plot is referenced
+	module._known_ids.clear()
+	adapter = get_adapter(db, dedup=True)
+	adapter.run_id = 2
+	body = adapter.handle(get_dedup_result()).body
+	assert body['plot']['svg'] == oid # type: ignore
+	assert db.col.find_one({'_id': oid})['run'] == [1, 2]
+	assert db.col.count_documents({}) == 2
+
+
+def test_dedup_concurrent_insert(db):
+
+	db.col.create_index('content_hash', unique=True, sparse=True)
+	adapter = get_adapter(db, dedup=True, defer=True)
+	body = adapter.handle(get_dedup_result()).body
+
+	# Identical plot inserted by another process in the meantime
+	module._known_ids.clear()
+	other = get_adapter(db, dedup=True)
+	other.handle(get_dedup_result())
+
+	adapter.close()
+	assert db.col.count_documents({}) == 2
+	assert db.col.find_one({'_id': body['plot']['svg']}) # type: ignore
+
+
+def test_cached_plot_run(db):
+
+	from ampel.plot.cache import PlotCache
+	cache = PlotCache(db.col)
+	rec = {'name': 'p', 'title': 't', 'tag': ['X'], 'svg': b'abc', 'codec': 'zstd', 'fingerprint': 'f1', 'detached': True}
+	cache.add('f1', rec) # type: ignore[arg-type]
+	get_adapter(db).handle(UnitResult(body={'plot': rec}))
+	oid = rec['svg']
+	assert db.col.find_one({'_id': oid})['run'] == [1]
+
+	# Local cache hit (next run)
+	adapter = get_adapter(db)
+	adapter.run_id = 2
+	body = adapter.handle(UnitResult(body={'plot': cache.get('f1')})).body
+	assert body['plot']['svg'] == oid # type: ignore
+	assert 'detached' not in body['plot'] # type: ignore
+
+	# DB hit
+	ref = PlotCache(db.col).get('f1')
+	assert ref['svg'] == oid and ref['codec'] == 'zstd' and ref['detached'] # type: ignore
+	adapter.run_id = 3
+	adapter.handle(UnitResult(body={'plot': ref}))
+
+	assert db.col.count_documents({}) == 1
+	assert db.col.find_one({'_id': oid})['run'] == [1, 2, 3]
+
+
+def test_dedup_background_queued(db, monkeypatch):
+
+	import threading
+	db.col.create_index('content_hash', unique=True, sparse=True)
+
+	# Writer thread is held until both unit results are handled
+	release = threading.Event()
+	insert_many = db.col.insert_many
+	def held_insert_many(*args, **kwargs):
+		release.wait(5)
+		return insert_many(*args, **kwargs)
+	monkeypatch.setattr(db.col, "insert_many", held_insert_many)
+
+	adapter = get_adapter(db, dedup=True, defer=True, background=True, batch_size=1)
+	b1 = adapter.handle(get_dedup_result()).body
+	b2 = adapter.handle(get_dedup_result()).body
+	release.set()
+	adapter.close()
+
+	# Second plot references the queued one
+	assert b1['plot']['svg'] == b2['plot']['svg'] # type: ignore
+	assert db.col.count_documents({}) == 1
+	assert db.col.find_one({})['content_hash']
+
+
+def test_background_insert_error_discards_queued_ids(failing_db):
+
+	adapter = get_adapter(failing_db, dedup=True, defer=True, background=True, batch_size=1)
+	adapter.handle(get_dedup_result())
+	with pytest.raises(OperationFailure):
+		adapter.close()
+	# Ids registered when the plots were queued do not exist
+	assert not module._known_ids[failing_db.col.full_name]._ids
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_close_raises_queued_error(failing_db, background):
+
+	# Two plots per unit result: the second unit result fills a batch
+	adapter = get_adapter(failing_db, defer=True, background=background, batch_size=3)
+	adapter.handle(get_result(0))
+	if background:
+		adapter.handle(get_result(1))
+		adapter._queue.join() # type: ignore[union-attr]
+		assert adapter._errors
+	else:
+		with pytest.raises(OperationFailure):
+			adapter.handle(get_result(1))
+	adapter.handle(get_result(2))
+	assert adapter._buffer
+
+	with pytest.raises(OperationFailure):
+		adapter.close()
+
+	# Nothing left to insert or to raise
+	assert not adapter._buffer and not adapter._buffer_runs and not adapter._errors
+	if adapter._queue is not None:
+		assert adapter._queue.unfinished_tasks == 0
+	adapter.close()
@@ -0,0 +1,47 @@
+import pytest
+from ampel.plot.codec import SVGCodec, register_codec, get_codec, decompress_svg, _codecs
+
+svg = ('<svg xmlns="http://www.w3.org/2000/svg">' + '<path d="M 0 0 L 1 1"/>' * 100 + '</svg>').encode()
+
+
+@pytest.mark.parametrize("name", list(_codecs))
+def test_round_trip(name):
+	codec = get_codec(name)
+	try:
+		payload = codec.compress(svg, "svg")
+	except ImportError:
+		pytest.skip(f"Package required by codec {name} not installed")
+	assert payload.startswith(codec.magic)
+	assert decompress_svg(payload, name) == svg.decode()
+	# Codec guessed from magic bytes
+	assert decompress_svg(memoryview(payload)) == svg.decode()
+
+
+def test_incomplete_codec():
+
+	class NoDecompress(SVGCodec):
+		name = "X"
+		magic = b"X"
+		def compressor(self, file_name, compression_level=9, dict_id=None):
+			raise ValueError()
+
+	with pytest.raises(TypeError):
+		register_codec(NoDecompress()) # type: ignore[abstract]
+
+	class NoMagic(NoDecompress):
+		magic = b""
+		def decompress(self, payload, dict_id=None):
+			return b""
+
+	with pytest.raises(ValueError):
+		register_codec(NoMagic())
+	assert "X" not in _codecs
+
+
+def test_benchmark():
+	pytest.importorskip("matplotlib")
+	from benchmark_codec import run
+	from figures import svg_corpus
+	res = run(svg_corpus(2), repeat=1)
+	assert {'ZIP_DEFLATED', 'ZIP_BZIP2'} <= set(res)
+	assert all(r['ratio'] > 1 for r in res.values())
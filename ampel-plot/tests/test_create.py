@@ -0,0 +1,24 @@
+from functools import partial
+import pytest
+
+pytest.importorskip("matplotlib")
+from figures import lightcurve_fig # noqa: E402
+from ampel.model.PlotProperties import PlotProperties # noqa: E402
+from ampel.plot.create import create_plot_records # noqa: E402
+
+
+def test_create_plot_records_pool():
+	props = PlotProperties(file_name={'format_str': 'lc_%s.svg', 'arg_keys': ['stock']}, tags=['LC']) # type: ignore[arg-type]
+	figs = [partial(lightcurve_fig, n_points=30, seed=i) for i in range(4)]
+	extras = [{'stock': i} for i in range(4)]
+	serial = create_plot_records(figs, props, extras, processes=0) # type: ignore[arg-type]
+	pool = create_plot_records(figs, props, extras, processes=2) # type: ignore[arg-type]
+	assert [r['name'] for r in pool] == ["lc_0.svg", "lc_1.svg", "lc_2.svg", "lc_3.svg"]
+	assert [r['hash'] for r in pool] == [r['hash'] for r in serial]
+	assert len({r['hash'] for r in pool}) == 4
+
+
+def test_benchmark():
+	from benchmark_create import run
+	res = run(n=2, processes=2)
+	assert res['serial'] > 0 and res['pool'] > 0
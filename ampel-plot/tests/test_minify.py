@@ -0,0 +1,61 @@
+import io
+import pytest
+from ampel.plot.minify import minify_svg
+
+pyvips = pytest.importorskip("pyvips")
+np = pytest.importorskip("numpy")
+mpl = pytest.importorskip("matplotlib")
+mpl.use("svg")
+import matplotlib.pyplot as plt # noqa: E402
+
+
+def _fig_lines():
+	fig, ax = plt.subplots(figsize=(5, 4))
+	x = np.linspace(0, 10, 500)
+	ax.plot(x, np.sin(x), "-", lw=0.8)
+	ax.plot(x[::25], np.cos(x[::25]), "o", ms=4)
+	ax.errorbar(x[::50], np.sin(x[::50]), yerr=0.2, fmt="s")
+	ax.set_title("Light curve ZTF21aaaaaaa")
+	ax.set_xlabel("MJD")
+	ax.set_ylim(-0.5, 0.5) # clipped lines
+	return fig
+
+
+def _fig_rasterized():
+	fig, axs = plt.subplots(1, 2, figsize=(6, 3))
+	rng = np.random.default_rng(1)
+	axs[0].imshow(rng.random((20, 20)))
+	axs[1].scatter(rng.random(2000), rng.random(2000), s=2, rasterized=True)
+	axs[1].text(0.5, 0.5, "rasterized $\\alpha$", ha="center")
+	fig.suptitle("stamps")
+	return fig
+
+
+@pytest.mark.parametrize("make_fig", [_fig_lines, _fig_rasterized])
+def test_minify_svg_rendering(make_fig):
+
+	fig = make_fig()
+	buf = io.StringIO()
+	fig.savefig(buf, format="svg")
+	plt.close(fig)
+
+	svg = buf.getvalue()
+	mini = minify_svg(svg)
+	assert len(mini) < len(svg)
+
+	a = _render(svg)
+	b = _render(mini)
+	assert a.shape == b.shape
+
+	diff = np.abs(a.astype(np.int16) - b.astype(np.int16))
+	# anti-aliasing of edges shifted by at most 1/7200 inch (precision 2)
+	assert diff.mean() < 0.1
+	assert (diff.max(axis=2) > 32).mean() < 0.001
+
+
+def _render(svg: str):
+	im = pyvips.Image.svgload_buffer(svg.encode("utf8"), dpi=96)
+	return np.ndarray(
+		buffer=im.write_to_memory(), dtype=np.uint8,
+		shape=(im.height, im.width, im.bands)
+	)
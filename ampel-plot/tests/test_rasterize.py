@@ -0,0 +1,22 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("matplotlib")
+from figures import lightcurve_fig # noqa: E402
+from ampel.plot.create import rasterize_dense_artists # noqa: E402
+
+
+def test_rasterize_dense_artists():
+	fig = lightcurve_fig(n_points=30, n_background=2000)
+	ax = fig.axes[0]
+	line, = ax.plot(np.arange(1500), np.zeros(1500))
+	assert rasterize_dense_artists(fig, 1000) == 2
+	assert line.get_rasterized() and ax.collections[0].get_rasterized()
+	assert not any(c.get_rasterized() for c in ax.collections[1:])
+	assert rasterize_dense_artists(fig, 1000) == 0
+
+
+def test_benchmark():
+	from benchmark_rasterize import run
+	res = run((5000,))[5000]
+	assert res['rasterized']['svg'] < res['vector']['svg'] / 2
@@ -0,0 +1,17 @@
+import pytest
+
+pytest.importorskip("matplotlib")
+from benchmark_stream import buffered, streamed, run # noqa: E402
+from figures import lightcurve_fig # noqa: E402
+from ampel.plot.codec import decompress_svg # noqa: E402
+
+
+def test_streamed_payload():
+	fig = lightcurve_fig(n_points=30)
+	assert decompress_svg(streamed(fig), "ZIP_DEFLATED").endswith("</svg>\n")
+	assert decompress_svg(buffered(fig), "ZIP_DEFLATED").endswith("</svg>\n")
+
+
+def test_benchmark():
+	res = run((5000,))[5000]
+	assert res['streamed'] < res['buffered']